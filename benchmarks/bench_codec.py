@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the JSON decoding of large responses.
+
+Compares the previous double ``response.json()`` decoding with the lazy,
+decode-once ``RESTResponse`` for each installed codec.
+
+Usage: python -m benchmarks.bench_codec [entities]
+"""
+
+import json
+import sys
+import timeit
+
+from usergrid import codecs
+from usergrid.rest import RESTResponse
+
+from tests.mock import MockUsergridResponse
+
+
+class FakeResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {}
+        self.status_code = 200
+        self.encoding = 'utf-8'
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def build_payload(count):
+    user = json.loads(MockUsergridResponse.VALID_USER_AUTHENTICATION)['user']
+    entities = [dict(user, uuid='%08d-b1d5-11e3-9854-5172c2613646' % i) for i in xrange(count)]
+    return json.dumps({'entities': entities, 'count': count})
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print '%-24s %8.2f ms' % (label, seconds * 1000)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 5000
+    payload = build_payload(count)
+    raw = FakeResponse(payload)
+    number = 10
+
+    print '%d entities, %d bytes' % (count, len(payload))
+    bench('double json()', lambda: (raw.json(), raw.json()), number)
+    bench('status only', lambda: RESTResponse(raw).status, number)
+
+    default = codecs.get_codec()
+    for name in ('json', 'simplejson', 'ujson'):
+        try:
+            codecs.set_codec(name)
+        except ImportError:
+            continue
+        bench('lazy data (%s)' % name, lambda: RESTResponse(raw).data, number)
+    codecs.set_codec(default)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the cold import time.
+
+Times, in fresh interpreters, the import of the package, of the clients and
+of ``requests`` (imported by the first request).
+
+Usage: python -m benchmarks.bench_import [runs]
+"""
+
+import subprocess
+import sys
+
+
+def cold_import(statement, runs):
+    code = 'import time; start = time.time(); %s; print time.time() - start' % statement
+    times = [float(subprocess.check_output([sys.executable, '-c', code])) for i in xrange(runs)]
+    return sorted(times)[len(times) // 2]
+
+
+def bench(label, statement, runs):
+    print '%-24s %8.2f ms' % (label, cold_import(statement, runs) * 1000)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    runs = int(argv[0]) if argv else 15
+
+    bench('import usergrid', 'import usergrid', runs)
+    bench('import usergrid.clients', 'import usergrid.clients', runs)
+    bench('first request', 'import usergrid.rest; usergrid.rest.requests.Session', runs)
+
+
+if __name__ == '__main__':
+    main()
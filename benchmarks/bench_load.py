@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""Load benchmark against a local Usergrid stand-in server.
+
+Reports the throughput and the p50/p95/p99 latencies of the blocking client,
+the pooled client, the asynchronous (gevent) client and the bulk writer. The
+asynchronous run happens in a child process, since it needs a monkey-patched
+socket module.
+
+Usage: python -m benchmarks.bench_load [--requests N] [--concurrency N]
+                                       [--latency SECONDS] [--json FILE]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from usergrid.bulk import BulkWriter
+from usergrid.clients import ApplicationClient
+from usergrid.rest import PooledRESTClient, PooledRESTClientImpl, RESTClient
+from usergrid.sessions import UsergridSession
+from usergrid.testing import UsergridStandIn
+from usergrid.utils import parallel_map
+
+
+def percentile(values, q):
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def report(label, latencies, seconds, errors=0, items=None):
+    latencies = sorted(latencies)
+    items = len(latencies) if items is None else items
+    return {
+        'label': label,
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': seconds,
+        'throughput': items / seconds,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def run(label, func, requests, concurrency):
+    """Call ``func`` ``requests`` times from ``concurrency`` threads.
+    Returns the report of the run.
+    """
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def timed(i):
+        start = time.time()
+        try:
+            func(i)
+        except Exception:
+            with lock:
+                errors[0] += 1
+        with lock:
+            latencies.append(time.time() - start)
+
+    start = time.time()
+    parallel_map(timed, xrange(requests), concurrency)
+    return report(label, latencies, time.time() - start, errors[0])
+
+
+def build_client(api_url, rest_client=RESTClient, session_class=UsergridSession,
+                 client_class=ApplicationClient):
+    session = session_class('org_bench', api_url=api_url, client_id='id', client_secret='secret')
+    session.authenticate()
+    return client_class(session, rest_client=rest_client)
+
+
+def bench_async(api_url, requests, concurrency):
+    from gevent import monkey; monkey.patch_all()
+    from usergrid.asynchronous import AsyncApplicationClient, AsyncRESTClient, AsyncUsergridSession
+
+    client = build_client(api_url, AsyncRESTClient, AsyncUsergridSession, AsyncApplicationClient)
+    latencies = []
+
+    def timed():
+        start = time.time()
+        client.get('/users').get()
+        latencies.append(time.time() - start)
+
+    start = time.time()
+    results = client.gather([timed] * requests, concurrency=concurrency, raise_error=False)
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    return report('async', latencies, time.time() - start, errors)
+
+
+def bench_bulk(api_url, requests, concurrency):
+    impl = PooledRESTClientImpl(pool_maxsize=concurrency)
+    client = build_client(api_url, RESTClient.using(impl))
+    latencies = []
+
+    class TimedClient(object):
+        def __getattr__(self, name):
+            return getattr(client, name)
+
+        def post_json(self, *args, **kwargs):
+            start = time.time()
+            try:
+                return client.post_json(*args, **kwargs)
+            finally:
+                latencies.append(time.time() - start)
+
+    count = requests * 10
+    start = time.time()
+    with BulkWriter(TimedClient(), 'bulk', chunk_size=100, concurrency=concurrency) as writer:
+        writer.extend({'index': i} for i in xrange(count))
+    impl.close()
+    result = report('bulk (entities)', latencies, time.time() - start, items=count)
+    result['errors'] = len(writer.result.failed)
+    return result
+
+
+def bench_child(api_url, requests, concurrency):
+    """Run the asynchronous benchmark in a child process."""
+
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_load', '--child',
+                                      api_url, '--requests', str(requests),
+                                      '--concurrency', str(concurrency)])
+    return json.loads(output)
+
+
+def print_result(result):
+    print '%-16s %6d req %4d err %10.1f /s   p50 %7.2f ms   p95 %7.2f ms   p99 %7.2f ms' % (
+        result['label'], result['requests'], result['errors'], result['throughput'],
+        result['p50'] * 1000, result['p95'] * 1000, result['p99'] * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark of the usergrid clients.')
+    parser.add_argument('--requests', type=int, default=500, help='requests per client')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    parser.add_argument('--latency', type=float, default=0.002, help='server latency in seconds')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON to FILE')
+    parser.add_argument('--child', metavar='API_URL', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print json.dumps(bench_async(args.child, args.requests, args.concurrency))
+        return
+
+    with UsergridStandIn(latency=args.latency) as server:
+        server.create('users', {'name': 'bench'})
+        api_url = server.api_url
+
+        sync_client = build_client(api_url)
+        pooled_client = build_client(api_url, PooledRESTClient)
+
+        results = [
+            run('sync', lambda i: sync_client.get('/users'), args.requests, args.concurrency),
+            run('pooled', lambda i: pooled_client.get('/users'), args.requests, args.concurrency),
+        ]
+
+        try:
+            results.append(bench_child(api_url, args.requests, args.concurrency))
+        except subprocess.CalledProcessError:
+            print >> sys.stderr, 'async benchmark failed (is gevent installed?)'
+
+        results.append(bench_bulk(api_url, args.requests, args.concurrency))
+
+    print '%d requests, concurrency %d, server latency %.1f ms' % (
+        args.requests, args.concurrency, args.latency * 1000)
+    for result in results:
+        print_result(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'requests': args.requests,
+                       'concurrency': args.concurrency,
+                       'latency': args.latency,
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the instrumentation overhead.
+
+Times ``BaseSession.build_url`` without listener, with an empty listener and
+with a :class:`usergrid.metrics.MetricsCollector`.
+
+Usage: python -m benchmarks.bench_metrics
+"""
+
+import timeit
+
+from usergrid import metrics
+from usergrid.sessions import BaseSession
+
+
+def bench(label, func, number=100000):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print '%-24s %8.2f us' % (label, seconds * 1e6)
+
+
+def main():
+    sess = BaseSession('org_test')
+    build = lambda: sess.build_url('/users', {'limit': 10})
+
+    bench('no listener', build)
+
+    noop = lambda event: None
+    metrics.hooks.add_listener(noop)
+    bench('empty listener', build)
+    metrics.hooks.remove_listener(noop)
+
+    collector = metrics.MetricsCollector()
+    metrics.hooks.add_listener(collector)
+    bench('metrics collector', build)
+    metrics.hooks.remove_listener(collector)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of the request preparation.
+
+Times ``BaseClient.request`` with the token in the query and in an
+``Authorization`` header, against the previous preparation (dict merging and
+a regex over the whole url on every call).
+
+Usage: python -m benchmarks.bench_request
+"""
+
+import re
+import timeit
+import urllib
+
+from usergrid.clients import ApplicationClient
+from usergrid.sessions import UsergridSession
+
+
+def legacy_request(session, target, params):
+    headers, access_params = session.build_access_headers()
+    params = dict(params.items() + access_params.items())
+    url = "%s/%s/%s/%s?%s" % (session.api_url, session.org_name, session.app_name, target,
+                              urllib.urlencode(params))
+    return 'https://%s' % re.sub(r'/+', '/', url), headers, params
+
+
+def bench(label, func, number=100000):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print '%-24s %8.2f us' % (label, seconds * 1e6)
+
+
+def main():
+    query = ApplicationClient(UsergridSession('org_test', token='test_token'))
+    header = ApplicationClient(UsergridSession('org_test', token='test_token',
+                                               token_placement='header'))
+
+    bench('legacy', lambda: legacy_request(query.session, '/users', {'limit': 10}))
+    bench('query token', lambda: query.request('/users', {'limit': 10}, method='GET'))
+    bench('header token', lambda: header.request('/users', {'limit': 10}, method='GET'))
+    bench('header token, no params', lambda: header.request('/users/me', method='GET'))
+
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,12 @@ setup(
     package_dir={'usergrid': 'usergrid'},
     include_package_data=True,
     install_requires=requires,
+    extras_require={
+        'async': ['gevent']
+    },
+    entry_points={
+        'console_scripts': ['usergrid-export = usergrid.export:main']
+    },
     license='Apache 2.0',
     zip_safe=False,
     classifiers=(
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.asynchronous"""
+
+import json
+import unittest
+
+import httpretty
+
+try:
+    import gevent
+    from usergrid.asynchronous import (
+        gather,
+        AsyncUsergridSession,
+        AsyncApplicationClient
+    )
+except ImportError:
+    gevent = None
+
+from usergrid.exceptions import RESTError
+
+from .mock import MockUsergridResponse
+
+@unittest.skipIf(gevent is None, 'gevent is not installed')
+class AsyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sess = AsyncUsergridSession('org_test',
+                                         auth_level='user',
+                                         username='test',
+                                         password='test')
+        self.client = AsyncApplicationClient(self.sess)
+
+    def test_gather(self):
+        running = []
+        peak = []
+
+        def call(i):
+            running.append(i)
+            peak.append(len(running))
+            gevent.sleep(0.001)
+            running.remove(i)
+            return i * 2
+
+        results = gather([lambda i=i: call(i) for i in range(10)], concurrency=3)
+        self.assertEquals(results, [i * 2 for i in range(10)])
+        self.assertEquals(max(peak), 3)
+
+    def test_gather_errors(self):
+        def fail():
+            raise ValueError()
+
+        results = gather([lambda: 1, fail], raise_error=False)
+        self.assertEquals(results[0], 1)
+        self.assertIsInstance(results[1], ValueError)
+
+    @httpretty.activate
+    def test_single_authentication(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.VALID_USER_AUTHENTICATION,
+        )
+        first = self.sess.authenticate()
+        second = self.sess.authenticate()
+        self.assertIs(first, second)
+        gevent.joinall([first, second], raise_error=True)
+        self.assertTrue(self.sess.is_linked())
+
+    @httpretty.activate
+    def test_get_entities(self):
+        self.sess.set_token('test_token')
+        for name in ('a', 'b', 'c'):
+            httpretty.register_uri(
+                httpretty.GET,
+                'https://api.usergrid.com/org_test/sandbox/users/%s' % name,
+                body=json.dumps({'entities': [{'name': name}]}),
+            )
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users/missing',
+            body=json.dumps({'error': 'not_found', 'error_description': 'missing'}),
+            status=404
+        )
+
+        results = self.client.get_entities('users', ['c', 'missing', 'a', 'b'],
+                                           concurrency=2, raise_error=False)
+        self.assertEquals(results[0].data['entities'][0]['name'], 'c')
+        self.assertIsInstance(results[1], RESTError)
+        self.assertEquals(results[2].data['entities'][0]['name'], 'a')
+        self.assertEquals(results[3].data['entities'][0]['name'], 'b')
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.bulk"""
+
+import json
+import threading
+import unittest
+
+import httpretty
+
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+from usergrid.bulk import BulkWriter
+from usergrid.exceptions import RESTError
+
+class FakeResponse(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeClient(object):
+    """A thread-safe client recording the JSON POSTs."""
+
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def post_json(self, target, entities):
+        with self.lock:
+            self.requests.append((target, entities))
+        if any(e.get('unserializable') for e in entities):
+            raise TypeError('not JSON serializable')
+        if any(e.get('fail') for e in entities):
+            raise RESTError({'error': 'bad_request', 'error_description': 'invalid entity'})
+        return FakeResponse({'entities': [dict(e, uuid='uuid-%s' % e['name']) for e in entities]})
+
+
+class BulkWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+
+    def test_chunks(self):
+        writer = BulkWriter(self.client, 'users', chunk_size=2)
+        self.assertEquals(writer.chunks(range(5)), [[0, 1], [2, 3], [4]])
+        with self.assertRaises(ValueError):
+            BulkWriter(self.client, 'users', chunk_size=0)
+
+    def test_flush(self):
+        writer = BulkWriter(self.client, 'users', chunk_size=3, concurrency=3)
+        writer.extend({'name': str(i)} for i in range(7))
+        result = writer.flush()
+
+        self.assertTrue(result.ok)
+        self.assertEquals(len(result), 7)
+        self.assertEquals(sorted(len(e) for _, e in self.client.requests), [1, 3, 3])
+        for entity, created in result.succeeded:
+            self.assertEquals(created['uuid'], 'uuid-%s' % entity['name'])
+
+    def test_auto_flush(self):
+        with BulkWriter(self.client, 'users', chunk_size=2, concurrency=2) as writer:
+            writer.extend({'name': str(i)} for i in range(5))
+            self.assertEquals(len(writer.result), 4)
+        self.assertEquals(len(writer.result), 5)
+
+    def test_failures(self):
+        writer = BulkWriter(self.client, 'users', chunk_size=2)
+        writer.extend([{'name': 'a'}, {'name': 'b'}, {'name': 'c', 'fail': True}])
+        result = writer.flush()
+
+        self.assertFalse(result.ok)
+        self.assertEquals([e['name'] for e, _ in result.succeeded], ['a', 'b'])
+        self.assertEquals([e['name'] for e, _ in result.failed], ['c'])
+        self.assertIsInstance(result.failed[0][1], RESTError)
+
+    def test_unexpected_error(self):
+        writer = BulkWriter(self.client, 'users', chunk_size=2)
+        writer.extend([{'name': 'a'}, {'name': 'b', 'unserializable': True}, {'name': 'c'}])
+        result = writer.flush()
+
+        self.assertEquals([e['name'] for e, _ in result.succeeded], ['c'])
+        self.assertEquals([e['name'] for e, _ in result.failed], ['a', 'b'])
+        self.assertIsInstance(result.failed[0][1], TypeError)
+        self.assertEquals(len(writer.result), 3)
+
+    @httpretty.activate
+    def test_application_client(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'entities': [{'name': 'a', 'uuid': '1'}, {'name': 'b', 'uuid': '2'}]}),
+        )
+        client = ApplicationClient(UsergridSession('org_test', token='test_token'))
+        writer = client.bulk_writer('users', concurrency=1)
+        writer.extend([{'name': 'a'}, {'name': 'b'}])
+        result = writer.flush()
+
+        self.assertTrue(result.ok)
+        request = httpretty.last_request()
+        self.assertEquals(request.headers['Content-Type'], 'application/json')
+        self.assertEquals(request.querystring, {'token': ['test_token']})
+        self.assertEquals(json.loads(request.body), [{'name': 'a'}, {'name': 'b'}])
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.cache"""
+
+import json
+import unittest
+
+import httpretty
+
+from usergrid.cache import cache_key, ResponseCache
+from usergrid.rest import RESTClient, RESTClientImpl
+
+USERS_URL = 'https://api.usergrid.com/org_test/sandbox/users'
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(ttl=60)
+        self.rest = RESTClient.using(RESTClientImpl(cache=self.cache))
+        self.calls = []
+        httpretty.enable()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def register(self, url, data, method=httpretty.GET, headers=None):
+        def callback(request, uri, response_headers):
+            self.calls.append((request.method, uri, request.headers))
+            if headers:
+                if request.headers.get('If-None-Match') == headers.get('etag'):
+                    return (304, response_headers, '')
+                response_headers.update(headers)
+            return (200, response_headers, json.dumps(data))
+
+        httpretty.register_uri(method, url, body=callback)
+
+    def test_key(self):
+        self.assertEquals(cache_key(USERS_URL + '/bob?token=abc&limit=10'),
+                          (USERS_URL + '/bob', 'limit=10'))
+        self.assertEquals(cache_key(USERS_URL + '/?token=abc'), (USERS_URL, ''))
+
+    def test_hit(self):
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob'}]})
+        first = self.rest.get(USERS_URL + '/bob?token=a')
+        second = self.rest.get(USERS_URL + '/bob?token=b')
+        self.assertEquals(first.data, second.data)
+        self.assertEquals(len(self.calls), 1)
+        self.assertEquals(self.cache.stats()['hits'], 1)
+        self.assertEquals(self.cache.stats()['misses'], 1)
+
+    def test_hit_copies(self):
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob'}]})
+        first = self.rest.get(USERS_URL + '/bob')
+        first.data['entities'][0]['name'] = 'alice'
+        second = self.rest.get(USERS_URL + '/bob')
+        self.assertIsNot(first, second)
+        self.assertEquals(second.data, {'entities': [{'name': 'bob'}]})
+        self.assertEquals(len(self.calls), 1)
+
+    def test_revalidation(self):
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob'}]},
+                      headers={'etag': '"v1"'})
+        first = self.rest.get(USERS_URL + '/bob')
+        self.cache.get(cache_key(USERS_URL + '/bob')).expires_at = 0
+        second = self.rest.get(USERS_URL + '/bob')
+        self.assertEquals(first.data, second.data)
+        self.assertEquals(len(self.calls), 2)
+        self.assertEquals(self.calls[1][2]['If-None-Match'], '"v1"')
+        self.assertEquals(self.cache.revalidations, 1)
+
+    def test_expired_without_validators(self):
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob'}]})
+        first = self.rest.get(USERS_URL + '/bob')
+        self.cache.get(cache_key(USERS_URL + '/bob')).expires_at = 0
+        second = self.rest.get(USERS_URL + '/bob')
+        self.assertIsNot(first, second)
+        self.assertEquals(self.cache.misses, 2)
+
+    def test_invalidation(self):
+        self.register(USERS_URL, {'entities': [{'name': 'bob'}]})
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob'}]})
+        self.register(USERS_URL + '/uuid-bob', {'entities': [{'name': 'bob'}]})
+        self.register(USERS_URL + '/bob', {'entities': [{'name': 'bob', 'uuid': 'uuid-bob'}]},
+                      method=httpretty.PUT)
+        for url in (USERS_URL, USERS_URL + '/bob', USERS_URL + '/uuid-bob'):
+            self.rest.get(url)
+        self.assertEquals(len(self.cache), 3)
+        self.rest.IMPL.request('PUT', USERS_URL + '/bob?token=a', data='{}')
+        self.assertEquals(len(self.cache), 0)
+
+    def test_post_invalidates_collection(self):
+        self.register(USERS_URL, {'entities': []})
+        self.register(USERS_URL, {'entities': [{'name': 'joe', 'uuid': 'uuid-joe'}]},
+                      method=httpretty.POST)
+        self.register(USERS_URL + '/alice', {'entities': [{'name': 'alice'}]})
+        self.rest.get(USERS_URL + '?limit=10')
+        self.rest.get(USERS_URL + '/alice')
+        self.rest.post(USERS_URL, data={'name': 'joe'})
+        self.assertEquals(len(self.cache), 0)
+
+    def test_lru_eviction(self):
+        self.cache.max_entries = 2
+        for name in ('a', 'b', 'c'):
+            self.register(USERS_URL + '/' + name, {'entities': [{'name': name}]})
+        self.rest.get(USERS_URL + '/a')
+        self.rest.get(USERS_URL + '/b')
+        self.rest.get(USERS_URL + '/a')
+        self.rest.get(USERS_URL + '/c')
+        self.assertIsNotNone(self.cache.get(cache_key(USERS_URL + '/a')))
+        self.assertIsNone(self.cache.get(cache_key(USERS_URL + '/b')))
+        self.assertEquals(self.cache.evictions, 1)
+
+    def test_max_bytes(self):
+        self.register(USERS_URL + '/a', {'entities': [{'name': 'a' * 100}]})
+        self.register(USERS_URL + '/b', {'entities': [{'name': 'b' * 100}]})
+        self.cache.max_bytes = 150
+        self.rest.get(USERS_URL + '/a')
+        self.rest.get(USERS_URL + '/b')
+        self.assertEquals(len(self.cache), 1)
+        self.assertLessEqual(self.cache.size, 150)
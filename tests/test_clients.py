@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.clients"""
+
+import json
+import re
+import unittest
+import uuid
+
+import httpretty
+
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+from usergrid.exceptions import ConflictError
+from usergrid.testing import UsergridStandIn
+
+USERS_URL = 'https://api.usergrid.com/org_test/sandbox/users'
+
+class GetManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ApplicationClient(UsergridSession('org_test', token='test_token'))
+        self.uuids = [str(uuid.uuid1()) for i in range(60)]
+        self.existing = set(self.uuids[::3])
+        self.queries = []
+
+        def callback(request, uri, headers):
+            self.queries.append(uri)
+            ql = request.querystring['ql'][0]
+            wanted = re.findall(r'uuid = ([0-9a-f-]+)', ql)
+            self.assertEquals(int(request.querystring['limit'][0]), len(wanted))
+            entities = [{'uuid': u, 'type': 'user'} for u in wanted if u in self.existing]
+            return (200, headers, json.dumps({'entities': entities}))
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, USERS_URL, body=callback)
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_batches(self):
+        batches = self.client.uuid_batches('users', self.uuids, 600)
+        self.assertEquals(sum(batches, []), self.uuids)
+        self.assertGreater(len(batches), 1)
+        for batch in batches:
+            url, headers, params = self.client.request('/users', self.client._uuid_query(batch),
+                                                       method='GET')
+            self.assertLessEqual(len(url), 600)
+        # the batches are as large as possible
+        self.assertGreater(len(batches[0]), 5)
+
+    def test_get_many(self):
+        wanted = list(reversed(self.uuids))
+        result = self.client.get_many('users', wanted, concurrency=1, max_url_length=800)
+        self.assertEquals(len(result), len(wanted))
+        for value, entity in zip(wanted, result):
+            if value in self.existing:
+                self.assertEquals(entity['uuid'], value)
+            else:
+                self.assertIsNone(entity)
+        self.assertEquals(result.missing, [u for u in wanted if u not in self.existing])
+        self.assertGreater(len(self.queries), 1)
+        self.assertLess(len(self.queries), 20)
+
+    def test_get_many_normalizes(self):
+        value = iter(self.existing).next()
+        result = self.client.get_many('users', [value.upper(), value])
+        self.assertEquals([e['uuid'] for e in result], [value, value])
+        self.assertEquals(len(self.queries), 1)
+
+    def test_invalid_uuid(self):
+        with self.assertRaises(ValueError):
+            self.client.get_many('users', ["x' or 1=1"])
+
+
+class SaveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.server = UsergridStandIn().start()
+        self.client = ApplicationClient(UsergridSession('org_test', api_url=self.server.api_url,
+                                                        client_id='id', client_secret='secret'))
+        for i in range(6):
+            self.server.create('users', {'name': 'user%d' % i, 'bio': 'x' * 1000, 'age': i})
+        self.users = self.client.get('/users').to_entities()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_save(self):
+        bob = self.users[0]
+        bob['age'] = 40
+        del bob['bio']
+        self.assertIs(self.client.save('users', bob), bob)
+        self.assertFalse(bob.is_dirty())
+
+        stored = self.server.find('users', bob.uuid)
+        self.assertEquals(stored['age'], 40)
+        self.assertNotIn('bio', stored)
+        self.assertEquals(bob.modified, stored['modified'])
+
+        requests = self.server.requests
+        self.client.save('users', bob)
+        self.assertEquals(self.server.requests, requests)
+
+    def test_conflict(self):
+        bob = self.users[0]
+        self.server.update(self.server.find('users', bob.uuid), {'age': 50})
+        bob['age'] = 40
+        with self.assertRaises(ConflictError) as context:
+            self.client.save('users', bob, check_modified=True)
+        self.assertEquals(context.exception.entities, [bob])
+        self.assertEquals(self.server.find('users', bob.uuid)['age'], 50)
+
+        bob = self.client.get('/users/%s' % bob.uuid).to_entities()[0]
+        bob['age'] = 40
+        self.client.save('users', bob, check_modified=True)
+        self.assertEquals(self.server.find('users', bob.uuid)['age'], 40)
+
+    def test_save_many(self):
+        for user in self.users[:4]:
+            user['status'] = 'active'
+        self.users[4]['age'] = 10
+        requests = self.server.requests
+
+        saved = self.client.save_many('users', self.users, concurrency=2)
+        self.assertEquals(saved, self.users[:5])
+        # one PUT on the collection for the shared changes, one for the other entity
+        self.assertEquals(self.server.requests - requests, 2)
+        for user in self.users:
+            stored = self.server.find('users', user.uuid)
+            self.assertEquals(stored.get('status'), 'active' if user in self.users[:4] else None)
+            self.assertEquals(user.modified, stored['modified'])
+            self.assertFalse(user.is_dirty())
+        self.assertEquals(self.server.find('users', self.users[4].uuid)['age'], 10)
+
+    def test_save_many_missing(self):
+        with self.server.lock:
+            self.server.collections['users'].remove(self.server.find('users', self.users[1].uuid))
+            self.server.collections['users'].remove(self.server.find('users', self.users[4].uuid))
+        for user in self.users[:4]:
+            user['status'] = 'active'
+        self.users[4]['age'] = 10
+
+        saved = self.client.save_many('users', self.users)
+        self.assertEquals(saved, [self.users[0], self.users[2], self.users[3]])
+        self.assertEquals(saved.missing, [self.users[1], self.users[4]])
+        self.assertTrue(self.users[1].is_dirty())
+        self.assertEquals(self.users[1].changes(), {'status': 'active'})
+        self.assertTrue(self.users[4].is_dirty())
+        self.assertFalse(self.users[0].is_dirty())
+
+    def test_save_many_conflict(self):
+        self.server.update(self.server.find('users', self.users[1].uuid), {'age': 50})
+        for user in self.users:
+            user['status'] = 'active'
+        with self.assertRaises(ConflictError) as context:
+            self.client.save_many('users', self.users, check_modified=True)
+        self.assertEquals(context.exception.entities, [self.users[1]])
+        self.assertNotIn('status', self.server.find('users', self.users[0].uuid))
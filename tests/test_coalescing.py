@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.coalescing"""
+
+import threading
+import time
+import unittest
+
+try:
+    import gevent
+    import gevent.event
+    from usergrid.asynchronous import AsyncRESTClientImpl
+except ImportError:
+    gevent = None
+
+from usergrid.coalescing import RequestCoalescer
+from usergrid.rest import RESTClientImpl
+
+USERS_URL = 'https://api.usergrid.com/org_test/sandbox/users'
+
+class FakeResponse(object):
+
+    status_code = 200
+    encoding = 'utf-8'
+    content = '{"entities": []}'
+
+    def __init__(self):
+        self.headers = {}
+
+
+class SlowImpl(RESTClientImpl):
+
+    def __init__(self, sleep=time.sleep, fail=False, **kwargs):
+        super(SlowImpl, self).__init__(**kwargs)
+        self.sleep = sleep
+        self.fail = fail
+        self.calls = 0
+
+    def send(self, method, url, **kwargs):
+        self.calls += 1
+        self.sleep(0.05)
+        if self.fail:
+            raise ValueError()
+        return FakeResponse()
+
+
+class RequestCoalescerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.coalescer = RequestCoalescer()
+
+    def run_threads(self, impl, urls, **kwargs):
+        results = []
+
+        def run(url):
+            try:
+                results.append(impl.request('GET', url, **kwargs))
+            except Exception, e:
+                results.append(e)
+
+        threads = [threading.Thread(target=run, args=(url,)) for url in urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_key(self):
+        key = self.coalescer.key
+        self.assertEquals(key(USERS_URL + '?token=a&limit=1'), key(USERS_URL + '?limit=1&token=a'))
+        self.assertNotEquals(key(USERS_URL + '?token=a&limit=1'), key(USERS_URL + '?limit=1&token=b'))
+        self.assertNotIn('a', key(USERS_URL + '?token=a'))
+        self.assertNotEquals(key(USERS_URL), key(USERS_URL + '?limit=1'))
+        self.assertNotEquals(key(USERS_URL), key(USERS_URL, {'Authorization': 'Bearer a'}))
+        self.assertEquals(key(USERS_URL, params={'uuid': ['a', 'b']}),
+                          key(USERS_URL, params={'uuid': ['a', 'b']}))
+        hash(key(USERS_URL, params={'uuid': ['a', 'b']}))
+
+    def test_threads(self):
+        impl = SlowImpl(coalescer=self.coalescer)
+        results = self.run_threads(impl, [USERS_URL + '?token=a'] * 10)
+        self.assertEquals(impl.calls, 1)
+        self.assertEquals(len(set(id(r.http_response) for r in results)), 1)
+        self.assertEquals([r.data for r in results], [{'entities': []}] * 10)
+        self.assertEquals(self.coalescer.stats(), {'requests': 10, 'coalesced': 9, 'in_flight': 0})
+
+    def test_responses_not_shared(self):
+        impl = SlowImpl(coalescer=self.coalescer)
+        results = self.run_threads(impl, [USERS_URL] * 5)
+        self.assertEquals(len(set(id(r) for r in results)), 5)
+        results[0].data['entities'].append({'name': 'bob'})
+        self.assertEquals([r.data for r in results[1:]], [{'entities': []}] * 4)
+
+    def test_different_principals(self):
+        impl = SlowImpl(coalescer=self.coalescer)
+        self.run_threads(impl, [USERS_URL + '?token=a', USERS_URL + '?token=b'])
+        self.assertEquals(impl.calls, 2)
+
+    def test_different_requests(self):
+        impl = SlowImpl(coalescer=self.coalescer)
+        self.run_threads(impl, [USERS_URL + '/a', USERS_URL + '/b'])
+        self.assertEquals(impl.calls, 2)
+
+    def test_errors(self):
+        impl = SlowImpl(coalescer=self.coalescer, fail=True)
+        results = self.run_threads(impl, [USERS_URL] * 5)
+        self.assertEquals(impl.calls, 1)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_sequential(self):
+        impl = SlowImpl(coalescer=self.coalescer, sleep=lambda s: None)
+        impl.request('GET', USERS_URL)
+        impl.request('GET', USERS_URL)
+        self.assertEquals(impl.calls, 2)
+
+    @unittest.skipIf(gevent is None, 'gevent is not installed')
+    def test_greenlets(self):
+        coalescer = RequestCoalescer(event_factory=gevent.event.Event)
+        impl = SlowImpl(coalescer=coalescer, sleep=gevent.sleep)
+        async_impl = AsyncRESTClientImpl(impl)
+        greenlets = [async_impl.request('GET', USERS_URL) for i in range(10)]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEquals(impl.calls, 1)
+        self.assertEquals(len(set(id(g.value.http_response) for g in greenlets)), 1)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.codecs"""
+
+import json
+import unittest
+
+from usergrid import codecs
+from usergrid.rest import RESTResponse
+
+from .mock import MockUsergridResponse
+
+class FakeResponse(object):
+    """A ``requests.Response`` counting the reads of its body."""
+
+    def __init__(self, content):
+        self._content = content
+        self.reads = 0
+        self.headers = {}
+        self.status_code = 200
+        self.encoding = 'utf-8'
+
+    @property
+    def content(self):
+        self.reads += 1
+        return self._content
+
+
+class CodecsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = codecs.get_codec()
+
+    def tearDown(self):
+        codecs.set_codec(self.codec)
+
+    def test_set_codec(self):
+        codecs.set_codec('json')
+        self.assertEquals(codecs.get_codec().name, 'json')
+        self.assertEquals(codecs.loads(codecs.dumps({'a': [1, 2]})), {'a': [1, 2]})
+
+    def test_custom_codec(self):
+        codec = codecs.JSONCodec('custom', lambda s: 'decoded', json.dumps)
+        codecs.set_codec(codec)
+        self.assertIs(codecs.get_codec(), codec)
+        self.assertEquals(codecs.loads('{}'), 'decoded')
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            codecs.set_codec('yaml')
+
+
+class RESTResponseTestCase(unittest.TestCase):
+
+    def test_lazy_decoding(self):
+        raw = FakeResponse(MockUsergridResponse.VALID_USER_AUTHENTICATION)
+        res = RESTResponse(raw)
+        self.assertEquals(res.status, 200)
+        self.assertEquals(raw.reads, 0)
+        self.assertEquals(res.data['expires_in'], 604800)
+        self.assertEquals(res.data['user']['username'], 'test')
+        self.assertEquals(raw.reads, 1)
+
+    def test_set_data(self):
+        raw = FakeResponse('{}')
+        res = RESTResponse(raw)
+        res.data = {'a': 1}
+        self.assertEquals(res.data, {'a': 1})
+        self.assertEquals(raw.reads, 0)
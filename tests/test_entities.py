@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.entities"""
+
+import json
+import pickle
+import unittest
+
+import httpretty
+
+from usergrid.entities import Entity, EntitySet, Int64Column, UUIDColumn
+from usergrid.rest import RESTClient
+
+from .mock import MockUsergridResponse
+
+USER = json.loads(MockUsergridResponse.VALID_USER_AUTHENTICATION)['user']
+
+class EntityTestCase(unittest.TestCase):
+
+    def test_fields(self):
+        entity = Entity(USER)
+        self.assertEquals(entity.uuid, USER['uuid'])
+        self.assertEquals(entity['created'], USER['created'])
+        self.assertEquals(entity['email'], USER['email'])
+        self.assertEquals(entity, USER)
+        self.assertEquals(sorted(entity.keys()), sorted(USER.keys()))
+        self.assertFalse(hasattr(entity, '__dict__'))
+
+    def test_mapping(self):
+        entity = Entity(type='user', age=3)
+        entity['name'] = 'bob'
+        self.assertEquals(entity.name, 'bob')
+        self.assertIn('age', entity)
+        self.assertNotIn('uuid', entity)
+        self.assertIsNone(entity.get('uuid'))
+        with self.assertRaises(KeyError):
+            entity['uuid']
+        del entity['age']
+        self.assertEquals(entity.to_dict(), {'type': 'user', 'name': 'bob'})
+
+    def test_none_removes(self):
+        entity = Entity(USER, nickname=None)
+        self.assertNotIn('nickname', entity)
+        entity['email'] = None
+        entity['name'] = None
+        self.assertNotIn('email', entity)
+        self.assertNotIn('name', entity)
+        self.assertEquals(entity.changes(), {'email': None, 'name': None})
+
+    def test_pickle(self):
+        entity = Entity(USER)
+        self.assertEquals(pickle.loads(pickle.dumps(entity)), entity)
+
+    def test_changes(self):
+        entity = Entity(USER)
+        self.assertFalse(entity.is_dirty())
+        self.assertEquals(entity.changes(), {})
+
+        entity['email'] = 'bob@example.com'
+        entity.name = 'bob'
+        del entity['username']
+        self.assertTrue(entity.is_dirty())
+        self.assertEquals(entity.changes(), {'email': 'bob@example.com', 'name': 'bob',
+                                             'username': None})
+
+        entity.mark_clean()
+        self.assertFalse(entity.is_dirty())
+        entity.mark_changed('activated')
+        self.assertEquals(entity.changes(), {'activated': USER['activated']})
+        self.assertFalse(pickle.loads(pickle.dumps(entity)).is_dirty())
+
+
+class EntitySetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.entities = [dict(USER, uuid='7006efaa-b1d5-11e3-9854-5172c261%04d' % i,
+                              created=USER['created'] + i, age=i)
+                         for i in range(10)]
+        self.entities[3]['nickname'] = 'bobby'
+        self.entities[5]['age'] = 'five'
+
+    def test_round_trip(self):
+        entities = EntitySet(self.entities)
+        self.assertEquals(len(entities), 10)
+        self.assertEquals(list(entities), self.entities)
+        self.assertEquals(entities[-1], self.entities[-1])
+
+    def test_columns(self):
+        entities = EntitySet(self.entities)
+        self.assertIsInstance(entities.columns['uuid'], UUIDColumn)
+        self.assertEquals(len(entities.columns['uuid'].data), 16 * 10)
+        self.assertIsInstance(entities.columns['created'], Int64Column)
+        self.assertEquals(len(entities.columns['created'].data), 8 * 10)
+        self.assertEquals(entities.column('nickname'), [None] * 3 + ['bobby'] + [None] * 6)
+        self.assertEquals(entities.column('age')[4:7], [4, 'five', 6])
+        self.assertEquals(entities.column('missing'), [None] * 10)
+        self.assertEquals(len(entities.columns['type'].strings), 2)
+
+    def test_nil_uuid(self):
+        nil = '00000000-0000-0000-0000-000000000000'
+        entities = EntitySet([{'uuid': nil}, {'name': 'bob'}, {'uuid': USER['uuid']}])
+        self.assertIsInstance(entities.columns['uuid'], UUIDColumn)
+        self.assertEquals(entities.column('uuid'), [nil, None, USER['uuid']])
+
+    def test_invalid_uuid(self):
+        entities = EntitySet([{'uuid': 'not-a-uuid'}, {'uuid': USER['uuid']}])
+        self.assertEquals(entities.column('uuid'), ['not-a-uuid', USER['uuid']])
+
+    @httpretty.activate
+    def test_from_response(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'entities': self.entities}),
+        )
+        url = 'https://api.usergrid.com/org_test/sandbox/users'
+        self.assertEquals(RESTClient.get(url).to_entities(), self.entities)
+        self.assertEquals(list(RESTClient.get(url).to_entity_set()), self.entities)
+        self.assertEquals(list(RESTClient.stream(url).to_entity_set()), self.entities)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.events"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from usergrid import events
+from usergrid.clients import ApplicationClient
+from usergrid.events import EventQueue
+from usergrid.exceptions import UsergridException
+from usergrid.sessions import UsergridSession
+
+
+class FakeClient(object):
+
+    def __init__(self, fail=False, error=UsergridException):
+        self.batches = []
+        self.fail = fail
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post_json(self, target, payload, params=None):
+        self.calls += 1
+        if self.fail:
+            raise self.error('unavailable')
+        with self.lock:
+            self.batches.append(payload)
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+class EventQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.directory = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.directory, 'events.spill')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batch_size(self):
+        with EventQueue(self.client, batch_size=10, flush_interval=60) as queue:
+            for i in range(25):
+                queue.add({'index': i})
+        self.assertEquals([len(batch) for batch in self.client.batches], [10, 10, 5])
+        self.assertEquals([e['index'] for e in self.client.events], range(25))
+        self.assertEquals(queue.stats()['sent'], 25)
+
+    def test_flush_interval(self):
+        queue = EventQueue(self.client, flush_interval=0.05)
+        queue.add({'index': 1})
+        queue.add({'index': 2})
+        time.sleep(0.3)
+        self.assertEquals(self.client.batches, [[{'index': 1}, {'index': 2}]])
+        queue.close()
+
+    def test_counters(self):
+        with EventQueue(self.client, flush_interval=60) as queue:
+            for i in range(5):
+                queue.increment('clicks')
+            queue.increment('views', 2)
+            self.assertEquals(len(queue), 2)
+        self.assertEquals(self.client.events, [{'timestamp': 0, 'counters': {'clicks': 5, 'views': 2}}])
+
+    def test_drop(self):
+        with EventQueue(self.client, flush_interval=60, max_size=5, overflow='drop') as queue:
+            results = [queue.add({'index': i}) for i in range(8)]
+            queue.increment('clicks')
+            self.assertEquals(queue.stats()['dropped'], 4)
+        self.assertEquals(results, [True] * 5 + [False] * 3)
+        self.assertEquals(len(self.client.events), 5)
+
+    def test_spill(self):
+        with EventQueue(self.client, flush_interval=60, max_size=5, overflow='spill',
+                        spill_path=self.spill_path) as queue:
+            for i in range(8):
+                queue.add({'index': i})
+            self.assertEquals(queue.stats()['spilled'], 3)
+        self.assertEquals(sorted(e['index'] for e in self.client.events), range(8))
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_block(self):
+        with EventQueue(self.client, batch_size=2, flush_interval=60, max_size=2) as queue:
+            for i in range(10):
+                queue.add({'index': i})
+        self.assertEquals([e['index'] for e in self.client.events], range(10))
+
+    def test_failure(self):
+        client = FakeClient(fail=True)
+        queue = EventQueue(client, flush_interval=60, overflow='spill', spill_path=self.spill_path)
+        queue.add({'index': 1})
+        queue.close()
+        self.assertEquals(queue.stats()['failed'], 1)
+
+        # the rejected events are sent by the next queue
+        with EventQueue(self.client, flush_interval=60, overflow='spill',
+                        spill_path=self.spill_path):
+            pass
+        self.assertEquals(self.client.events, [{'index': 1}])
+
+    def test_unexpected_error(self):
+        client = FakeClient(fail=True, error=RuntimeError)
+        queue = EventQueue(client, batch_size=1, flush_interval=60)
+        queue.add({'index': 1})
+        deadline = time.time() + 5
+        while queue.stats()['failed'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEquals(queue.stats()['failed'], 1)
+        self.assertTrue(queue._thread.is_alive())
+
+        client.fail = False
+        queue.add({'index': 2})
+        queue.close()
+        self.assertEquals(client.events, [{'index': 2}])
+
+    def test_retry_backoff(self):
+        client = FakeClient(fail=True)
+        queue = EventQueue(client, flush_interval=0.01, overflow='spill', spill_path=self.spill_path)
+        queue.add({'index': 1})
+        time.sleep(0.3)
+        # 0.01, 0.02, 0.04, 0.08 and 0.16 seconds between the attempts, instead of 0.01
+        self.assertLess(client.calls, 8)
+
+        client.fail = False
+        queue.close()
+        self.assertEquals(client.events, [{'index': 1}])
+
+    def test_not_serializable(self):
+        with EventQueue(self.client, flush_interval=60) as queue:
+            self.assertRaises(TypeError, queue.add, {'date': datetime.datetime.now()})
+            self.assertRaises(TypeError, queue.increment, 'clicks', '1')
+            self.assertEquals(len(queue), 0)
+        self.assertEquals(self.client.batches, [])
+
+    def test_closed(self):
+        queue = EventQueue(self.client)
+        self.assertIn(queue, events._open_queues)
+        queue.close()
+        queue.close()
+        self.assertTrue(queue.closed)
+        self.assertNotIn(queue, events._open_queues)
+        self.assertRaises(UsergridException, queue.add, {})
+
+    def test_client_queue(self):
+        client = ApplicationClient(UsergridSession('org_test', token='token'))
+        queue = client.event_queue(flush_interval=60)
+        self.assertIs(client.event_queue(flush_interval=60), queue)
+        self.assertIsNot(client.event_queue(flush_interval=30), queue)
+        client.event_queue(flush_interval=30).close()
+        queue.close()
+        self.assertIsNot(client.event_queue(flush_interval=60), queue)
+        client.event_queue(flush_interval=60).close()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.export"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import httpretty
+
+from usergrid.clients import ApplicationClient
+from usergrid.export import CollectionExport, export_collections, main
+from usergrid.rest import PooledRESTClientImpl, RESTClient
+from usergrid.sessions import UsergridSession
+from usergrid.testing import UsergridStandIn
+
+
+class FailingClient(object):
+    """Fail the n-th stream request."""
+
+    def __init__(self, client, fail_at):
+        self.client = client
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def stream(self, target, params=None):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise IOError('interrupted')
+        return self.client.stream(target, params)
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.directory = tempfile.mkdtemp()
+        self.server = UsergridStandIn().start()
+        for i in range(25):
+            self.server.create('users', {'index': i})
+        for i in range(7):
+            self.server.create('devices', {'index': i})
+
+        self.impl = PooledRESTClientImpl()
+        self.session = UsergridSession('org_test', api_url=self.server.api_url,
+                                       client_id='id', client_secret='secret')
+        self.client = ApplicationClient(self.session, rest_client=RESTClient.using(self.impl))
+
+    def tearDown(self):
+        self.impl.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def read(self, filename, compress=False):
+        path = os.path.join(self.directory, filename)
+        with (gzip.open(path) if compress else open(path)) as f:
+            return [json.loads(line)['index'] for line in f]
+
+    def test_export(self):
+        reports = []
+        results = export_collections(self.client, ['users', 'devices'], self.directory, limit=10,
+                                     progress=reports.append)
+        self.assertEquals([r['entities'] for r in results], [25, 7])
+        self.assertEquals(self.read('users.ndjson'), range(25))
+        self.assertEquals(self.read('devices.ndjson'), range(7))
+        self.assertTrue(all(r['done'] for r in reports if r['entities'] in (25, 7)))
+
+    def test_gzip(self):
+        export_collections(self.client, ['users'], self.directory, limit=10, compress=True)
+        self.assertEquals(self.read('users.ndjson.gz', compress=True), range(25))
+
+    def test_resume(self):
+        for compress in (False, True):
+            path = os.path.join(self.directory, 'users%d.ndjson' % compress)
+            failing = FailingClient(self.client, fail_at=3)
+            export = CollectionExport(failing, 'users', path, limit=10, compress=compress)
+            self.assertRaises(IOError, export.run)
+            self.assertEquals(export.read_checkpoint()['entities'], 20)
+
+            # some garbage written after the checkpoint is truncated
+            with open(path, 'ab') as f:
+                f.write('{"index": 99')
+
+            export = CollectionExport(self.client, 'users', path, limit=10, compress=compress)
+            stats = export.run()
+            self.assertEquals(stats['entities'], 25)
+            self.assertTrue(stats['done'])
+            self.assertEquals(self.read(os.path.basename(path), compress), range(25))
+
+            # a finished export is not done again
+            self.assertEquals(CollectionExport(self.client, 'users', path).run()['entities'], 25)
+
+    def test_main(self):
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            main(['--org', 'org_test', '--api-url', self.server.api_url, '--client-id', 'id',
+                  '--client-secret', 'secret', '-o', self.directory, '--gzip', 'devices'])
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+
+        self.assertIn('7 entities exported', output)
+        self.assertEquals(self.read('devices.ndjson.gz', compress=True), range(7))
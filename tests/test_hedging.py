@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.hedging"""
+
+import threading
+import time
+import unittest
+
+from usergrid.hedging import LatencyTracker, HedgePolicy
+from usergrid.rest import RESTClientImpl
+
+class FakeResponse(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.closed = threading.Event()
+        self.read = False
+        self._content = ''
+
+    @property
+    def content(self):
+        self.read = True
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
+    def close(self):
+        self.closed.set()
+
+
+class SlowSender(object):
+    """Answer the n-th request after ``delays[n]`` seconds. Fail it if ``n in failures``."""
+
+    def __init__(self, delays, failures=()):
+        self.delays = list(delays)
+        self.failures = failures
+        self.calls = 0
+        self.responses = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, **kwargs):
+        with self.lock:
+            n = self.calls
+            self.calls += 1
+        time.sleep(self.delays[n])
+        if n in self.failures:
+            raise ValueError()
+        res = FakeResponse(n)
+        self.responses.append(res)
+        return res
+
+
+class LatencyTrackerTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        tracker = LatencyTracker(window=100)
+        self.assertIsNone(tracker.percentile(95))
+        for i in range(200):
+            tracker.record(i)
+        self.assertEquals(len(tracker), 100)
+        self.assertEquals(tracker.percentile(0), 100)
+        self.assertEquals(tracker.percentile(50), 150)
+        self.assertEquals(tracker.percentile(100), 199)
+
+
+class HedgePolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = HedgePolicy(initial_delay=0.02, budget=1)
+
+    def test_delay(self):
+        policy = HedgePolicy(percentile=50, min_delay=0.01, max_delay=0.5, min_samples=3)
+        self.assertEquals(policy.delay(), 0.1)
+        for latency in (0.2, 0.3, 0.4):
+            policy.latencies.record(latency)
+        self.assertEquals(policy.delay(), 0.3)
+        policy.latencies.record(5)
+        policy.latencies.record(5)
+        self.assertEquals(policy.delay(), 0.4)
+
+    def test_fast_request(self):
+        sender = SlowSender([0])
+        res = self.policy.send(sender, 'GET', 'url')
+        self.assertEquals(res.name, 0)
+        self.assertTrue(res.read)
+        self.assertEquals(sender.calls, 1)
+        self.assertEquals(self.policy.stats()['hedges'], 0)
+
+    def test_stream_not_read(self):
+        res = self.policy.send(SlowSender([0]), 'GET', 'url', stream=True)
+        self.assertFalse(res.read)
+
+    def test_threads_reused(self):
+        for i in range(20):
+            self.policy.send(SlowSender([0]), 'GET', 'url')
+            time.sleep(0.005)
+        # a single worker thread sent all the requests
+        self.assertEquals(self.policy._workers._idle, 1)
+
+    def test_hedge_wins(self):
+        sender = SlowSender([0.5, 0])
+        res = self.policy.send(sender, 'GET', 'url')
+        self.assertEquals(res.name, 1)
+        self.assertTrue(res.read)
+        self.assertEquals(self.policy.hedges, 1)
+        self.assertEquals(self.policy.wins, 1)
+        # the elapsed time of the abandoned primary is recorded
+        self.assertEquals(len(self.policy.latencies), 1)
+        self.assertGreaterEqual(self.policy.latencies.percentile(100), 0.02)
+        time.sleep(0.6)
+        self.assertTrue(sender.responses[1 if sender.responses[0].name == 1 else 0].closed.wait(1))
+
+    def test_primary_wins(self):
+        sender = SlowSender([0.05, 0.5])
+        res = self.policy.send(sender, 'GET', 'url')
+        self.assertEquals(res.name, 0)
+        self.assertEquals(self.policy.hedges, 1)
+        self.assertEquals(self.policy.wins, 0)
+
+    def test_budget(self):
+        self.policy.budget = 0.5
+        for i in range(4):
+            self.policy.send(SlowSender([0.03, 0.03]), 'GET', 'url')
+        self.assertEquals(self.policy.requests, 4)
+        self.assertEquals(self.policy.hedges, 2)
+
+    def test_failed_attempt(self):
+        sender = SlowSender([0.05, 0.1], failures=[0])
+        res = self.policy.send(sender, 'GET', 'url')
+        self.assertEquals(res.name, 1)
+
+    def test_all_attempts_failed(self):
+        sender = SlowSender([0.05, 0.06], failures=[0, 1])
+        with self.assertRaises(ValueError):
+            self.policy.send(sender, 'GET', 'url')
+
+
+class RecordingImpl(RESTClientImpl):
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingImpl, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def send(self, method, url, **kwargs):
+        self.calls.append((method, kwargs))
+        res = FakeResponse(len(self.calls))
+        res.status_code = 200
+        res.headers = {}
+        res.encoding = 'utf-8'
+        res.content = '{}'
+        return res
+
+
+class HedgedRESTClientImplTestCase(unittest.TestCase):
+
+    def test_only_get(self):
+        policy = HedgePolicy()
+        impl = RecordingImpl(hedge=policy)
+        impl.request('GET', 'url')
+        impl.request('POST', 'url', data={})
+        self.assertEquals(policy.requests, 1)
+        self.assertEquals(impl.calls[0], ('GET', {'stream': True}))
+        self.assertEquals(impl.calls[1], ('POST', {'data': {}}))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the lazy imports of usergrid"""
+
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ['requests', 'gevent', 'ujson', 'simplejson', 'multiprocessing', 'sqlite3']
+
+OPTIONAL_MODULES = ['usergrid.%s' % name for name in ('asynchronous', 'bulk', 'events', 'iterators',
+                                                       'replicas', 'streaming', 'entities')]
+
+
+def imported_modules(statement, modules=HEAVY_MODULES):
+    """Run an import statement in a fresh interpreter.
+    Returns the set of the modules it imported, among ``modules``.
+    """
+
+    code = '%s; import sys; print " ".join(m for m in %r if m in sys.modules)' % (
+        statement, modules)
+    return set(subprocess.check_output([sys.executable, '-c', code]).split())
+
+
+class LazyImportTestCase(unittest.TestCase):
+
+    def test_import_package(self):
+        self.assertEquals(imported_modules('import usergrid'), set())
+
+    def test_import_clients(self):
+        statement = 'import usergrid; usergrid.sessions.UsergridSession; usergrid.clients.ApplicationClient'
+        self.assertEquals(imported_modules(statement), set())
+
+    def test_optional_modules(self):
+        self.assertEquals(imported_modules('import usergrid', OPTIONAL_MODULES), set())
+        statement = 'import usergrid; usergrid.clients.ApplicationClient.iter_collection'
+        self.assertEquals(imported_modules(statement, OPTIONAL_MODULES), set())
+
+    def test_first_use(self):
+        self.assertEquals(imported_modules('from usergrid import rest; rest.RESTClientImpl()'), set())
+        self.assertIn('requests', imported_modules('from usergrid import rest; rest.requests.Session'))
+
+    def test_submodule_attributes(self):
+        import usergrid
+        self.assertIs(usergrid.codecs, sys.modules['usergrid.codecs'])
+        self.assertRaises(AttributeError, getattr, usergrid, 'missing')
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.iterators"""
+
+import functools
+import json
+import unittest
+import urlparse
+
+import httpretty
+
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+from usergrid.exceptions import RESTError
+from usergrid.iterators import CollectionIterator
+from usergrid.testing import UsergridStandIn
+
+def register_collection(name, count, limit):
+    """Register a paged collection of ``count`` entities."""
+
+    def callback(request, uri, headers):
+        query = urlparse.parse_qs(urlparse.urlparse(uri).query)
+        start = int(query.get('cursor', ['0'])[0])
+        assert int(query['limit'][0]) == limit
+        end = min(start + limit, count)
+        data = {'entities': [{'uuid': str(i), 'name': 'e%d' % i} for i in range(start, end)]}
+        if end < count:
+            data['cursor'] = str(end)
+        return (200, headers, json.dumps(data))
+
+    httpretty.register_uri(
+        httpretty.GET,
+        'https://api.usergrid.com/org_test/sandbox/%s' % name,
+        body=callback,
+    )
+
+
+class CollectionIteratorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sess = UsergridSession('org_test', token='test_token')
+        self.client = ApplicationClient(self.sess)
+
+    @httpretty.activate
+    def test_iterate(self):
+        register_collection('users', 25, 10)
+        for prefetch in (True, False):
+            entities = list(self.client.iter_collection('users', limit=10, prefetch=prefetch))
+            self.assertEquals([e['uuid'] for e in entities], [str(i) for i in range(25)])
+
+    @httpretty.activate
+    def test_pages(self):
+        register_collection('users', 25, 10)
+        it = CollectionIterator(self.client, 'users', limit=10)
+        pages = list(it.pages())
+        self.assertEquals([len(p) for p in pages], [10, 10, 5])
+        self.assertEquals([p.cursor for p in pages], [None, '10', '20'])
+        self.assertIsNone(pages[-1].next_cursor)
+
+    @httpretty.activate
+    def test_resume(self):
+        register_collection('users', 25, 10)
+        entities = list(self.client.iter_collection('users', limit=10, cursor='20'))
+        self.assertEquals([e['uuid'] for e in entities], [str(i) for i in range(20, 25)])
+
+    @httpretty.activate
+    def test_empty(self):
+        register_collection('users', 0, 10)
+        self.assertEquals(list(self.client.iter_collection('users', limit=10)), [])
+
+
+def standin_client(api_url):
+    return ApplicationClient(UsergridSession('org_test', api_url=api_url,
+                                             client_id='id', client_secret='secret'))
+
+
+def count_partition(partition, entities):
+    return (partition.index, sum(1 for entity in entities))
+
+
+class PartitionedScanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.server = UsergridStandIn().start()
+        for i in range(100):
+            self.server.create('items', {'index': i, 'created': 1000 + i * 10})
+        self.client = standin_client(self.server.api_url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_partitions(self):
+        scan = self.client.scan('items', partitions=4)
+        self.assertEquals(scan.boundaries(), [1000, 1247, 1495, 1743, 1991])
+        partitions = scan.partitions()
+        self.assertEquals(len(partitions), 4)
+        self.assertEquals(partitions[1].ql, 'select * where created >= 1247 and created < 1495')
+
+    def test_empty(self):
+        self.assertEquals(list(self.client.scan('missing')), [])
+
+    def test_iterate(self):
+        indexes = [e['index'] for e in self.client.scan('items', partitions=7, limit=6)]
+        self.assertEquals(sorted(indexes), range(100))
+
+    def test_where(self):
+        scan = self.client.scan('items', partitions=3, where='index >= 50')
+        self.assertEquals(scan.boundaries()[0], 1500)
+        self.assertEquals(sorted(e['index'] for e in scan), range(50, 100))
+
+    def test_where_or(self):
+        scan = self.client.scan('items', partitions=3, where='index < 10 or index >= 90')
+        self.assertEquals(scan.partitions()[0].ql,
+                          'select * where created >= 1000 and created < 1330 '
+                          'and (index < 10 or index >= 90)')
+        self.assertEquals(sorted(e['index'] for e in scan), range(10) + range(90, 100))
+
+    def test_error(self):
+        scan = self.client.scan('items', partitions=4, limit=5)
+        scan.partitions()
+        self.server.error_rate = 1
+        self.assertRaises(RESTError, list, scan)
+
+    def test_run(self):
+        results = self.client.scan('items', partitions=4).run(count_partition)
+        self.assertEquals(results, [(0, 25), (1, 25), (2, 25), (3, 25)])
+
+    def test_run_processes(self):
+        scan = self.client.scan('items', partitions=4, concurrency=2)
+        results = scan.run(count_partition, processes=True,
+                           client_factory=functools.partial(standin_client, self.server.api_url))
+        self.assertEquals(results, [(0, 25), (1, 25), (2, 25), (3, 25)])
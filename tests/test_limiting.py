@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.limiting"""
+
+import threading
+import time
+import unittest
+
+from requests.exceptions import Timeout
+
+from usergrid.exceptions import LimiterTimeoutError, UsergridException
+from usergrid.limiting import AdaptiveLimiter, TokenBucket
+from usergrid.rest import RESTClientImpl
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class RecordingTokenBucket(TokenBucket):
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingTokenBucket, self).__init__(*args, **kwargs)
+        self.waits = []
+
+    def sleep(self, seconds):
+        self.waits.append(seconds)
+
+
+class AdaptiveLimiterTestCase(unittest.TestCase):
+
+    def saturate(self, limiter, status=200):
+        """Run ``limit`` concurrent requests and release them."""
+        tickets = [limiter.acquire() for i in range(int(limiter.limit))]
+        for ticket in tickets:
+            limiter.release(ticket, status=status)
+
+    def test_grows_when_saturated(self):
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=6)
+        for i in range(20):
+            self.saturate(limiter)
+        self.assertEquals(limiter.stats()['limit'], 6)
+
+    def test_does_not_grow_when_idle(self):
+        limiter = AdaptiveLimiter(initial_limit=4)
+        for i in range(50):
+            limiter.release(limiter.acquire(), status=200)
+        self.assertEquals(limiter.stats()['limit'], 4)
+
+    def test_does_not_grow_when_latency_rises(self):
+        limiter = AdaptiveLimiter(initial_limit=4, smoothing=1)
+        ticket = limiter.acquire()
+        limiter.release(ticket - 0.01, status=200)
+        for i in range(20):
+            tickets = [limiter.acquire() for j in range(4)]
+            for ticket in tickets:
+                limiter.release(ticket - 1, status=200)
+        self.assertEquals(limiter.stats()['limit'], 4)
+
+    def test_shrinks_once_per_window(self):
+        limiter = AdaptiveLimiter(initial_limit=16)
+        tickets = [limiter.acquire() for i in range(8)]
+        for ticket in tickets:
+            limiter.release(ticket, status=429)
+        self.assertEquals(limiter.stats()['limit'], 8)
+
+        limiter.release(limiter.acquire(), timeout=True)
+        self.assertEquals(limiter.stats()['limit'], 4)
+
+        for i in range(5):
+            limiter.release(limiter.acquire(), status=503)
+        self.assertEquals(limiter.stats()['limit'], 1)
+
+    def test_queue(self):
+        limiter = AdaptiveLimiter(initial_limit=1)
+        ticket = limiter.acquire()
+        acquired = threading.Event()
+
+        def waiter():
+            limiter.release(limiter.acquire())
+            acquired.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        self.assertEquals(limiter.stats()['queued'], 1)
+        self.assertFalse(acquired.is_set())
+
+        limiter.release(ticket, status=200)
+        thread.join()
+        self.assertTrue(acquired.is_set())
+        self.assertEquals(limiter.stats()['in_flight'], 0)
+        self.assertEquals(limiter.stats()['queued'], 0)
+
+    def test_timeout(self):
+        limiter = AdaptiveLimiter(initial_limit=1, timeout=0.01)
+        limiter.acquire()
+        self.assertRaises(LimiterTimeoutError, limiter.acquire)
+        self.assertEquals(limiter.stats()['queued'], 0)
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = RecordingTokenBucket(rate=10, burst=2)
+        for i in range(5):
+            bucket.release(bucket.acquire())
+        self.assertEquals(len(bucket.waits), 3)
+        # the reserved tokens push the later requests back
+        self.assertAlmostEqual(bucket.waits[0], 0.1, places=2)
+        self.assertAlmostEqual(bucket.waits[2], 0.3, places=2)
+
+    def test_timeout(self):
+        bucket = RecordingTokenBucket(rate=1, burst=1, timeout=0.5)
+        bucket.acquire()
+        self.assertRaises(LimiterTimeoutError, bucket.acquire)
+        self.assertEquals(bucket.stats()['in_flight'], 1)
+
+
+class LimitedRESTClientImplTestCase(unittest.TestCase):
+
+    def test_release(self):
+        limiter = AdaptiveLimiter(initial_limit=8)
+        impl = RESTClientImpl(limiter=limiter)
+        statuses = [429, 200]
+        impl.send = lambda method, url, **kwargs: FakeResponse(statuses.pop(0))
+
+        impl.perform('GET', 'http://localhost/')
+        self.assertEquals(limiter.stats()['limit'], 4)
+        impl.perform('GET', 'http://localhost/')
+        self.assertEquals(limiter.stats()['in_flight'], 0)
+
+    def test_timeout(self):
+        limiter = AdaptiveLimiter(initial_limit=8)
+        impl = RESTClientImpl(limiter=limiter)
+
+        def send(method, url, **kwargs):
+            raise Timeout()
+
+        impl.send = send
+        self.assertRaises(UsergridException, impl.perform, 'GET', 'http://localhost/')
+        stats = limiter.stats()
+        self.assertEquals((stats['limit'], stats['in_flight']), (4, 0))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.managers"""
+
+import threading
+import unittest
+
+import httpretty
+
+from usergrid.managers import SessionManager
+from usergrid.testing import UsergridStandIn
+
+
+class SessionManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.server = UsergridStandIn().start()
+        self.manager = SessionManager(api_url=self.server.api_url, max_sessions=2,
+                                      client_id='id', client_secret='secret')
+
+    def tearDown(self):
+        self.manager.close()
+        self.server.stop()
+
+    def test_key(self):
+        self.assertEquals(self.manager.key('org_a', 'app'),
+                          (self.server.api_url, 'org_a', 'app', 'client', 'id'))
+        self.assertEquals(self.manager.key('org_a', auth_level='user', username='bob')[2:],
+                          ('sandbox', 'user', 'bob'))
+
+    def test_client_for(self):
+        client = self.manager.client_for('org_a', 'app')
+        self.assertIs(self.manager.client_for('org_a', 'app'), client)
+        self.assertIsNot(self.manager.client_for('org_b', 'app'), client)
+        self.assertIsNot(self.manager.client_for('org_a', 'app', client_id='other'), client)
+        self.assertEquals(client.session.org_name, 'org_a')
+        self.assertEquals(client.session.app_name, 'app')
+
+    def test_shared_pool(self):
+        a = self.manager.client_for('org_a')
+        b = self.manager.client_for('org_b')
+        self.assertIs(a.rest, b.rest)
+        self.assertIs(a.session.rest_client, a.rest)
+        self.assertEquals(self.manager.stats()['hosts'], 1)
+
+    def test_eviction(self):
+        a = self.manager.client_for('org_a')
+        a.get('/users')
+        self.manager.client_for('org_b')
+        self.manager.client_for('org_a') # org_a is now the most recently used
+        self.manager.client_for('org_c')
+        self.assertEquals(self.manager.stats(), {'sessions': 2, 'hosts': 1, 'evictions': 1})
+
+        self.assertIs(self.manager.client_for('org_a'), a)
+        self.manager.client_for('org_b')
+        self.assertEquals(self.manager.stats()['evictions'], 2)
+
+    def test_token_survives_eviction(self):
+        self.manager.client_for('org_a').get('/users')
+        self.manager.client_for('org_b')
+        self.manager.client_for('org_c')
+
+        client = self.manager.client_for('org_a')
+        client.get('/users')
+        self.assertEquals(len(self.server.tokens), 1)
+
+    def test_concurrent_lookups(self):
+        clients = []
+
+        def lookup():
+            clients.append(self.manager.client_for('org_a'))
+
+        threads = [threading.Thread(target=lookup) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(set(map(id, clients))), 1)
+
+    def test_refresh_tokens(self):
+        manager = SessionManager(api_url=self.server.api_url, client_id='id', client_secret='secret',
+                                 background_refresh=False)
+        session = manager.session_for('org_a')
+        session.authenticate()
+        self.assertEquals(manager.refresh_tokens(), 0)
+
+        session.tokens.update(10)
+        self.assertEquals(manager.refresh_tokens(), 1)
+        self.assertEquals(len(self.server.tokens), 2)
+        self.assertFalse(session.tokens.needs_refresh())
+        manager.close()
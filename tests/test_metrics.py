@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.metrics"""
+
+import json
+import unittest
+
+import httpretty
+
+from usergrid import metrics
+from usergrid.metrics import Histogram, MetricsCollector
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+from usergrid.cache import ResponseCache
+from usergrid.rest import RESTClient, RESTClientImpl
+
+from .mock import MockUsergridResponse
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_observe(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        self.assertEquals(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+        self.assertEquals(histogram.cumulative(), [(0.1, 2), (1, 3), (float('inf'), 4)])
+        self.assertEquals(histogram.quantile(0.5), 0.1)
+        self.assertEquals(histogram.quantile(0.75), 1)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.collector = MetricsCollector()
+        metrics.hooks.add_listener(self.events.append)
+        metrics.hooks.add_listener(self.collector)
+        httpretty.reset()
+        httpretty.enable()
+
+    def tearDown(self):
+        metrics.hooks.remove_listener(self.events.append)
+        metrics.hooks.remove_listener(self.collector)
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_remove_listener(self):
+        metrics.hooks.remove_listener(self.events.append)
+        metrics.hooks.remove_listener(self.collector)
+        self.assertEquals(metrics.hooks.listeners, ())
+        UsergridSession('org_test').build_url('/users')
+        self.assertEquals(self.events, [])
+
+    def test_phases(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.VALID_USER_AUTHENTICATION,
+        )
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'entities': [{'name': 'bob'}]}),
+        )
+        sess = UsergridSession('org_test', auth_level='user', username='test', password='test')
+        client = ApplicationClient(sess)
+        client.get('/users').data
+
+        phases = [e.phase for e in self.events]
+        self.assertEquals(phases, ['build_url', 'http', 'decode', 'auth', 'build_url', 'http', 'decode'])
+        http = self.events[-2]
+        self.assertEquals(http.method, 'GET')
+        self.assertEquals(http.status, 200)
+        self.assertEquals(http.url, 'https://api.usergrid.com/org_test/sandbox/users')
+        self.assertGreater(http.bytes_in, 0)
+        self.assertEquals(self.events[1].bytes_out, len('grant_typepasswordusernametestpasswordtest') + 6)
+
+    def test_errors(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.INVALID_AUTHENTICATION,
+            status=400
+        )
+        sess = UsergridSession('org_test', auth_level='user', username='test', password='test')
+        with self.assertRaises(Exception):
+            sess.authenticate()
+        self.assertEquals(self.events[-1].phase, 'auth')
+        self.assertIsNotNone(self.events[-1].error)
+        self.assertEquals(self.collector.errors, {('auth', 'UsergridException'): 1})
+
+    def test_cache(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'entities': []}),
+        )
+        rest = RESTClient.using(RESTClientImpl(cache=ResponseCache()))
+        rest.get('https://api.usergrid.com/org_test/sandbox/users')
+        rest.get('https://api.usergrid.com/org_test/sandbox/users')
+        self.assertEquals([e.cache for e in self.events if e.phase == 'cache'], ['miss', 'hit'])
+        self.assertEquals(self.collector.cache, {'hit': 1, 'miss': 1})
+
+    def test_prometheus_text(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'entities': []}),
+        )
+        RESTClient.get('https://api.usergrid.com/org_test/sandbox/users').data
+        text = self.collector.prometheus_text()
+        self.assertIn('# TYPE usergrid_phase_seconds histogram', text)
+        self.assertIn('usergrid_phase_seconds_count{phase="http"} 1', text)
+        self.assertIn('usergrid_phase_seconds_bucket{le="+Inf",phase="decode"} 1', text)
+        self.assertIn('usergrid_requests_total{method="GET",status="200"} 1', text)
+        self.assertIn('usergrid_retries_total 0', text)
+        self.assertTrue(text.endswith('\n'))
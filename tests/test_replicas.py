@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.replicas"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import httpretty
+
+from usergrid.clients import ApplicationClient
+from usergrid.exceptions import UsergridException
+from usergrid.replicas import CollectionReplica
+from usergrid.sessions import UsergridSession
+from usergrid.testing import UsergridStandIn
+
+
+class CollectionReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.directory = tempfile.mkdtemp()
+        self.server = UsergridStandIn().start()
+        self.roles = [self.server.create('roles', {'name': 'role%d' % i,
+                                                   'level': i % 3,
+                                                   'tags': ['all', 'even' if i % 2 == 0 else 'odd']})
+                      for i in range(12)]
+        self.client = ApplicationClient(UsergridSession('org_test', api_url=self.server.api_url,
+                                                        client_id='id', client_secret='secret'))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def replica(self, **kwargs):
+        kwargs.setdefault('indexes', ['level', 'tags'])
+        replica = CollectionReplica(self.client, 'roles', limit=5, **kwargs)
+        self.addCleanup(replica.close)
+        return replica
+
+    def test_reads(self):
+        replica = self.replica()
+        self.assertEquals(replica.get('role3')['level'], 0)
+        self.assertEquals(replica.get(self.roles[4]['uuid']).name, 'role4')
+        self.assertIsNone(replica.get('missing'))
+        self.assertEquals(len(replica), 12)
+
+        requests = self.server.requests
+        self.assertEquals(sorted(e.name for e in replica.find(level=1)),
+                          ['role1', 'role10', 'role4', 'role7'])
+        self.assertEquals(sorted(e.name for e in replica.find(level=1, tags='odd')),
+                          ['role1', 'role7'])
+        self.assertEquals([e.name for e in replica.find(name='role5')], ['role5'])
+        self.assertEquals(len(replica.all()), 12)
+        self.assertEquals(self.server.requests, requests)
+
+    def test_incremental_sync(self):
+        replica = self.replica(max_staleness=None)
+        self.assertEquals(replica.sync(), 12)
+        self.assertEquals(replica.last_seen, max(role['modified'] for role in self.roles))
+
+        self.server.update(self.roles[0], {'level': 2})
+        self.server.create('roles', {'name': 'role12', 'level': 2})
+        self.assertEquals(replica.sync(), 2)
+        self.assertEquals(replica.stats()['full_syncs'], 1)
+        self.assertEquals(replica.get('role0')['level'], 2)
+        self.assertIn('role12', [e.name for e in replica.find(level=2)])
+        self.assertEquals(replica.sync(), 0)
+
+    def test_full_sync_removes_deleted(self):
+        replica = self.replica(max_staleness=None)
+        replica.sync()
+        with self.server.lock:
+            self.server.collections['roles'].remove(self.roles[0])
+
+        replica.sync()
+        self.assertIsNotNone(replica.get('role0'))
+        replica.sync(full=True)
+        self.assertIsNone(replica.get('role0'))
+        self.assertEquals(len(replica.find(tags='all')), 11)
+        self.assertEquals(len(replica), 11)
+
+    def test_staleness(self):
+        replica = self.replica(max_staleness=0.05)
+        replica.get('role0')
+        self.server.update(self.roles[0], {'level': 2})
+        self.assertEquals(replica.get('role0')['level'], 0)
+
+        time.sleep(0.1)
+        self.assertEquals(replica.get('role0')['level'], 2)
+        self.assertEquals(replica.stats()['syncs'], 2)
+
+    def test_concurrent_reads(self):
+        replica = self.replica(max_staleness=0.05)
+        replica.sync()
+        time.sleep(0.1)
+
+        threads = [threading.Thread(target=replica.get, args=('role0',)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(replica.stats()['syncs'], 2)
+
+    def test_server_down(self):
+        replica = self.replica(max_staleness=0.05)
+        replica.sync()
+        self.server.error_rate = 1
+        time.sleep(0.1)
+
+        self.assertEquals(replica.get('role0')['level'], 0)
+        self.assertEquals(replica.stats()['failed_syncs'], 1)
+        # the sync is not tried again before max_staleness
+        replica.get('role1')
+        self.assertEquals(replica.stats()['failed_syncs'], 1)
+
+        self.server.error_rate = 0
+        time.sleep(0.1)
+        replica.get('role0')
+        self.assertEquals(replica.stats()['syncs'], 2)
+
+    def test_server_down_never_synced(self):
+        self.server.error_rate = 1
+        replica = self.replica()
+        self.assertRaises(UsergridException, replica.get, 'role0')
+        self.assertRaises(UsergridException, replica.get, 'role0')
+
+    def test_interrupted_load(self):
+        self.server.update(self.roles[0], {'level': 2})
+        iter_collection = self.client.iter_collection
+
+        def failing(*args, **kwargs):
+            for i, entity in enumerate(iter_collection(*args, **kwargs)):
+                if i == 5:
+                    raise UsergridException('unavailable')
+                yield entity
+
+        self.client.iter_collection = failing
+        replica = self.replica(max_staleness=None)
+        self.assertRaises(UsergridException, replica.get, 'role0')
+        self.assertFalse(replica.is_loaded())
+        self.assertIsNone(replica.last_seen)
+        self.assertRaises(UsergridException, replica.get, 'role0')
+
+        self.client.iter_collection = iter_collection
+        self.assertEquals(replica.get('role0')['level'], 2)
+        self.assertEquals(len(replica), 12)
+        self.assertEquals(replica.stats()['full_syncs'], 1)
+
+    def test_background_sync(self):
+        replica = self.replica(max_staleness=None, sync_interval=0.02)
+        replica.sync()
+        self.server.update(self.roles[0], {'level': 2})
+        deadline = time.time() + 5
+        while replica.get('role0')['level'] != 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEquals(replica.get('role0')['level'], 2)
+
+    def test_persistent(self):
+        path = os.path.join(self.directory, 'roles.db')
+        replica = self.replica(path=path)
+        replica.sync()
+        replica.close()
+
+        self.server.update(self.roles[0], {'level': 2})
+        replica = self.replica(path=path, indexes=['level'])
+        self.assertEquals(replica.sync(), 1)
+        self.assertEquals(replica.stats()['full_syncs'], 0)
+        self.assertEquals(len(replica.find(level=2)), 5)
+        self.assertEquals(len(replica.find(tags='even')), 6)
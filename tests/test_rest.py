@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.rest"""
+
+import unittest
+
+import httpretty
+
+from usergrid.rest import (
+    RESTClient,
+    RESTClientImpl,
+    PooledRESTClient,
+    PooledRESTClientImpl
+)
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+
+from .mock import MockUsergridResponse
+
+class RESTClientTestCase(unittest.TestCase):
+
+    def test_using(self):
+        impl = RESTClientImpl()
+        client = RESTClient.using(impl)
+        self.assertTrue(issubclass(client, RESTClient))
+        self.assertIs(client.IMPL, impl)
+        self.assertIsNot(RESTClient.IMPL, impl)
+
+    def test_default_timeout(self):
+        calls = []
+
+        class RecordingImpl(RESTClientImpl):
+            def send(self, method, url, **kwargs):
+                calls.append(kwargs)
+                raise ValueError()
+
+        impl = RecordingImpl(timeout=5)
+        for kwargs in ({}, {'timeout': 1}):
+            with self.assertRaises(ValueError):
+                impl.request('GET', 'https://api.usergrid.com/', **kwargs)
+        self.assertEquals([c['timeout'] for c in calls], [5, 1])
+
+
+class PooledRESTClientImplTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.impl = PooledRESTClientImpl(pool_maxsize=4, timeout=10)
+
+    def tearDown(self):
+        self.impl.close()
+
+    def test_shared_session(self):
+        session = self.impl.session
+        self.assertIs(self.impl.session, session)
+        adapter = session.get_adapter('https://api.usergrid.com/')
+        self.assertEquals(adapter._pool_maxsize, 4)
+
+    def test_close(self):
+        session = self.impl.session
+        self.impl.close()
+        self.assertIsNot(self.impl.session, session)
+
+    def test_keep_alive(self):
+        impl = PooledRESTClientImpl(keep_alive=False)
+        self.assertEquals(impl.session.headers['Connection'], 'close')
+
+    @httpretty.activate
+    def test_request(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.VALID_USER_AUTHENTICATION,
+        )
+        rest = RESTClient.using(self.impl)
+        res = rest.post('https://api.usergrid.com/org_test/sandbox/token', data={})
+        self.assertEquals(res.status, 200)
+        self.assertIn('access_token', res.data)
+
+    def test_client_rest_client(self):
+        sess = UsergridSession('org_test', token='test_token')
+        client = ApplicationClient(sess, rest_client=PooledRESTClient)
+        self.assertIs(client.rest, PooledRESTClient)
+        self.assertIsInstance(client.rest.IMPL, PooledRESTClientImpl)
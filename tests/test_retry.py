@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.retry"""
+
+import json
+import time
+import unittest
+
+import httpretty
+import requests
+
+from usergrid.retry import RetryPolicy, CircuitBreaker
+from usergrid.rest import RESTClient, RESTClientImpl
+from usergrid.exceptions import RESTError, CircuitOpenError, LimiterTimeoutError, UsergridException
+
+USERS_URL = 'https://api.usergrid.com/org_test/sandbox/users'
+
+class RecordingRetryPolicy(RetryPolicy):
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingRetryPolicy, self).__init__(*args, **kwargs)
+        self.delays = []
+
+    def sleep(self, seconds):
+        self.delays.append(seconds)
+
+
+class FakeResponse(object):
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def test_can_retry(self):
+        policy = RetryPolicy(max_retries=2)
+        self.assertTrue(policy.can_retry('GET', 0))
+        self.assertTrue(policy.can_retry('PUT', 1))
+        self.assertFalse(policy.can_retry('GET', 2))
+        self.assertFalse(policy.can_retry('POST', 0))
+        self.assertTrue(RetryPolicy(retry_post=True).can_retry('POST', 0))
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+        for attempt in range(6):
+            delay = policy.backoff(attempt)
+            self.assertTrue(0 <= delay <= min(5, 2 ** attempt))
+
+    def test_retry_after(self):
+        policy = RetryPolicy()
+        self.assertEquals(policy.retry_after(FakeResponse({'retry-after': '3'})), 3)
+        self.assertIsNone(policy.retry_after(FakeResponse({})))
+        self.assertIsNone(policy.retry_after(FakeResponse({'retry-after': 'soon'})))
+        date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 30))
+        self.assertAlmostEqual(policy.retry_after(FakeResponse({'retry-after': date})), 30, delta=2)
+        self.assertIsNone(policy.delay(FakeResponse({'retry-after': '3600'}), 0))
+
+
+class RetryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RecordingRetryPolicy(max_retries=3)
+        self.rest = RESTClient.using(RESTClientImpl(retry=self.policy))
+        httpretty.reset()
+        httpretty.enable()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def register(self, method, responses):
+        responses = list(responses)
+
+        def callback(request, uri, headers):
+            status, extra = responses.pop(0)
+            headers.update(extra)
+            if status == 200:
+                return (status, headers, json.dumps({'entities': []}))
+            return (status, headers, '<html>Service Unavailable</html>')
+
+        httpretty.register_uri(method, USERS_URL, body=callback)
+        return responses
+
+    def test_retry_transient(self):
+        remaining = self.register(httpretty.GET, [(503, {}), (429, {'retry-after': '2'}), (200, {})])
+        res = self.rest.get(USERS_URL)
+        self.assertEquals(res.status, 200)
+        self.assertEquals(remaining, [])
+        self.assertEquals(len(self.policy.delays), 2)
+        self.assertEquals(self.policy.delays[1], 2)
+
+    def test_give_up(self):
+        self.register(httpretty.GET, [(503, {})] * 4)
+        with self.assertRaises(RESTError) as cm:
+            self.rest.get(USERS_URL)
+        self.assertEquals(cm.exception.status, 503)
+        self.assertEquals(cm.exception.error, 'http_error')
+        self.assertEquals(len(self.policy.delays), 3)
+
+    def test_no_post_retry(self):
+        remaining = self.register(httpretty.POST, [(503, {}), (200, {})])
+        with self.assertRaises(RESTError):
+            self.rest.post(USERS_URL, data={})
+        self.assertEquals(len(remaining), 1)
+
+    def test_post_retry(self):
+        self.policy.retry_post = True
+        self.register(httpretty.POST, [(503, {}), (200, {})])
+        self.assertEquals(self.rest.post(USERS_URL, data={}).status, 200)
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        httpretty.reset()
+
+    def test_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure('host')
+        breaker.before_request('host')
+        breaker.record_failure('host')
+        self.assertEquals(breaker.state('host'), 'open')
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request('host')
+        breaker.before_request('other_host')
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure('host')
+        breaker.before_request('host')
+        self.assertEquals(breaker.state('host'), 'half-open')
+        breaker.record_failure('host')
+        self.assertEquals(breaker.state('host'), 'open')
+        breaker.before_request('host')
+        breaker.record_success('host')
+        self.assertEquals(breaker.state('host'), 'closed')
+
+    def test_success_resets(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure('host')
+        breaker.record_success('host')
+        breaker.record_failure('host')
+        self.assertEquals(breaker.state('host'), 'closed')
+
+    @httpretty.activate
+    def test_fail_fast(self):
+        calls = []
+
+        def callback(request, uri, headers):
+            calls.append(uri)
+            return (502, headers, '')
+
+        httpretty.register_uri(httpretty.GET, USERS_URL, body=callback)
+        breaker = CircuitBreaker(failure_threshold=2)
+        rest = RESTClient.using(RESTClientImpl(circuit_breaker=breaker))
+        for i in range(2):
+            with self.assertRaises(RESTError):
+                rest.get(USERS_URL)
+        with self.assertRaises(CircuitOpenError):
+            rest.get(USERS_URL)
+        self.assertEquals(len(calls), 2)
+
+    def test_failed_trial_reopens(self):
+        class FailingImpl(RESTClientImpl):
+            def send(self, method, url, **kwargs):
+                raise requests.exceptions.ConnectionError('refused')
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure('api.usergrid.com')
+        time.sleep(0.1)
+        rest = RESTClient.using(FailingImpl(circuit_breaker=breaker))
+        with self.assertRaises(UsergridException):
+            rest.get(USERS_URL)
+        self.assertEquals(breaker.state('api.usergrid.com'), 'open')
+        with self.assertRaises(CircuitOpenError):
+            rest.get(USERS_URL)
+
+    def test_local_error_not_recorded(self):
+        calls = []
+
+        class FailingImpl(RESTClientImpl):
+            def send(self, method, url, **kwargs):
+                calls.append(url)
+                raise LimiterTimeoutError('no slot')
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        rest = RESTClient.using(FailingImpl(circuit_breaker=breaker))
+        with self.assertRaises(LimiterTimeoutError):
+            rest.get(USERS_URL)
+        self.assertEquals(breaker.state('api.usergrid.com'), 'closed')
+
+        # a failed trial is released: the next request is a trial again
+        breaker.record_failure('api.usergrid.com')
+        time.sleep(0.1)
+        for i in range(2):
+            with self.assertRaises(LimiterTimeoutError):
+                rest.get(USERS_URL)
+        self.assertEquals(len(calls), 3)
+        self.assertEquals(breaker.state('api.usergrid.com'), 'open')
@@ -7,6 +7,8 @@ import unittest
 import httpretty
 from httpretty.core import HTTPrettyRequest, HTTPrettyRequestEmpty
 
+from usergrid.clients import ApplicationClient
+from usergrid.rest import RESTClient, RESTClientImpl
 from usergrid.sessions import BaseSession, UsergridSession
 from usergrid.exceptions import UsergridException
 
@@ -60,11 +62,27 @@ class BaseSessionTestCase(unittest.TestCase):
         url = self.sess.build_url('users')
         self.assertEqual(url, 'https://api.example.com/org_test/sandbox/users')
 
+    def test_url_with_scheme(self):
+        sess = BaseSession('org_test', api_url='http://localhost:8080', app_name='sandbox')
+        url = sess.build_url('/users')
+        self.assertEqual(url, 'http://localhost:8080/org_test/sandbox/users')
+
     def test_url_with_params(self):
         params = {'t': 3, 'w': 'test'}
         url = self.sess.build_url('users', params)
         self.assertEqual(url, 'https://api.example.com/org_test/sandbox/users?t=3&w=test')
 
+    def test_url_normalized(self):
+        url = self.sess.build_url('//users//me/', {'path': '/a//b'})
+        self.assertEqual(url, 'https://api.example.com/org_test/sandbox/users/me/?path=%2Fa%2F%2Fb')
+
+    def test_url_prefix(self):
+        self.assertEqual(self.sess.url_prefix, 'https://api.example.com/org_test/sandbox')
+        self.assertEqual(self.sess.build_url('users'), self.sess.build_url('users'))
+        self.sess.app_name = 'other/'
+        self.assertEqual(self.sess.url_prefix, 'https://api.example.com/org_test/other')
+        self.assertEqual(self.sess.build_url('users'), 'https://api.example.com/org_test/other/users')
+
 
 class UsergridSessionTestCase(unittest.TestCase):
 
@@ -190,6 +208,12 @@ class UsergridSessionTestCase(unittest.TestCase):
         self.sess.build_access_headers()
         self.assertTrue(self.sess.is_linked())
 
+    def test_build_access_headers_bearer(self):
+        sess = UsergridSession('org_test', token='test_token', token_placement='header')
+        headers, params = sess.build_access_headers()
+        self.assertEqual(headers, {'Authorization': 'Bearer test_token'})
+        self.assertEqual(params, {})
+
     def test_missing_info_client_authenticate(self):
         sess = UsergridSession('org_test',
                                client_id='test'
@@ -225,3 +249,24 @@ class UsergridSessionTestCase(unittest.TestCase):
         sess.authenticate()
         self.assertIsInstance(httpretty.last_request(), HTTPrettyRequest)
         self.assertTrue(sess.is_linked())
+
+    @httpretty.activate
+    def test_authenticate_rest_client(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.VALID_CLIENT_AUTHENTICATION,
+        )
+        methods = []
+
+        class RecordingImpl(RESTClientImpl):
+            def send(self, method, url, **kwargs):
+                methods.append(method)
+                return super(RecordingImpl, self).send(method, url, **kwargs)
+
+        rest_client = RESTClient.using(RecordingImpl())
+        sess = UsergridSession('org_test', client_id='test', client_secret='test',
+                               rest_client=rest_client)
+        sess.authenticate()
+        self.assertEquals(methods, ['POST'])
+        self.assertIs(ApplicationClient(sess).rest, rest_client)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.testing"""
+
+import threading
+import unittest
+
+import httpretty
+
+from usergrid.clients import ApplicationClient
+from usergrid.exceptions import RESTError
+from usergrid.rest import PooledRESTClientImpl, RESTClient
+from usergrid.sessions import UsergridSession
+from usergrid.testing import QueryError, UsergridStandIn, parse_query
+
+
+class ParseQueryTestCase(unittest.TestCase):
+
+    def test_conditions(self):
+        matches, order, descending = parse_query("select * where age >= 20 and name = 'bob' or age < 3")
+        self.assertTrue(matches({'age': 20, 'name': 'bob'}))
+        self.assertTrue(matches({'age': 2}))
+        self.assertFalse(matches({'age': 20, 'name': 'alice'}))
+        self.assertFalse(matches({'name': 'bob'}))
+        self.assertIsNone(order)
+
+    def test_parentheses(self):
+        matches, order, descending = parse_query("select * where (age < 3 or age > 60) and name = 'a (b)'")
+        self.assertTrue(matches({'age': 2, 'name': 'a (b)'}))
+        self.assertTrue(matches({'age': 61, 'name': 'a (b)'}))
+        self.assertFalse(matches({'age': 20, 'name': 'a (b)'}))
+        self.assertFalse(matches({'age': 2, 'name': 'a'}))
+
+    def test_order(self):
+        matches, order, descending = parse_query('select * order by created desc')
+        self.assertTrue(matches({}))
+        self.assertEquals(order, 'created')
+        self.assertTrue(descending)
+
+    def test_unsupported(self):
+        self.assertRaises(QueryError, parse_query, 'select name where age ~ 3')
+
+
+class UsergridStandInTestCase(unittest.TestCase):
+
+    def setUp(self):
+        httpretty.disable()
+        self.server = UsergridStandIn().start()
+        self.impl = PooledRESTClientImpl()
+        self.session = UsergridSession('org_test', api_url=self.server.api_url,
+                                       client_id='id', client_secret='secret')
+        self.client = ApplicationClient(self.session, rest_client=RESTClient.using(self.impl))
+
+    def tearDown(self):
+        self.impl.close()
+        self.server.stop()
+
+    def test_token(self):
+        self.session.authenticate()
+        self.assertIn(self.session.token, self.server.tokens)
+
+    def test_crud(self):
+        res = self.client.post_json('/users', {'name': 'bob', 'age': 30})
+        entity = res.data['entities'][0]
+        self.assertEquals(entity['type'], 'user')
+
+        res = self.client.get('/users/bob')
+        self.assertEquals(res.data['entities'][0]['uuid'], entity['uuid'])
+
+        url, headers, params = self.client.request('/users/bob', {'age': 31}, method='PUT')
+        self.impl.request('PUT', url, data='{"age": 31}')
+        self.assertEquals(self.server.find('users', 'bob')['age'], 31)
+
+        url, headers, params = self.client.request('/users/%s' % entity['uuid'], method='GET')
+        self.impl.request('DELETE', url)
+        self.assertIsNone(self.server.find('users', 'bob'))
+
+        with self.assertRaises(RESTError) as context:
+            self.client.get('/users/bob')
+        self.assertEquals(context.exception.status, 404)
+
+    def test_paging(self):
+        with self.client.bulk_writer('items', chunk_size=10) as writer:
+            writer.extend({'index': i} for i in range(25))
+
+        items = list(self.client.iter_collection('items', ql='select * where index >= 5', limit=7))
+        self.assertEquals(sorted(item['index'] for item in items), range(5, 25))
+
+    def test_expired_token(self):
+        self.session.authenticate()
+        self.server.expire_tokens()
+        self.session.tokens.update(None)
+
+        res = self.client.get('/users')
+        self.assertEquals(res.data['entities'], [])
+        self.assertEquals(len(self.server.tokens), 2)
+
+    def test_bearer_token(self):
+        self.session.token_placement = 'header'
+        self.client.post_json('/users', {'name': 'bob'})
+        url, headers, params = self.client.request('/users/bob', method='GET')
+        self.assertNotIn('token', url)
+        self.assertEqual(self.client.get('/users/bob').data['entities'][0]['name'], 'bob')
+
+    def test_error_injection(self):
+        self.session.authenticate()
+        self.server.error_rate = 1
+        with self.assertRaises(RESTError) as context:
+            self.client.get('/users')
+        self.assertEquals(context.exception.status, 503)
+
+    def test_event_queue(self):
+        with self.client.event_queue(flush_interval=60) as queue:
+            for i in range(3):
+                queue.increment('clicks')
+            queue.add({'category': 'login'})
+        self.assertEquals(self.server.counters, {'clicks': 3})
+
+    def test_events(self):
+        self.client.post_json('/events', [{'counters': {'clicks': 2}}, {'counters': {'clicks': 1}}])
+        self.assertEquals(self.server.counters, {'clicks': 3})
+
+    def test_concurrent_updates(self):
+        entity = self.server.create('items', dict(('p%d' % i, i) for i in range(100)))
+        errors = []
+
+        def update():
+            for i in range(200):
+                self.server.update(entity, {'q%d' % (i % 50): None if i % 2 else i})
+
+        def read():
+            try:
+                for i in range(20):
+                    self.client.get('/items/%s' % entity['uuid'])
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=update)] + [threading.Thread(target=read) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(errors, [])
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.streaming"""
+
+import json
+import unittest
+
+import httpretty
+
+from usergrid.streaming import EntityStreamParser
+from usergrid.rest import RESTClient, RESTStreamResponse
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+
+from .test_iterators import register_collection
+
+def chunked(s, size):
+    return [s[i:i + size] for i in range(0, len(s), size)]
+
+
+class EntityStreamParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'action': 'get',
+            'count': 1234567,
+            'entities': [{'uuid': str(i), 'name': u'\xe9l\xe8ve %d' % i, 'tags': [i, None, True]}
+                         for i in range(20)],
+            'cursor': 'LTU2ODc0MzQzOkdGN0',
+            'params': {'limit': ['20']},
+        }
+        self.body = json.dumps(self.data, indent=1)
+
+    def test_chunk_sizes(self):
+        for size in (1, 2, 7, 64, len(self.body)):
+            parser = EntityStreamParser(chunked(self.body, size))
+            self.assertEquals(list(parser), self.data['entities'])
+            metadata = dict(self.data)
+            del metadata['entities']
+            self.assertEquals(parser.metadata, metadata)
+
+    def test_incremental(self):
+        chunks = chunked(self.body, 16)
+        consumed = []
+
+        def source():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        parser = iter(EntityStreamParser(source()))
+        self.assertEquals(next(parser), self.data['entities'][0])
+        self.assertLess(len(consumed), len(chunks) / 2)
+
+    def test_empty(self):
+        self.assertEquals(list(EntityStreamParser(['{}'])), [])
+        parser = EntityStreamParser(['{"entities": [ ], "count": 0}'])
+        self.assertEquals(list(parser), [])
+        self.assertEquals(parser.metadata, {'count': 0})
+
+    def test_not_an_array(self):
+        parser = EntityStreamParser(['{"entities": {"a": 1}}'])
+        self.assertEquals(list(parser), [])
+        self.assertEquals(parser.metadata, {'entities': {'a': 1}})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(['{"entities": [{"a": 1}']))
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(['[]']))
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(['{"entities": [{"a": 1 "b": 2}]}']))
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(['{"entities": [truex]}']))
+
+    def test_invalid_reported_early(self):
+        consumed = []
+
+        def source():
+            yield '{"entities": [{"a": [1, 2}, '
+            while True:
+                consumed.append(1)
+                yield '{"b": 1}, '
+
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(source()))
+        self.assertEquals(consumed, [])
+
+    def test_strings(self):
+        entity = {'a': u'"}]\\ {[', 'b': ['\\"', '{']}
+        body = json.dumps({'entities': [entity, entity]})
+        for size in (1, 3, len(body)):
+            self.assertEquals(list(EntityStreamParser(chunked(body, size))), [entity, entity])
+
+    def test_max_value_size(self):
+        body = json.dumps({'entities': [{'a': 'x' * 1000}]})
+        with self.assertRaises(ValueError):
+            list(EntityStreamParser(chunked(body, 100), max_value_size=500))
+        self.assertEquals(len(list(EntityStreamParser(chunked(body, 100), max_value_size=2000))), 1)
+
+    def test_large_entity(self):
+        entity = {'items': [{'i': i, 's': 'x' * 20} for i in range(20000)]}
+        body = json.dumps({'entities': [entity]})
+        self.assertEquals(list(EntityStreamParser(chunked(body, 512))), [entity])
+
+
+class StreamResponseTestCase(unittest.TestCase):
+
+    @httpretty.activate
+    def test_stream(self):
+        body = {'entities': [{'name': 'a'}, {'name': 'b'}], 'cursor': 'next'}
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps(body),
+        )
+        res = RESTClient.stream('https://api.usergrid.com/org_test/sandbox/users')
+        self.assertIsInstance(res, RESTStreamResponse)
+        self.assertEquals([e['name'] for e in res], ['a', 'b'])
+        self.assertEquals(res.metadata, {'cursor': 'next'})
+
+    @httpretty.activate
+    def test_stream_data(self):
+        body = {'entities': [{'name': 'a'}], 'cursor': 'next'}
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps(body),
+        )
+        res = RESTClient.stream('https://api.usergrid.com/org_test/sandbox/users')
+        self.assertEquals(res.data, body)
+
+    @httpretty.activate
+    def test_stream_collection(self):
+        register_collection('users', 25, 10)
+        client = ApplicationClient(UsergridSession('org_test', token='test_token'))
+        entities = list(client.iter_collection('users', limit=10, stream=True))
+        self.assertEquals([e['uuid'] for e in entities], [str(i) for i in range(25)])
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for usergrid.tokens"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import httpretty
+
+from usergrid.sessions import UsergridSession
+from usergrid.clients import ApplicationClient
+from usergrid.exceptions import RESTError, UsergridException
+from usergrid.tokens import MemoryTokenStore, FileTokenStore
+
+from .mock import MockUsergridResponse
+
+class CountingSession(UsergridSession):
+    """A session issuing numbered tokens without any request."""
+
+    def __init__(self, *args, **kwargs):
+        self.expires_in = kwargs.pop('expires_in', 3600)
+        self.delay = kwargs.pop('delay', 0.01)
+        self.fail = kwargs.pop('fail', False)
+        super(CountingSession, self).__init__(*args, **kwargs)
+        self.count = 0
+
+    def request_token(self):
+        time.sleep(self.delay)
+        self.count += 1
+        if self.fail:
+            raise UsergridException('unavailable')
+        self.set_token('token_%d' % self.count, self.expires_in)
+
+
+class TokenManagerTestCase(unittest.TestCase):
+
+    @httpretty.activate
+    def test_read_expiry(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://api.usergrid.com/org_test/sandbox/token',
+            body=MockUsergridResponse.VALID_USER_AUTHENTICATION,
+        )
+        sess = UsergridSession('org_test', auth_level='user', username='test', password='test')
+        sess.authenticate()
+        self.assertAlmostEqual(sess.tokens.expires_at, time.time() + 604800, delta=5)
+        self.assertTrue(sess.tokens.is_valid())
+
+    def test_expired(self):
+        sess = CountingSession('org_test')
+        sess.set_token('old_token', 1)
+        self.assertTrue(sess.tokens.is_expired())
+        sess.build_access_headers()
+        self.assertEquals(sess.token, 'token_1')
+        self.assertFalse(sess.tokens.is_expired())
+
+    def test_single_flight(self):
+        sess = CountingSession('org_test')
+        threads = [threading.Thread(target=sess.build_access_headers) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(sess.count, 1)
+
+    def test_background_refresh(self):
+        sess = CountingSession('org_test', refresh_margin=30)
+        sess.set_token('old_token', 20)
+        headers, params = sess.build_access_headers()
+        self.assertEquals(params['token'], 'old_token')
+        sess.tokens._refresh.result()
+        self.assertEquals(sess.token, 'token_1')
+        self.assertEquals(sess.count, 1)
+
+    def test_background_refresh_does_not_block(self):
+        sess = CountingSession('org_test', refresh_margin=30, delay=1)
+        sess.set_token('old_token', 20)
+        sess.build_access_headers()
+        durations = []
+
+        def request():
+            start = time.time()
+            headers, params = sess.build_access_headers()
+            durations.append((time.time() - start, params['token']))
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+        self.assertLess(durations[0][0], 0.2)
+        self.assertEquals(durations[0][1], 'old_token')
+
+        sess.tokens._refresh.result()
+        self.assertEquals(sess.count, 1)
+
+    def test_failed_refresh_backoff(self):
+        sess = CountingSession('org_test', refresh_margin=30, fail=True)
+        sess.set_token('old_token', 20)
+        sess.build_access_headers()
+        sess.tokens._refresh.result()
+        for i in range(10):
+            sess.build_access_headers()
+        self.assertEquals(sess.count, 1)
+        self.assertEquals(sess.token, 'old_token')
+
+        sess.fail = False
+        sess.tokens._next_refresh_at = time.time()
+        sess.build_access_headers()
+        sess.tokens._refresh.result()
+        self.assertEquals(sess.token, 'token_2')
+
+    def test_foreground_waits_for_refresh(self):
+        sess = CountingSession('org_test', refresh_margin=30, delay=0.3)
+        sess.set_token('old_token', 20)
+        sess.build_access_headers()
+        time.sleep(0.05)
+
+        # the server rejects the current token while it is refreshed
+        sess.invalidate_token('old_token')
+        headers, params = sess.build_access_headers()
+        self.assertEquals(params['token'], 'token_1')
+        self.assertEquals(sess.count, 1)
+
+    def test_no_background_refresh(self):
+        sess = CountingSession('org_test', refresh_margin=30, background_refresh=False)
+        sess.set_token('old_token', 20)
+        sess.build_access_headers()
+        self.assertIsNone(sess.tokens._refresh)
+        self.assertEquals(sess.token, 'old_token')
+
+    def test_invalidate(self):
+        sess = CountingSession('org_test', token='token')
+        sess.invalidate_token('other_token')
+        self.assertTrue(sess.is_linked())
+        sess.invalidate_token('token')
+        self.assertFalse(sess.is_linked())
+        self.assertIsNone(sess.tokens.expires_at)
+
+    @httpretty.activate
+    def test_retry_expired_token(self):
+        def callback(request, uri, headers):
+            if request.querystring['token'] == ['old_token']:
+                error = {'error': 'expired_token', 'error_description': 'token expired'}
+                return (401, headers, json.dumps(error))
+            return (200, headers, json.dumps({'entities': []}))
+
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=callback,
+        )
+        sess = CountingSession('org_test', token='old_token')
+        client = ApplicationClient(sess)
+        res = client.get('/users')
+        self.assertEquals(res.data, {'entities': []})
+        self.assertEquals(sess.token, 'token_1')
+
+    @httpretty.activate
+    def test_no_retry_other_errors(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.usergrid.com/org_test/sandbox/users',
+            body=json.dumps({'error': 'unauthorized', 'error_description': 'no access'}),
+            status=401
+        )
+        sess = CountingSession('org_test', token='old_token')
+        with self.assertRaises(RESTError):
+            ApplicationClient(sess).get('/users')
+        self.assertEquals(sess.count, 0)
+
+
+class ProcessCountingSession(CountingSession):
+    """A counting session whose tokens name the process that requested them."""
+
+    def request_token(self):
+        time.sleep(0.01)
+        self.count += 1
+        self.set_token('token_%d_%d' % (os.getpid(), self.count), self.expires_in)
+
+
+def authenticate_in_process(path, requests):
+    sess = ProcessCountingSession('org_test', token_store=FileTokenStore(path))
+    sess.build_access_headers()
+    with requests.get_lock():
+        requests.value += sess.count
+
+
+class TokenStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.key = ('api.usergrid.com', 'org_test', 'sandbox', 'client', 'client_id')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_memory_store(self):
+        store = MemoryTokenStore()
+        self.assertIsNone(store.get(self.key))
+        store.set(self.key, 'token', 42)
+        self.assertEquals(store.get(self.key), ('token', 42))
+        store.delete(self.key, 'other_token')
+        self.assertEquals(store.get(self.key), ('token', 42))
+        store.delete(self.key, 'token')
+        self.assertIsNone(store.get(self.key))
+
+    def test_file_store(self):
+        store = FileTokenStore(self.path)
+        self.assertIsNone(store.get(self.key))
+        store.set(self.key, 'token', 42.5)
+        self.assertEquals(FileTokenStore(self.path).get(self.key), ('token', 42.5))
+        mode = os.stat(store.filename(self.key)).st_mode
+        self.assertEquals(stat.S_IMODE(mode), 0600)
+        store.delete(self.key)
+        self.assertIsNone(store.get(self.key))
+
+    def test_file_store_private_directory(self):
+        os.chmod(self.path, 0755)
+        self.assertRaises(UsergridException, FileTokenStore, self.path)
+
+        os.chmod(self.path, 0700)
+        link = os.path.join(tempfile.mkdtemp(), 'tokens')
+        self.addCleanup(shutil.rmtree, os.path.dirname(link))
+        os.symlink(self.path, link)
+        self.assertRaises(UsergridException, FileTokenStore, link)
+
+        path = os.path.join(self.path, 'nested', 'tokens')
+        FileTokenStore(path)
+        self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), 0700)
+
+    def test_token_key(self):
+        sess = UsergridSession('org_test', client_id='client_id', client_secret='secret')
+        self.assertEquals(sess.token_key(), self.key)
+        sess = UsergridSession('org_test', auth_level='user', username='test', password='test')
+        self.assertEquals(sess.token_key()[3:], ('user', 'test'))
+
+    def test_shared_token(self):
+        store = MemoryTokenStore()
+        first = CountingSession('org_test', token_store=store)
+        second = CountingSession('org_test', token_store=store)
+        first.build_access_headers()
+        second.build_access_headers()
+        self.assertEquals(second.token, first.token)
+        self.assertEquals(second.tokens.expires_at, first.tokens.expires_at)
+        self.assertEquals(second.count, 0)
+
+    def test_shared_expired_token(self):
+        store = MemoryTokenStore()
+        store.set(CountingSession('org_test').token_key(), 'old_token', time.time() + 1)
+        sess = CountingSession('org_test', token_store=store)
+        sess.build_access_headers()
+        self.assertEquals(sess.count, 1)
+        self.assertEquals(store.get(sess.token_key())[0], sess.token)
+
+    def test_invalidate_shared_token(self):
+        store = MemoryTokenStore()
+        sess = CountingSession('org_test', token_store=store)
+        sess.build_access_headers()
+        sess.invalidate_token(sess.token)
+        self.assertIsNone(store.get(sess.token_key()))
+
+    def test_processes_share_token(self):
+        requests = multiprocessing.Value('i', 0)
+        processes = [multiprocessing.Process(target=authenticate_in_process,
+                                             args=(self.path, requests))
+                     for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEquals(requests.value, 1)
+        sess = ProcessCountingSession('org_test', token_store=FileTokenStore(self.path))
+        sess.build_access_headers()
+        self.assertEquals(sess.count, 0)
+        self.assertIn(int(sess.token.split('_')[1]), [p.pid for p in processes])
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+# the optional pieces (ie. the iterators, the event queues, the replicas) and requests are
+# imported on first use
 from . import sessions
 from . import clients
 
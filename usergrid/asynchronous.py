@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.asynchronous
+~~~~~~~~~~~~~~~~~~~~~
+
+This module contains the asynchronous usergrid objects. They mirror the
+blocking ``usergrid.rest``, ``usergrid.sessions`` and ``usergrid.clients``
+objects but return ``gevent`` greenlets instead of results, so a single
+process can keep thousands of requests in flight without a thread each.
+
+``gevent`` is an optional dependency (``pip install usergrid[async]``) and
+the socket module must be monkey-patched before any request is made::
+
+    from gevent import monkey; monkey.patch_all()
+"""
+
+try:
+    import gevent
+    from gevent.lock import BoundedSemaphore
+    from gevent.pool import Pool
+except ImportError: # pragma: no cover
+    raise ImportError("usergrid.asynchronous requires gevent: pip install gevent")
+
+from .rest import PooledRESTClientImpl
+from .sessions import UsergridSession
+from .clients import BaseClient
+
+
+def gather(calls, concurrency=None, raise_error=True):
+    """Run callables concurrently with a bounded number in flight.
+    Returns the list of results, in the same order as ``calls``.
+
+    :param calls: An iterable of callables taking no arguments.
+    :param concurrency: (optional) The maximum number of calls running at the same time. Default
+        to None (unbounded).
+    :param raise_error: (optional) Whether the first error is raised. If False, the exceptions are
+        returned in place of the results. Default to True.
+    """
+
+    def run(call):
+        try:
+            return call()
+        except Exception, e:
+            if raise_error:
+                raise
+            return e
+
+    pool = Pool(concurrency)
+    greenlets = [pool.spawn(run, call) for call in calls]
+    gevent.joinall(greenlets, raise_error=raise_error)
+
+    return [g.value for g in greenlets]
+
+
+class AsyncRESTClientImpl(object):
+    """The AsyncRESTClient implementation. It runs the requests of a blocking
+    :class:`usergrid.rest.RESTClientImpl` in greenlets.
+    """
+
+    def __init__(self, impl=None, concurrency=None):
+        """Initialize an AsyncRESTClientImpl instance.
+
+        :param impl: (optional) The :class:`usergrid.rest.RESTClientImpl` performing the requests.
+            Default to a :class:`usergrid.rest.PooledRESTClientImpl` with a large pool.
+        :param concurrency: (optional) The maximum number of requests in flight. The extra requests
+            wait for a free slot. Default to None (unbounded).
+        """
+
+        if impl is None:
+            impl = PooledRESTClientImpl(pool_maxsize=100)
+
+        self.impl = impl
+        self.semaphore = BoundedSemaphore(concurrency) if concurrency else None
+
+    def call(self, method, url, **kwargs):
+        """Make a REST request in the current greenlet, waiting for a free slot if needed.
+        Returns a :class:`usergrid.rest.RESTResponse`.
+        """
+
+        if self.semaphore is None:
+            return self.impl.request(method, url, **kwargs)
+
+        with self.semaphore:
+            return self.impl.request(method, url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Make an asynchronous REST request.
+        Returns a ``gevent.Greenlet``. Its ``get()`` method returns the
+        :class:`usergrid.rest.RESTResponse` or raises the request error.
+
+        :param method: The http method of the request.
+        :param url:  The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return gevent.spawn(self.call, method, url, **kwargs)
+
+
+class AsyncRESTClient(object):
+    """A class with all static methods to perform asynchronous JSON REST requests.
+    """
+
+    IMPL = AsyncRESTClientImpl()
+
+    @classmethod
+    def get(cls, url, **kwargs):
+        """Make an asynchronous GET request.
+        Returns a ``gevent.Greenlet``.
+
+        :param url: The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return cls.IMPL.request('GET', url, **kwargs)
+
+    @classmethod
+    def post(cls, url, data=None, **kwargs):
+        """Make an asynchronous POST request.
+        Returns a ``gevent.Greenlet``.
+
+        :param url: The url of the request.
+        :param data: (optional) A dictionary of the post parameters. Default to None.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return cls.IMPL.request('POST', url, data=data, **kwargs)
+
+    @classmethod
+    def using(cls, impl):
+        """Build an AsyncRESTClient class that performs its requests with a specific implementation.
+        Returns a subclass of this class.
+
+        :param impl: An :class:`AsyncRESTClientImpl` object.
+        """
+
+        return type(cls.__name__, (cls,), {'IMPL': impl})
+
+
+class AsyncUsergridSession(UsergridSession):
+    """A Usergrid session that authenticates asynchronously. Concurrent greenlets
+    needing a token share a single authentication request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncUsergridSession, self).__init__(*args, **kwargs)
+        self._auth_greenlet = None
+
+    def authenticate(self, force=False):
+        """Authenticate the session based on the auth_level defined.
+        Returns a ``gevent.Greenlet``. Its ``get()`` method raises the authentication error, if any.
+
+        :param force: (optional) whether to authenticate even if the session already has a valid token.
+        """
+
+        greenlet = self._auth_greenlet
+        if greenlet is None or greenlet.ready():
+            greenlet = gevent.spawn(super(AsyncUsergridSession, self).authenticate, force=force)
+            self._auth_greenlet = greenlet
+
+        return greenlet
+
+    def build_access_headers(self):
+        """Build access headers for a future request, waiting for the authentication if needed.
+        Returns a tuple of (headers, params).
+        """
+
+        if not self.tokens.is_valid():
+            self.authenticate(force=True).get()
+
+        return super(AsyncUsergridSession, self).build_access_headers()
+
+
+class AsyncBaseClient(BaseClient):
+
+    def __init__(self, session, rest_client=None):
+        """Construct an ``AsyncBaseClient`` instance.
+
+        :param session: an instance of :class:`AsyncUsergridSession`
+        :param rest_client: Optional :class:`AsyncRESTClient` object for making requests.
+        """
+
+        if rest_client is None: rest_client = AsyncRESTClient
+
+        super(AsyncBaseClient, self).__init__(session, rest_client=rest_client)
+
+    def get(self, target, params=None):
+        """Make an asynchronous GET request on a target.
+        Returns a ``gevent.Greenlet``.
+
+        :param target: a target url (ie. '/users').
+        :param params: (optional) a dictionary of parameters.
+        """
+
+        return gevent.spawn(self._get, target, params)
+
+    def _get(self, target, params):
+        return self.call(target,
+                         lambda url, headers, params: self.rest.IMPL.call('GET', url, headers=headers),
+                         params, method='GET')
+
+    def post(self, target, data=None):
+        """Make an asynchronous POST request on a target.
+        Returns a ``gevent.Greenlet``.
+
+        :param target: a target url (ie. '/users').
+        :param data: (optional) A dictionary of the post parameters.
+        """
+
+        return gevent.spawn(self._post, target, data)
+
+    def _post(self, target, data):
+        return self.call(target,
+                         lambda url, headers, params: self.rest.IMPL.call('POST', url, data=data,
+                                                                          params=params,
+                                                                          headers=headers))
+
+    def gather(self, calls, concurrency=None, raise_error=True):
+        """Run callables concurrently with a bounded number in flight.
+        See :func:`usergrid.asynchronous.gather`.
+        """
+
+        return gather(calls, concurrency=concurrency, raise_error=raise_error)
+
+
+class AsyncApplicationClient(AsyncBaseClient):
+    """The asynchronous version of :class:`usergrid.clients.ApplicationClient`.
+    """
+
+    def get_entity(self, collection, entity_id):
+        """Fetch an entity by uuid or name.
+        Returns a ``gevent.Greenlet``.
+
+        :param collection: the collection name (ie. 'users').
+        :param entity_id: the uuid or the name of the entity.
+        """
+
+        return self.get('/%s/%s' % (collection, entity_id))
+
+    def get_entities(self, collection, entity_ids, concurrency=50, raise_error=True):
+        """Fetch many entities with at most ``concurrency`` requests in flight.
+        Returns the list of :class:`usergrid.rest.RESTResponse` in the same order as ``entity_ids``.
+
+        :param collection: the collection name (ie. 'users').
+        :param entity_ids: the uuids or the names of the entities.
+        :param concurrency: (optional) The maximum number of requests in flight. Default to 50.
+        :param raise_error: (optional) Whether the first error is raised. If False, the exceptions are
+            returned in place of the responses. Default to True.
+        """
+
+        calls = [lambda entity_id=entity_id: self._get('/%s/%s' % (collection, entity_id), None)
+                 for entity_id in entity_ids]
+
+        return self.gather(calls, concurrency=concurrency, raise_error=raise_error)
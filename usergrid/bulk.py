@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.bulk
+~~~~~~~~~~~~~
+
+This module contains the bulk writer. It creates many entities with few
+requests by posting them as JSON arrays.
+"""
+
+import threading
+
+from .exceptions import UsergridException
+from .utils import parallel_map
+
+
+class BulkResult(object):
+    """A class that represents the per-entity outcome of bulk writes.
+    """
+
+    def __init__(self):
+        """Construct an empty BulkResult."""
+
+        self.succeeded = []
+        self.failed = []
+
+    def add_success(self, entity, created):
+        """Record an entity that was created.
+
+        :param entity: The entity that was sent.
+        :param created: The entity returned by the server (with its uuid).
+        """
+        self.succeeded.append((entity, created))
+
+    def add_failure(self, entity, error):
+        """Record an entity that could not be created.
+
+        :param entity: The entity that was sent.
+        :param error: The exception of the failure (ie. a :class:`usergrid.exceptions.UsergridException`).
+        """
+        self.failed.append((entity, error))
+
+    def update(self, other):
+        """Merge another BulkResult into this one."""
+        self.succeeded.extend(other.succeeded)
+        self.failed.extend(other.failed)
+
+    @property
+    def ok(self):
+        """Whether all the entities were created."""
+        return not self.failed
+
+    def __len__(self):
+        return len(self.succeeded) + len(self.failed)
+
+    def __repr__(self):
+        return '<BulkResult [%d succeeded, %d failed]>' % (len(self.succeeded), len(self.failed))
+
+
+class BulkWriter(object):
+    """A writer collecting entities and creating them in chunks.
+
+    Each chunk is sent as a single JSON array POST and several chunks are sent in parallel. The
+    writer flushes automatically once ``chunk_size * concurrency`` entities are pending, and when
+    used as a context manager.
+
+    """
+
+    def __init__(self, client, collection, chunk_size=100, concurrency=4):
+        """Construct a BulkWriter.
+
+        :param client: A :class:`usergrid.clients.BaseClient` object.
+        :param collection: The collection name (ie. 'users').
+        :param chunk_size: (optional) The number of entities per request. Default to 100.
+        :param concurrency: (optional) The number of requests sent in parallel. Default to 4.
+        """
+
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be greater than 0")
+
+        self.client = client
+        self.collection = collection
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.result = BulkResult()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, entity):
+        """Add an entity to create.
+
+        :param entity: A dictionary of the entity properties.
+        """
+
+        with self._lock:
+            self._pending.append(entity)
+            full = len(self._pending) >= self.chunk_size * self.concurrency
+
+        if full:
+            self.flush()
+
+    def extend(self, entities):
+        """Add many entities to create.
+
+        :param entities: An iterable of entities.
+        """
+
+        for entity in entities:
+            self.add(entity)
+
+    def chunks(self, entities):
+        """Split entities into chunks of ``chunk_size``.
+        Returns a list of lists.
+        """
+
+        return [entities[i:i + self.chunk_size] for i in xrange(0, len(entities), self.chunk_size)]
+
+    def send_chunk(self, chunk):
+        """Create a chunk of entities with a single request.
+        Returns a :class:`BulkResult`.
+
+        :param chunk: A list of entities.
+        """
+
+        result = BulkResult()
+
+        # any error fails the chunk, so its entities, already taken from the pending ones, are
+        # reported
+        try:
+            res = self.client.post_json('/%s' % self.collection, chunk)
+            created = res.data.get('entities', [])
+        except Exception, e:
+            for entity in chunk:
+                result.add_failure(entity, e)
+            return result
+
+        for i, entity in enumerate(chunk):
+            if i < len(created):
+                result.add_success(entity, created[i])
+            else:
+                result.add_failure(entity, UsergridException("Entity missing from the response"))
+
+        return result
+
+    def flush(self):
+        """Send all the pending entities.
+        Returns a :class:`BulkResult` of the flushed entities. The outcome is also merged into
+        ``self.result``.
+        """
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        result = BulkResult()
+        for chunk_result in parallel_map(self.send_chunk, self.chunks(pending), self.concurrency):
+            result.update(chunk_result)
+
+        with self._lock:
+            self.result.update(result)
+
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.cache
+~~~~~~~~~~~~~~
+
+This module contains the response cache of the REST clients. It is enabled
+with the ``cache`` argument of :class:`usergrid.rest.RESTClientImpl`.
+"""
+
+import threading
+import time
+import urllib
+import urlparse
+from collections import OrderedDict
+
+from . import metrics
+
+
+def cache_key(url):
+    """Build the cache key of a url: the url without its ``token`` parameter.
+    Returns a tuple of (path, query).
+
+    :param url: The url of the request.
+    """
+
+    parts = urlparse.urlsplit(url)
+    query = [(k, v) for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True)
+             if k != 'token']
+
+    return '%s://%s%s' % (parts.scheme, parts.netloc, parts.path.rstrip('/')), urllib.urlencode(query)
+
+
+class CacheEntry(object):
+    """A cached response. The http response is kept, with its raw body, and a new
+    :class:`usergrid.rest.RESTResponse` is built for every hit, so a caller modifying the decoded
+    data of its response does not change the cached one.
+    """
+
+    def __init__(self, response, size, expires_at):
+        """Construct a CacheEntry.
+
+        :param response: The ``requests.Response`` object, with its body read.
+        :param size: The size of the response body in bytes.
+        :param expires_at: The unix timestamp after which the entry must be revalidated.
+        """
+
+        self.response = response
+        self.size = size
+        self.expires_at = expires_at
+        self.etag = response.headers.get('etag')
+        self.last_modified = response.headers.get('last-modified')
+
+    def is_fresh(self, now=None):
+        """Return whether the entry can be used without revalidation."""
+        return (time.time() if now is None else now) < self.expires_at
+
+    def validators(self):
+        """Return the headers of a conditional request revalidating the entry."""
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """An LRU cache of GET responses, bounded in entries and in bytes.
+
+    The entries are keyed by url, ignoring the access token, so a cache must only be shared by the
+    clients of a single principal. An entry older than ``ttl`` is revalidated with a conditional
+    request when the server sent an ``ETag`` or a ``Last-Modified`` header, and fetched again
+    otherwise. A PUT or a POST invalidates the entries of its path, of the paths below and above it
+    (ie. the collection) and of the entities it returns.
+
+    Usergrid itself sends neither header, so its entries are fetched again in full once older than
+    ``ttl``: the cache saves the requests made within ``ttl``, not the transfer of the stale
+    entries. The ``modified`` timestamp of the entities is not used to revalidate them, as a query
+    on it does not detect the deleted entities and returns the modified ones in full anyway.
+
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=10 * 1024 * 1024, ttl=60):
+        """Construct a ResponseCache.
+
+        :param max_entries: (optional) The maximum number of cached responses. Default to 1000.
+        :param max_bytes: (optional) The maximum total size of the cached responses. Default to 10MB.
+        :param ttl: (optional) The number of seconds a response is used without revalidation. Default to 60.
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return the counters of the cache as a dictionary."""
+
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+        }
+
+    def _count(self, name, url):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+        if metrics.hooks.listeners:
+            result = {'hits': 'hit', 'misses': 'miss', 'revalidations': 'revalidated'}[name]
+            metrics.hooks.emit('cache', cache=result, url=cache_key(url)[0])
+
+    def get(self, key):
+        """Return the entry of a key (or None), marking it as recently used."""
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def put(self, key, response, size):
+        """Cache a response, evicting the least recently used entries if needed.
+
+        :param key: The cache key of the request.
+        :param response: The ``requests.Response`` object, with its body read.
+        :param size: The size of the response body in bytes.
+        """
+
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(response, size, time.time() + self.ttl)
+            self.size += size
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def invalidate(self, url, response=None):
+        """Remove the entries made stale by a write on a url.
+
+        :param url: The url of the write request.
+        :param response: (optional) The :class:`usergrid.rest.RESTResponse` of the write request.
+        """
+
+        path = cache_key(url)[0]
+        paths = set([path])
+
+        if response is not None:
+            base = path.rsplit('/', 1)[0]
+            for entity in response.data.get('entities', []):
+                for name in ('uuid', 'name'):
+                    if entity.get(name):
+                        paths.add('%s/%s' % (base, entity[name]))
+                        paths.add('%s/%s' % (path, entity[name]))
+
+        with self._lock:
+            for key in list(self._entries):
+                cached = key[0]
+                for p in paths:
+                    if cached == p or cached.startswith(p + '/') or p.startswith(cached + '/'):
+                        self._remove(key)
+                        break
+
+    def clear(self):
+        """Remove all the entries."""
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def request(self, impl, method, url, **kwargs):
+        """Make a REST request through the cache.
+        Returns a :class:`usergrid.rest.RESTResponse`.
+
+        :param impl: The :class:`usergrid.rest.RESTClientImpl` making the requests.
+        :param method: The http method of the request.
+        :param url:  The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        if method != 'GET':
+            response = impl.build_response(impl.perform(method, url, **kwargs))
+            if method in ('PUT', 'POST', 'DELETE'):
+                self.invalidate(url, response)
+            return response
+
+        if kwargs.get('stream'):
+            return impl.build_response(impl.perform(method, url, **kwargs), stream=True)
+
+        key = cache_key(url)
+        entry = self.get(key)
+
+        if entry is not None and entry.is_fresh():
+            self._count('hits', url)
+            return impl.build_response(entry.response)
+
+        if entry is not None and entry.validators():
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.update(entry.validators())
+            res = impl.perform(method, url, headers=headers, **kwargs)
+
+            if res.status_code == 304:
+                self._count('revalidations', url)
+                with self._lock:
+                    entry.expires_at = time.time() + self.ttl
+                return impl.build_response(entry.response)
+        else:
+            res = impl.perform(method, url, **kwargs)
+
+        self._count('misses', url)
+        response = impl.build_response(res)
+        self.put(key, res, len(res.content))
+
+        return response
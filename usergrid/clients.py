@@ -7,8 +7,14 @@ usergrid.clients
 This module contains the usergrid clients.
 """
 
+import json
+import threading
+import urllib
+import uuid
+
 from .sessions import BaseSession, UsergridSession
-from .rest import RESTClient
+from .exceptions import ConflictError, RESTError
+from .utils import parallel_map
 
 class BaseClient(object):
 
@@ -18,15 +24,17 @@ class BaseClient(object):
 
         :param session: an instance of :class:`UsergridSession`
         :param rest_client: Optional :class:`usergrid.rest.RESTClient` object to for making requests.
+            (ie. :class:`usergrid.rest.PooledRESTClient` to reuse connections). Default to the
+            REST client of the session.
         """
 
-        if rest_client is None: rest_client = RESTClient
-
         if isinstance(session, BaseSession):
             self.session = session
         else:
             raise ValueError("'session' must be a UsergridSession")
 
+        if rest_client is None: rest_client = session.rest_client
+
         self.rest = rest_client
 
     def request(self, target, params=None, method='POST'):
@@ -36,11 +44,11 @@ class BaseClient(object):
 
         assert method in ['GET','POST', 'PUT'], "Only 'GET', 'POST', and 'PUT' are allowed."
 
-        if params is None:
-            params = {}
-
         headers, access_params = self.session.build_access_headers()
-        params =  dict(params.items() + access_params.items())
+        if not params:
+            params = access_params
+        elif access_params:
+            params = dict(params, **access_params)
 
         if method in ('GET', 'PUT'):
             url = self.session.build_url(target, params)
@@ -49,17 +57,431 @@ class BaseClient(object):
 
         return url, headers, params
 
+    def call(self, target, func, params=None, method='POST'):
+        """Make a request on a target. If the server rejects the access token because it expired,
+        the session authenticates again and the request is retried once.
+        Returns the value returned by ``func``.
+
+        :param target: a target url (ie. '/users').
+        :param func: a function taking the (url, headers, params) of the request and making it.
+        :param params: (optional) a dictionary of parameters.
+        :param method: (optional) the http method of the request. Default to 'POST'.
+        """
+
+        for retry in (False, True):
+            url, headers, request_params = self.request(target, params, method=method)
+            token = self.session.token
+            try:
+                return func(url, headers, request_params)
+            except RESTError, e:
+                if retry or not e.is_token_expired():
+                    raise
+                self.session.invalidate_token(token)
+
+    def get(self, target, params=None):
+        """Make a GET request on a target.
+        Returns a :class:`usergrid.rest.RESTResponse`.
+
+        :param target: a target url (ie. '/users').
+        :param params: (optional) a dictionary of parameters.
+        """
+
+        return self.call(target,
+                         lambda url, headers, params: self.rest.get(url, headers=headers),
+                         params, method='GET')
+
+    def stream(self, target, params=None):
+        """Make a GET request on a target and stream its entities.
+        Returns a :class:`usergrid.rest.RESTStreamResponse`.
+
+        :param target: a target url (ie. '/users').
+        :param params: (optional) a dictionary of parameters.
+        """
+
+        return self.call(target,
+                         lambda url, headers, params: self.rest.stream(url, headers=headers),
+                         params, method='GET')
+
+    def post_json(self, target, payload, params=None):
+        """Make a POST request on a target with a JSON body.
+        Returns a :class:`usergrid.rest.RESTResponse`.
+
+        :param target: a target url (ie. '/users').
+        :param payload: the object to send as JSON (ie. a list of entities).
+        :param params: (optional) a dictionary of parameters.
+        """
+
+        return self.call(target,
+                         lambda url, headers, params: self.rest.post_json(url, payload,
+                                                                          params=params,
+                                                                          headers=headers),
+                         params)
+
+    def put_json(self, target, payload, params=None):
+        """Make a PUT request on a target with a JSON body.
+        Returns a :class:`usergrid.rest.RESTResponse`.
+
+        :param target: a target url (ie. '/users/bob').
+        :param payload: the object to send as JSON (ie. the changed properties of an entity).
+        :param params: (optional) a dictionary of parameters (ie. a 'ql' selecting the entities).
+        """
+
+        return self.call(target,
+                         lambda url, headers, params: self.rest.put_json(url, payload,
+                                                                         headers=headers),
+                         params, method='PUT')
+
+
+class GetManyResult(list):
+    """The entities returned by :meth:`ApplicationClient.get_many`, in the order of the requested
+    uuids. The entities that were not found are None and their uuids are listed in ``missing``.
+    """
+
+    def __init__(self, entities, missing):
+        super(GetManyResult, self).__init__(entities)
+        self.missing = missing
+
+
+class SaveManyResult(list):
+    """The entities saved by :meth:`ApplicationClient.save_many`. The entities that were not found
+    on the server (ie. deleted since they were fetched) are not saved: they are listed in
+    ``missing`` and keep their changes.
+    """
+
+    def __init__(self, entities, missing):
+        super(SaveManyResult, self).__init__(entities)
+        self.missing = missing
+
 
 class ApplicationClient(BaseClient):
     """This class lets you make API calls to manage a Usergrid application. You'll need to obtain an
     OAuth2 access token first. You can get an access token using :class:`UsergridSession`
     """
 
+    #: The maximum length of the urls built by :meth:`get_many`.
+    MAX_URL_LENGTH = 2048
+
+    #: The fields managed by the server, never sent by :meth:`save`.
+    SERVER_FIELDS = ('uuid', 'type', 'created', 'modified', 'metadata')
+
     def __init__(self, *args, **kwargs):
         super(ApplicationClient, self).__init__(*args, **kwargs)
+        self._event_queues = {}
+        self._lock = threading.Lock()
 
     def test(self):
 
         url, headers, params = self.request('/users')
 
-        return self.rest.get(url)
+        return self.rest.get(url, headers=headers)
+
+    def iter_collection(self, collection, ql=None, limit=100, cursor=None, prefetch=True,
+                        stream=False):
+        """Iterate over the entities of a collection, following the cursors.
+        Returns a :class:`usergrid.iterators.CollectionIterator`.
+
+        :param collection: the collection name (ie. 'users').
+        :param ql: (optional) a Usergrid query (ie. "select * where age > 20").
+        :param limit: (optional) the number of entities per page. Default to 100.
+        :param cursor: (optional) the cursor to start from.
+        :param prefetch: (optional) whether the next page is fetched in the background. Default to True.
+        :param stream: (optional) whether the entities are decoded while the pages are read. Default to False.
+        """
+
+        from .iterators import CollectionIterator
+
+        return CollectionIterator(self, collection,
+                                  ql=ql,
+                                  limit=limit,
+                                  cursor=cursor,
+                                  prefetch=prefetch,
+                                  stream=stream)
+
+    def scan(self, collection, partitions=16, concurrency=4, where=None, limit=100):
+        """Scan a collection with concurrent cursor chains over ranges of ``created`` timestamps.
+        Returns a :class:`usergrid.iterators.PartitionedScan`.
+
+        :param collection: the collection name (ie. 'users').
+        :param partitions: (optional) the number of partitions. Default to 16.
+        :param concurrency: (optional) the number of partitions walked at the same time. Default to 4.
+        :param where: (optional) a condition selecting the entities (ie. "age > 20").
+        :param limit: (optional) the number of entities per page. Default to 100.
+        """
+
+        from .iterators import PartitionedScan
+
+        return PartitionedScan(self, collection,
+                               partitions=partitions,
+                               concurrency=concurrency,
+                               where=where,
+                               limit=limit)
+
+    def bulk_writer(self, collection, chunk_size=100, concurrency=4):
+        """Create entities in chunks of JSON array POSTs.
+        Returns a :class:`usergrid.bulk.BulkWriter`.
+
+        :param collection: the collection name (ie. 'users').
+        :param chunk_size: (optional) the number of entities per request. Default to 100.
+        :param concurrency: (optional) the number of requests sent in parallel. Default to 4.
+        """
+
+        from .bulk import BulkWriter
+
+        return BulkWriter(self, collection, chunk_size=chunk_size, concurrency=concurrency)
+
+    def event_queue(self, batch_size=100, flush_interval=1.0, max_size=10000, overflow='block',
+                    spill_path=None):
+        """Post the events and counters in the background, in batches.
+        Returns a :class:`usergrid.events.EventQueue`.
+
+        :param batch_size: (optional) the maximum number of events per request. Default to 100.
+        :param flush_interval: (optional) the maximum number of seconds an event waits. Default to 1.
+        :param max_size: (optional) the maximum number of queued events. Default to 10000.
+        :param overflow: (optional) the overflow policy: 'block', 'drop' or 'spill'. Default to 'block'.
+        :param spill_path: (optional) the spill file of the 'spill' policy.
+
+        The queue is kept by the client: the next calls with the same arguments return it, until
+        it is closed.
+        """
+
+        from .events import EventQueue
+
+        key = (batch_size, flush_interval, max_size, overflow, spill_path)
+        with self._lock:
+            queue = self._event_queues.get(key)
+            if queue is None or queue.closed:
+                queue = self._event_queues[key] = EventQueue(self,
+                                                             batch_size=batch_size,
+                                                             flush_interval=flush_interval,
+                                                             max_size=max_size,
+                                                             overflow=overflow,
+                                                             spill_path=spill_path)
+            return queue
+
+    def replica(self, collection, path=None, indexes=(), max_staleness=60, sync_interval=None,
+                full_sync_interval=None):
+        """Keep a local replica of a read-mostly collection, synced incrementally.
+        Returns a :class:`usergrid.replicas.CollectionReplica`.
+
+        :param collection: the collection name (ie. 'roles').
+        :param path: (optional) the path of the sqlite database. Default to an in-memory database.
+        :param indexes: (optional) the names of the indexed properties.
+        :param max_staleness: (optional) the maximum age of the replica served, in seconds. Default to 60.
+        :param sync_interval: (optional) the number of seconds between background syncs.
+        :param full_sync_interval: (optional) the number of seconds between full syncs.
+        """
+
+        from .replicas import CollectionReplica
+
+        return CollectionReplica(self, collection,
+                                 path=path,
+                                 indexes=indexes,
+                                 max_staleness=max_staleness,
+                                 sync_interval=sync_interval,
+                                 full_sync_interval=full_sync_interval)
+
+    def get_many(self, collection, uuids, concurrency=4, max_url_length=None):
+        """Fetch many entities by uuid with as few queries as the url length allows.
+        The queries are sent concurrently.
+        Returns a :class:`GetManyResult`.
+
+        :param collection: the collection name (ie. 'users').
+        :param uuids: the uuids of the entities.
+        :param concurrency: (optional) the number of queries sent in parallel. Default to 4.
+        :param max_url_length: (optional) the maximum length of the urls. Default to ``MAX_URL_LENGTH``.
+        """
+
+        uuids = list(uuids)
+        wanted = []
+        for value in uuids:
+            try:
+                wanted.append(str(uuid.UUID(value)))
+            except (TypeError, ValueError, AttributeError):
+                raise ValueError("Invalid uuid: %r" % (value,))
+
+        batches = self.uuid_batches(collection, sorted(set(wanted)),
+                                    max_url_length or self.MAX_URL_LENGTH)
+
+        found = {}
+        for res in parallel_map(lambda batch: self.get('/%s' % collection, self._uuid_query(batch)),
+                                batches, concurrency):
+            for entity in res.iter_entities():
+                found[str(entity.get('uuid', '')).lower()] = entity
+
+        return GetManyResult([found.get(value) for value in wanted],
+                             [original for original, value in zip(uuids, wanted) if value not in found])
+
+    def _payload(self, entity):
+        from .entities import Entity
+
+        if not isinstance(entity, Entity):
+            raise ValueError("Expected an Entity, got %r" % (entity,))
+        changes = entity.changes()
+        for field in self.SERVER_FIELDS:
+            changes.pop(field, None)
+        return changes
+
+    def _saved(self, entity, data):
+        if data is not None and data.get('modified') is not None:
+            entity._set('modified', data['modified'])
+        entity.mark_clean()
+
+    def save(self, collection, entity, check_modified=False):
+        """Save the changes of a fetched entity with a PUT of only the changed properties. The
+        deleted properties are sent as null. Nothing is sent if the entity has no changes.
+        Returns the entity, with its new ``modified`` timestamp.
+
+        :param collection: the collection name (ie. 'users').
+        :param entity: a :class:`usergrid.entities.Entity` with a uuid or a name.
+        :param check_modified: (optional) whether to raise a :class:`usergrid.exceptions.ConflictError`
+            instead of saving, if the entity was modified on the server since it was fetched. The
+            check is a GET before the PUT, so a concurrent update between the two is not detected.
+            Default to False.
+        """
+
+        payload = self._payload(entity)
+        if not payload:
+            entity.mark_clean()
+            return entity
+
+        entity_id = entity.uuid or entity.name
+        if entity_id is None:
+            raise ValueError("The entity to save has no uuid nor name")
+        target = '/%s/%s' % (collection, urllib.quote(entity_id, ''))
+
+        if check_modified:
+            current = self.get(target).data['entities'][0]
+            if current.get('modified') != entity.modified:
+                raise ConflictError([entity], "The entity %s was modified on the server" % entity_id)
+
+        res = self.put_json(target, payload)
+        entities = res.data.get('entities')
+        self._saved(entity, entities[0] if entities else None)
+        return entity
+
+    def save_many(self, collection, entities, concurrency=4, check_modified=False,
+                  max_url_length=None):
+        """Save the changes of many fetched entities. The entities with the same changes (ie. a
+        status set on many entities) are updated together, with a PUT on the collection selecting
+        their uuids, as few as the url length allows. The requests are sent concurrently.
+        Returns a :class:`SaveManyResult` of the saved entities, listing the entities not found on
+        the server in ``missing``.
+
+        :param collection: the collection name (ie. 'users').
+        :param entities: the :class:`usergrid.entities.Entity` objects, with a uuid.
+        :param concurrency: (optional) the number of requests sent in parallel. Default to 4.
+        :param check_modified: (optional) whether to raise a :class:`usergrid.exceptions.ConflictError`,
+            before saving any entity, if some of them were modified on the server since they were
+            fetched. See :meth:`save`. Default to False.
+        :param max_url_length: (optional) the maximum length of the urls. Default to ``MAX_URL_LENGTH``.
+        """
+
+        groups = {}
+        changed = []
+        for entity in entities:
+            payload = self._payload(entity)
+            if not payload:
+                entity.mark_clean()
+                continue
+            if entity.uuid is None:
+                raise ValueError("The entity to save has no uuid: %r" % (entity,))
+            key = json.dumps(payload, sort_keys=True)
+            groups.setdefault(key, (payload, []))[1].append(entity)
+            changed.append(entity)
+
+        if check_modified and changed:
+            current = self.get_many(collection, [entity.uuid for entity in changed],
+                                    concurrency=concurrency, max_url_length=max_url_length)
+            conflicts = [entity for entity, data in zip(changed, current)
+                         if data is None or data.get('modified') != entity.modified]
+            if conflicts:
+                raise ConflictError(conflicts, "%d entities were modified on the server" % len(conflicts))
+
+        puts = []
+        for payload, group in groups.itervalues():
+            if len(group) == 1:
+                puts.append((group, '/%s/%s' % (collection, group[0].uuid), payload, None))
+                continue
+            by_uuid = dict((str(entity.uuid).lower(), entity) for entity in group)
+            for batch in self.uuid_batches(collection, sorted(by_uuid),
+                                           max_url_length or self.MAX_URL_LENGTH):
+                puts.append(([by_uuid[value] for value in batch], '/%s' % collection, payload,
+                                 self._uuid_query(batch)))
+
+        def put(request):
+            group, target, payload, params = request
+            try:
+                res = self.put_json(target, payload, params)
+            except RESTError, e:
+                if params is None and e.status == 404:
+                    return group
+                raise
+            updated = dict((str(data.get('uuid', '')).lower(), data)
+                           for data in res.data.get('entities') or [])
+
+            # a PUT on a query only updates the entities it finds
+            missing = []
+            for entity in group:
+                data = updated.get(str(entity.uuid).lower())
+                if data is None and params is not None:
+                    missing.append(entity)
+                else:
+                    self._saved(entity, data)
+            return missing
+
+        missing = set(id(entity) for group in parallel_map(put, puts, concurrency) for entity in group)
+        return SaveManyResult([entity for entity in changed if id(entity) not in missing],
+                              [entity for entity in changed if id(entity) in missing])
+
+    def _uuid_query(self, uuids):
+        return {
+            'ql': 'select * where ' + ' or '.join('uuid = %s' % value for value in uuids),
+            'limit': len(uuids),
+        }
+
+    def uuid_batches(self, collection, uuids, max_url_length):
+        """Split uuids into batches whose query url fits in ``max_url_length``.
+        Returns a list of lists of uuids.
+
+        :param collection: the collection name (ie. 'users').
+        :param uuids: the uuids (normalized) of the entities.
+        :param max_url_length: the maximum length of the urls.
+        """
+
+        def url_length(batch):
+            url, headers, params = self.request('/%s' % collection, self._uuid_query(batch), method='GET')
+            return len(url)
+
+        batches = []
+        batch = []
+        length = 0
+
+        for value in uuids:
+            if not batch:
+                batch = [value]
+                length = url_length(batch)
+                continue
+            # each uuid adds a " or uuid = <uuid>" clause, and may lengthen the limit
+            extra = len(urllib.quote_plus(' or uuid = %s' % value)) + 1
+            if length + extra > max_url_length:
+                batches.append(batch)
+                batch = [value]
+                length = url_length(batch)
+            else:
+                batch.append(value)
+                length += extra
+
+        if batch:
+            batches.append(batch)
+
+        # check the estimations against the real urls
+        checked = []
+        while batches:
+            batch = batches.pop(0)
+            if len(batch) > 1 and url_length(batch) > max_url_length:
+                middle = len(batch) // 2
+                batches[0:0] = [batch[:middle], batch[middle:]]
+            else:
+                checked.append(batch)
+
+        return checked
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.coalescing
+~~~~~~~~~~~~~~~~~~~
+
+This module contains the request coalescer of the REST clients. It is enabled
+with the ``coalescer`` argument of :class:`usergrid.rest.RESTClientImpl`.
+"""
+
+import hashlib
+import sys
+import threading
+import urlparse
+
+from .cache import cache_key
+
+
+def _items(mapping):
+    """Return the items of a mapping as a hashable tuple, the list values as tuples."""
+
+    if not mapping:
+        return ()
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value)
+                        for key, value in mapping.iteritems()))
+
+
+class _Call(object):
+
+    def __init__(self, event):
+        self.event = event
+        self.result = None
+        self.exc_info = None
+
+
+class RequestCoalescer(object):
+    """A class that makes concurrent identical GET requests share a single http request.
+
+    The first caller makes the request and the callers arriving while it is in flight wait for it:
+    they all get a :class:`usergrid.rest.RESTResponse` of the same http response (or the same
+    error), each decoding its own data, so a caller modifying its data does not change the data of
+    the others. Requests are
+    identical when they have the same url, the same access token and the same headers, so the
+    requests of different principals are never shared.
+
+    The waiters block on ``threading.Event``. Greenlets (see ``usergrid.asynchronous``) can share
+    requests too once ``threading`` is monkey-patched, or with ``event_factory=gevent.event.Event``.
+
+    """
+
+    def __init__(self, event_factory=threading.Event):
+        """Construct a RequestCoalescer.
+
+        :param event_factory: (optional) The factory of the events the waiters block on. Default
+            to ``threading.Event``.
+        """
+
+        self.event_factory = event_factory
+        self.requests = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Return the counters of the coalescer as a dictionary."""
+
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls),
+        }
+
+    def key(self, url, headers=None, params=None):
+        """Build the key identifying identical requests.
+
+        :param url: The url of the request.
+        :param headers: (optional) The headers of the request.
+        :param params: (optional) The query parameters of the request, if not in the url.
+        """
+
+        # the token is hashed, to avoid keeping it in the key
+        token = urlparse.parse_qs(urlparse.urlsplit(url).query).get('token')
+        if token is not None:
+            token = hashlib.sha1(token[0]).hexdigest()
+
+        return (cache_key(url), token, _items(headers), _items(params))
+
+    def do(self, key, func, share=None):
+        """Call a function, unless a call with the same key is in flight: wait for its result instead.
+        Returns the result of the function or raises its exception.
+
+        :param key: The key of the request (see :meth:`key`).
+        :param func: The function making the request.
+        :param share: (optional) A function building the result of a waiter from the result of the
+            call. Default to returning the same result to all the callers.
+        """
+
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(self.event_factory())
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception:
+                call.exc_info = sys.exc_info()
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+        else:
+            call.event.wait()
+
+        if call.exc_info is not None:
+            raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+
+        if not leader and share is not None:
+            return share(call.result)
+        return call.result
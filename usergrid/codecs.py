@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.codecs
+~~~~~~~~~~~~~~~
+
+This module contains the JSON codecs used to encode the request bodies and
+decode the responses. The fastest installed codec is used by default:
+``ujson``, then ``simplejson``, then the standard ``json`` module.
+"""
+
+import json
+
+
+class JSONCodec(object):
+    """A class that represents a JSON codec.
+    """
+
+    def __init__(self, name, loads, dumps):
+        """Construct a JSONCodec.
+
+        :param name: The name of the codec (ie. 'ujson').
+        :param loads: A function decoding a JSON string.
+        :param dumps: A function encoding an object to a JSON string.
+        """
+
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return '<JSONCodec [%s]>' % self.name
+
+
+def load_codec(name):
+    """Load a codec by its module name.
+    Returns a :class:`JSONCodec`, or raises an ``ImportError`` if the module is not installed.
+
+    :param name: 'ujson', 'simplejson' or 'json'.
+    """
+
+    if name == 'json':
+        return JSONCodec('json', json.loads, json.dumps)
+
+    if name not in ('ujson', 'simplejson'):
+        raise ValueError("Unknown JSON codec: %s" % name)
+
+    module = __import__(name)
+    return JSONCodec(name, module.loads, module.dumps)
+
+
+def _default_codec():
+    for name in ('ujson', 'simplejson'):
+        try:
+            return load_codec(name)
+        except ImportError:
+            pass
+    return load_codec('json')
+
+
+# the default codec is picked, and its module imported, by the first encoding or decoding
+_codec = None
+
+
+def get_codec():
+    """Return the :class:`JSONCodec` in use."""
+
+    global _codec
+
+    if _codec is None:
+        _codec = _default_codec()
+
+    return _codec
+
+
+def set_codec(codec):
+    """Change the JSON codec in use.
+
+    :param codec: A :class:`JSONCodec` or the name of a codec (ie. 'json').
+    """
+
+    global _codec
+
+    if not isinstance(codec, JSONCodec):
+        codec = load_codec(codec)
+
+    _codec = codec
+
+
+def loads(s):
+    """Decode a JSON string with the codec in use."""
+    return (_codec or get_codec()).loads(s)
+
+
+def dumps(obj):
+    """Encode an object to a JSON string with the codec in use."""
+    return (_codec or get_codec()).dumps(obj)
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.entities
+~~~~~~~~~~~~~~~~~
+
+This module contains the compact representations of the usergrid entities:
+:class:`Entity`, a single entity with slots for the standard fields, and
+:class:`EntitySet`, a columnar set of entities for large result sets.
+"""
+
+import struct
+import uuid
+from array import array
+
+
+class Entity(object):
+    """A class that represents a usergrid entity.
+
+    The standard fields are stored in slots and the custom properties in a small overflow
+    dictionary, so an entity takes a fraction of the memory of its JSON dictionary. An entity
+    behaves like a read/write mapping of all its properties. None is not a value: setting a
+    property, standard or custom, to None removes it.
+
+    The properties set or deleted after construction are tracked, so that
+    :meth:`usergrid.clients.ApplicationClient.save` sends only the changes. The changes made inside
+    a mutable value (ie. appending to a list property) are not tracked: set the property again, or
+    call :meth:`mark_changed`.
+
+    """
+
+    #: The standard usergrid fields, stored in slots.
+    FIELDS = ('uuid', 'type', 'name', 'created', 'modified', 'metadata')
+
+    __slots__ = FIELDS + ('_properties', '_changes')
+
+    def __init__(self, data=None, **kwargs):
+        """Construct an Entity.
+
+        :param data: (optional) A dictionary of the entity properties.
+        :param \*\*kwargs: Additional properties.
+        """
+
+        for field in self.FIELDS:
+            object.__setattr__(self, field, None)
+        object.__setattr__(self, '_properties', None)
+        object.__setattr__(self, '_changes', None)
+
+        if data:
+            for key, value in data.iteritems():
+                self._set(key, value)
+        if kwargs:
+            for key, value in kwargs.iteritems():
+                self._set(key, value)
+
+    def update(self, data):
+        """Set many properties from a dictionary."""
+
+        for key, value in data.iteritems():
+            self[key] = value
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.FIELDS:
+            self.mark_changed(name)
+
+    def mark_changed(self, *keys):
+        """Mark properties as changed.
+
+        :param \*keys: The names of the properties.
+        """
+
+        if self._changes is None:
+            object.__setattr__(self, '_changes', set())
+        self._changes.update(keys)
+
+    def mark_clean(self):
+        """Forget the changes, ie. once they are saved."""
+        object.__setattr__(self, '_changes', None)
+
+    def is_dirty(self):
+        """Return whether properties were changed since the entity was constructed or saved."""
+        return bool(self._changes)
+
+    def changes(self):
+        """Return the changed properties.
+        Returns a dictionary of the new values of the changed properties, None for the deleted ones.
+        """
+
+        if not self._changes:
+            return {}
+        return dict((key, self.get(key)) for key in self._changes)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._properties is None:
+            raise KeyError(key)
+        return self._properties[key]
+
+    def _set(self, key, value):
+        if key in self.FIELDS:
+            object.__setattr__(self, key, value)
+        elif value is None:
+            if self._properties is not None:
+                self._properties.pop(key, None)
+        else:
+            if self._properties is None:
+                object.__setattr__(self, '_properties', {})
+            self._properties[key] = value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+        self.mark_changed(key)
+
+    def __delitem__(self, key):
+        if key in self.FIELDS:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        elif self._properties is None:
+            raise KeyError(key)
+        else:
+            del self._properties[key]
+            self.mark_changed(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        """Return the value of a property, or ``default`` if the entity does not have it."""
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """Return the names of the properties of the entity."""
+
+        keys = [field for field in self.FIELDS if getattr(self, field) is not None]
+        if self._properties:
+            keys.extend(self._properties)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def to_dict(self):
+        """Return the properties of the entity as a dictionary."""
+        return dict(self.iteritems())
+
+    def __eq__(self, other):
+        if isinstance(other, (Entity, dict)):
+            return self.to_dict() == dict(other.iteritems())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return '<Entity [%s %s]>' % (self.type, self.uuid or self.name)
+
+
+class ObjectColumn(object):
+    """A column of any values, stored in a list.
+
+    The columns of an :class:`EntitySet` share this interface: ``len()``, ``accepts(value)``,
+    ``append(value)`` and indexing. None is the missing value of every column.
+    """
+
+    def __init__(self, values=None):
+        self.values = list(values or [])
+
+    def __len__(self):
+        return len(self.values)
+
+    def accepts(self, value):
+        """Return whether the column can store a value."""
+        return True
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+class Int64Column(object):
+    """A column of integers packed as int64. None is stored as the smallest int64."""
+
+    NULL = -2 ** 63
+    FORMAT = struct.Struct('<q')
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.data) // 8
+
+    def accepts(self, value):
+        return value is None or (isinstance(value, (int, long)) and not isinstance(value, bool)
+                                 and self.NULL < value < 2 ** 63)
+
+    def append(self, value):
+        self.data.extend(self.FORMAT.pack(self.NULL if value is None else value))
+
+    def __getitem__(self, index):
+        value = self.FORMAT.unpack_from(self.data, _index(index, len(self)) * 8)[0]
+        return None if value == self.NULL else value
+
+
+class FloatColumn(object):
+    """A column of floats packed as doubles. None is stored as NaN."""
+
+    def __init__(self):
+        self.data = array('d')
+
+    def __len__(self):
+        return len(self.data)
+
+    def accepts(self, value):
+        # NaN stands for None
+        return value is None or (isinstance(value, float) and value == value)
+
+    def append(self, value):
+        self.data.append(float('nan') if value is None else value)
+
+    def __getitem__(self, index):
+        value = self.data[index]
+        return None if value != value else value
+
+
+class UUIDColumn(object):
+    """A column of UUIDs packed as 16 bytes. The None values are flagged in a separate mask, so the
+    nil UUID is a value like any other.
+    """
+
+    NULL = '\0' * 16
+
+    def __init__(self):
+        self.data = bytearray()
+        self.nulls = bytearray()
+
+    def __len__(self):
+        return len(self.data) // 16
+
+    def accepts(self, value):
+        if value is None:
+            return True
+        try:
+            uuid.UUID(value)
+        except (TypeError, ValueError, AttributeError):
+            return False
+        return True
+
+    def append(self, value):
+        self.data.extend(self.NULL if value is None else uuid.UUID(value).bytes)
+        self.nulls.append(value is None)
+
+    def __getitem__(self, index):
+        index = _index(index, len(self))
+        if self.nulls[index]:
+            return None
+        start = index * 16
+        return str(uuid.UUID(bytes=bytes(self.data[start:start + 16])))
+
+
+class StringColumn(object):
+    """A dictionary-encoded column of strings: each distinct string is stored once."""
+
+    def __init__(self):
+        self.strings = [None]
+        self.codes = {None: 0}
+        self.data = array('I')
+
+    def __len__(self):
+        return len(self.data)
+
+    def accepts(self, value):
+        return value is None or isinstance(value, basestring)
+
+    def append(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        self.data.append(code)
+
+    def __getitem__(self, index):
+        return self.strings[self.data[index]]
+
+
+def _index(index, length):
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError('column index out of range')
+    return index
+
+
+def _column_for(value):
+    """Return a new column suited to store a value."""
+
+    if isinstance(value, bool):
+        return ObjectColumn()
+    if isinstance(value, (int, long)):
+        return Int64Column()
+    if isinstance(value, float):
+        return FloatColumn()
+    if isinstance(value, basestring):
+        return StringColumn()
+    return ObjectColumn()
+
+
+class EntitySet(object):
+    """A columnar set of entities.
+
+    Each property is stored in its own packed column: UUIDs as 16 bytes, timestamps and integers as
+    int64, floats as doubles and strings dictionary-encoded. Properties holding other values (or
+    mixed types) fall back to a list. Rows are rebuilt as :class:`Entity` objects on access.
+
+    """
+
+    #: The column types of the standard fields.
+    FIELD_COLUMNS = {
+        'uuid': UUIDColumn,
+        'type': StringColumn,
+        'created': Int64Column,
+        'modified': Int64Column,
+    }
+
+    def __init__(self, entities=None):
+        """Construct an EntitySet.
+
+        :param entities: (optional) An iterable of entities (dictionaries or :class:`Entity`).
+        """
+
+        self.columns = {}
+        self._length = 0
+
+        if entities is not None:
+            self.extend(entities)
+
+    def __len__(self):
+        return self._length
+
+    def _new_column(self, name, value):
+        factory = self.FIELD_COLUMNS.get(name)
+        column = factory() if factory is not None else _column_for(value)
+        if not column.accepts(value):
+            column = ObjectColumn()
+        for i in xrange(self._length):
+            column.append(None)
+        return column
+
+    def append(self, entity):
+        """Add an entity.
+
+        :param entity: A dictionary or an :class:`Entity`.
+        """
+
+        for name, value in entity.iteritems():
+            column = self.columns.get(name)
+            if column is None:
+                if value is None:
+                    continue
+                column = self.columns[name] = self._new_column(name, value)
+            elif not column.accepts(value):
+                column = self.columns[name] = ObjectColumn(column[i] for i in xrange(len(column)))
+            column.append(value)
+
+        self._length += 1
+
+        for column in self.columns.itervalues():
+            if len(column) < self._length:
+                column.append(None)
+
+    def extend(self, entities):
+        """Add many entities, one at a time.
+
+        :param entities: An iterable of entities.
+        """
+
+        for entity in entities:
+            self.append(entity)
+
+    def column(self, name):
+        """Return the values of a property, for every entity.
+
+        :param name: The name of the property.
+        """
+
+        column = self.columns.get(name)
+        if column is None:
+            return [None] * self._length
+        return [column[i] for i in xrange(self._length)]
+
+    def __getitem__(self, index):
+        index = _index(index, self._length)
+        data = {}
+        for name, column in self.columns.iteritems():
+            value = column[index]
+            if value is not None:
+                data[name] = value
+        return Entity(data)
+
+    def __iter__(self):
+        for i in xrange(self._length):
+            yield self[i]
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.events
+~~~~~~~~~~~~~~~
+
+This module contains the write-behind queue of the analytics events and
+counters. The events are posted to the ``/events`` endpoint in batches, by a
+background thread, instead of one blocking request per event.
+
+    >>> queue = EventQueue(client)
+    >>> queue.increment('button_clicks')
+    >>> queue.add({'category': 'login', 'user': 'bob'})
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from . import metrics
+from .exceptions import UsergridException
+
+log = logging.getLogger(__name__)
+
+# the open queues, flushed at exit. Weak references, so the closed queues are not kept.
+_open_queues = weakref.WeakSet()
+
+
+@atexit.register
+def _close_queues():
+    for queue in list(_open_queues):
+        queue.close()
+
+
+class EventQueue(object):
+    """A bounded write-behind queue of events.
+
+    A background thread posts the queued events in batches of ``batch_size`` events, as soon as a
+    batch is full or ``flush_interval`` seconds after the first queued event. The increments of a
+    counter are summed until they are sent, so a counter takes a single slot of the queue and
+    a single event of a batch.
+
+    When the queue holds ``max_size`` events, the ``overflow`` policy applies:
+
+    * 'block': :meth:`add` waits for the queue to drain.
+    * 'drop': the event is dropped and counted.
+    * 'spill': the event is appended to the ``spill_path`` file and queued again once the queue
+      drains. The batches the server rejects are spilled as well, instead of being dropped.
+
+    After a failed batch, the background thread waits before sending again, twice as long after
+    every consecutive failure, up to ``MAX_RETRY_DELAY`` seconds.
+
+    The queue is flushed by :meth:`close`, which is also called at exit.
+
+    """
+
+    OVERFLOW_POLICIES = ('block', 'drop', 'spill')
+
+    #: The maximum number of seconds between the sends after failures.
+    MAX_RETRY_DELAY = 60
+
+    def __init__(self, client,
+                 batch_size=100,
+                 flush_interval=1.0,
+                 max_size=10000,
+                 overflow='block',
+                 spill_path=None,
+                 target='/events'):
+        """Construct an EventQueue and start its background thread.
+
+        :param client: A :class:`usergrid.clients.BaseClient` object posting the events.
+        :param batch_size: (optional) The maximum number of events per request. Default to 100.
+        :param flush_interval: (optional) The maximum number of seconds an event waits in the queue. Default to 1.
+        :param max_size: (optional) The maximum number of queued events. Default to 10000.
+        :param overflow: (optional) The overflow policy: 'block', 'drop' or 'spill'. Default to 'block'.
+        :param spill_path: (optional) The spill file of the 'spill' policy.
+        :param target: (optional) The target url of the events. Default to '/events'.
+        """
+
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("expected overflow of 'block', 'drop' or 'spill'")
+        if overflow == 'spill' and not spill_path:
+            raise ValueError("the 'spill' overflow requires a 'spill_path'")
+
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.spill_path = spill_path
+        self.target = target
+
+        self.sent = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.batches = 0
+
+        self._events = deque()
+        self._counters = {}
+        self._spill_offset = 0
+        self._first_queued = None
+        self._closed = False
+        self._flushing = False
+        self._failures = 0
+        self._retry_at = None
+        self._condition = threading.Condition(threading.Lock())
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+        _open_queues.add(self)
+
+    def __len__(self):
+        return len(self._events) + len(self._counters)
+
+    @property
+    def closed(self):
+        """Whether the queue was closed."""
+        return self._closed
+
+    def add(self, event):
+        """Queue an event.
+        Returns whether the event was queued (or spilled), False if it was dropped.
+
+        :param event: A dictionary of the event (ie. {'category': 'login'}). It must be
+            serializable to json, or a TypeError (or a ValueError) is raised.
+        """
+
+        # rejected here, in the caller, rather than failing the whole batch in the background thread
+        json.dumps(event)
+
+        with self._condition:
+            if self._closed:
+                raise UsergridException("The event queue is closed")
+
+            if not self._make_room():
+                return self._overflow(event)
+
+            self._events.append(event)
+            self._queued()
+            return True
+
+    def increment(self, name, value=1):
+        """Increment a counter. The increments of the same counter are summed until sent.
+        Returns whether the increment was queued (or spilled), False if it was dropped.
+
+        :param name: The name of the counter (ie. 'button_clicks').
+        :param value: (optional) The increment. Default to 1.
+        """
+
+        if not isinstance(value, (int, long, float)):
+            raise TypeError("expected a numeric increment")
+
+        with self._condition:
+            if self._closed:
+                raise UsergridException("The event queue is closed")
+
+            if name in self._counters:
+                self._counters[name] += value
+                return True
+
+            if not self._make_room():
+                return self._overflow({'timestamp': 0, 'counters': {name: value}})
+
+            self._counters[name] = value
+            self._queued()
+            return True
+
+    def _make_room(self):
+        if len(self) < self.max_size:
+            return True
+        if self.overflow != 'block':
+            return False
+
+        while len(self) >= self.max_size and not self._closed:
+            self._condition.wait()
+        if self._closed:
+            raise UsergridException("The event queue is closed")
+        return True
+
+    def _overflow(self, event):
+        if self.overflow == 'spill':
+            self._spill([event])
+            return True
+        self.dropped += 1
+        return False
+
+    def _queued(self):
+        if self._first_queued is None:
+            # wake the background thread up to wait for the flush interval of this event
+            self._first_queued = time.time()
+            self._condition.notify_all()
+        elif len(self) >= self.batch_size:
+            self._condition.notify_all()
+
+    def _spill(self, events):
+        with open(self.spill_path, 'a') as f:
+            for event in events:
+                f.write(json.dumps(event))
+                f.write('\n')
+        self.spilled += len(events)
+
+    def _unspill(self):
+        """Queue again the spilled events, while the queue has room."""
+
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+
+        with open(self.spill_path) as f:
+            f.seek(self._spill_offset)
+            while len(self) < self.max_size:
+                line = f.readline()
+                if not line:
+                    break
+                self._spill_offset = f.tell()
+                try:
+                    self._events.append(json.loads(line))
+                except ValueError:
+                    log.warning("Skipping a corrupted event of %s", self.spill_path)
+            drained = not f.readline()
+
+        if drained:
+            os.remove(self.spill_path)
+            self._spill_offset = 0
+        if self._events and self._first_queued is None:
+            self._first_queued = time.time()
+
+    def _next_batch(self):
+        batch = []
+        if self._counters:
+            batch.append({'timestamp': 0, 'counters': self._counters})
+            self._counters = {}
+        while self._events and len(batch) < self.batch_size:
+            batch.append(self._events.popleft())
+
+        self._first_queued = time.time() if len(self) else None
+        self._condition.notify_all()
+        return batch
+
+    def _due(self):
+        if len(self) >= self.batch_size:
+            return True
+        return self._first_queued is not None and time.time() - self._first_queued >= self.flush_interval
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = time.time()
+                    if self._retry_at is not None and now < self._retry_at:
+                        # the last batch failed: neither send nor unspill before the retry delay
+                        self._condition.wait(self._retry_at - now)
+                        continue
+                    self._unspill()
+                    if self._due():
+                        break
+                    timeout = self.flush_interval
+                    if self._first_queued is not None:
+                        timeout = max(0, self._first_queued + self.flush_interval - time.time())
+                    self._condition.wait(timeout)
+
+                if self._closed:
+                    return
+                batch = self._next_batch()
+                self._flushing = True
+
+            try:
+                self.send(batch)
+            except Exception:
+                # the thread must survive anything, or the queue would fill up and block forever
+                log.exception("Unable to send %d events", len(batch))
+            finally:
+                with self._condition:
+                    self._flushing = False
+                    self._condition.notify_all()
+
+    def send(self, batch):
+        """Post a batch of events. A batch that fails, for any reason, is spilled with the 'spill'
+        policy, and dropped otherwise.
+        """
+
+        start = time.time()
+        try:
+            self.client.post_json(self.target, batch)
+        except Exception, e:
+            log.warning("Unable to send %d events: %s", len(batch), e)
+            with self._condition:
+                self.failed += len(batch)
+                self._failures += 1
+                delay = min(self.flush_interval * 2 ** (self._failures - 1), self.MAX_RETRY_DELAY)
+                self._retry_at = time.time() + delay
+                if self.overflow == 'spill':
+                    try:
+                        self._spill(batch)
+                    except (IOError, OSError, TypeError, ValueError), spill_error:
+                        log.error("Unable to spill %d events: %s", len(batch), spill_error)
+            if metrics.hooks.listeners:
+                metrics.hooks.emit('events', duration=time.time() - start, error=e)
+            return False
+
+        if metrics.hooks.listeners:
+            metrics.hooks.emit('events', duration=time.time() - start)
+        with self._condition:
+            self.sent += len(batch)
+            self.batches += 1
+            self._failures = 0
+            self._retry_at = None
+        return True
+
+    def flush(self):
+        """Send all the queued and spilled events, in the calling thread. It stops at the first
+        batch rejected by the server.
+        Returns whether all the events were sent.
+        """
+
+        while True:
+            with self._condition:
+                while self._flushing:
+                    self._condition.wait()
+                self._unspill()
+                if not len(self):
+                    return True
+                batch = self._next_batch()
+            if not self.send(batch):
+                return False
+
+    def close(self):
+        """Stop the background thread and flush the queue. The events spilled because the server
+        rejected them are kept in the spill file, for the next queue.
+        """
+
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        _open_queues.discard(self)
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """Return the state of the queue.
+        Returns a dictionary of the queued, sent, dropped, spilled and failed events, and the
+        number of batches sent.
+        """
+
+        with self._condition:
+            return {
+                'queued': len(self),
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'failed': self.failed,
+                'batches': self.batches,
+            }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -25,11 +25,16 @@ class RESTError(UsergridException):
     """A class that represents a usergrid error.
     """
 
+    #: The errors returned by the server when the access token expired.
+    TOKEN_EXPIRED_ERRORS = ('expired_token', 'auth_expired_session_token')
+
     def __init__(self, data, *args, **kwargs):
         """Construct the REST Error.
 
         :param data: A dictionary of the response data.
+        :param status: (optional) The http status of the response.
         """
+        self.status = kwargs.pop('status', None)
         self.error = data['error']
         self.description = data['error_description']
 
@@ -37,8 +42,37 @@ class RESTError(UsergridException):
         self.exception_name = data['exception'] if 'exception' in data else None
         super(RESTError, self).__init__(*args, **kwargs)
 
+    def is_token_expired(self):
+        """Return whether the error was caused by an expired access token."""
+        return self.error in self.TOKEN_EXPIRED_ERRORS
+
     def __repr__(self):
         return '<RESTError ["%s": %s]' % (self.error, self.description)
 
     def __str__(self):
         return self.__repr__()
+
+
+class CircuitOpenError(UsergridException):
+    """Raised when a request is not sent because the circuit of its host is open.
+    """
+
+
+class LimiterTimeoutError(UsergridException):
+    """Raised when a request waits for a concurrency limiter longer than its timeout.
+    """
+
+
+class ConflictError(UsergridException):
+    """Raised when an entity is not saved because it was modified on the server since it was
+    fetched.
+    """
+
+    def __init__(self, entities, *args, **kwargs):
+        """Construct the Conflict Error.
+
+        :param entities: The list of the conflicting entities.
+        """
+
+        self.entities = entities
+        super(ConflictError, self).__init__(*args, **kwargs)
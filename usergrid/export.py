@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.export
+~~~~~~~~~~~~~~~
+
+This module contains the export of collections to NDJSON files, one entity per
+line, optionally gzip compressed. The entities are streamed to the files one
+at a time and the cursor is checkpointed after every page, so an interrupted
+export resumes where it left off. It is also available as the
+``usergrid-export`` command::
+
+    usergrid-export --org my_org --app my_app --client-id ... --client-secret ... users devices
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+from . import codecs
+from .iterators import CollectionIterator
+from .utils import parallel_map
+
+
+class CollectionExport(object):
+    """The export of a collection to a NDJSON file.
+
+    After every page, the file is flushed to disk and a checkpoint is written next to it (the
+    ``.checkpoint`` file) with the cursor of the next page and the size of the file. A new export of
+    the same file truncates the entities written after the checkpoint and resumes from its cursor.
+    The gzip files are written as one gzip member per page, so they can be truncated between pages.
+
+    """
+
+    def __init__(self, client, collection, path,
+                 ql=None,
+                 limit=100,
+                 compress=False,
+                 progress=None,
+                 report_interval=5):
+        """Construct a CollectionExport.
+
+        :param client: A :class:`usergrid.clients.ApplicationClient` object.
+        :param collection: The collection name (ie. 'users').
+        :param path: The path of the NDJSON file.
+        :param ql: (optional) A Usergrid query selecting the exported entities.
+        :param limit: (optional) The number of entities per page. Default to 100.
+        :param compress: (optional) Whether the file is gzip compressed. Default to False.
+        :param progress: (optional) A function called with the :meth:`stats` of the export every
+            ``report_interval`` seconds, and once it is done.
+        :param report_interval: (optional) The number of seconds between progress reports. Default to 5.
+        """
+
+        self.client = client
+        self.collection = collection
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.iterator = CollectionIterator(client, collection, ql=ql, limit=limit, stream=True)
+        self.compress = compress
+        self.progress = progress
+        self.report_interval = report_interval
+
+        self.entities = 0
+        self.resumed = 0
+        self.done = False
+        self._started = None
+        self._reported = None
+
+    def read_checkpoint(self):
+        """Read the checkpoint of the export.
+        Returns a dictionary of (cursor, entities, size, done), or None if there is no checkpoint.
+        """
+
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except IOError:
+            return None
+
+    def write_checkpoint(self, cursor, size):
+        """Write the checkpoint of the export atomically.
+
+        :param cursor: The cursor of the next page, or None once the export is done.
+        :param size: The size of the file.
+        """
+
+        tmp = '%s.%d' % (self.checkpoint_path, threading.current_thread().ident)
+        with open(tmp, 'w') as f:
+            json.dump({'cursor': cursor,
+                       'entities': self.entities,
+                       'size': size,
+                       'done': self.done}, f)
+        os.rename(tmp, self.checkpoint_path)
+
+    def stats(self):
+        """Return the progress of the export.
+        Returns a dictionary of the collection, exported entities, seconds and entities per second.
+        """
+
+        seconds = time.time() - self._started if self._started else 0
+        exported = self.entities - self.resumed
+        return {
+            'collection': self.collection,
+            'path': self.path,
+            'entities': self.entities,
+            'seconds': seconds,
+            'rate': exported / seconds if seconds else 0,
+            'done': self.done,
+        }
+
+    def report(self, force=False):
+        if self.progress is None:
+            return
+        now = time.time()
+        if force or now - self._reported >= self.report_interval:
+            self._reported = now
+            self.progress(self.stats())
+
+    def run(self):
+        """Export the collection, resuming from the checkpoint if any.
+        Returns the :meth:`stats` of the export.
+        """
+
+        self._started = self._reported = time.time()
+
+        checkpoint = self.read_checkpoint()
+        if checkpoint is not None and checkpoint.get('done'):
+            self.entities = self.resumed = checkpoint['entities']
+            self.done = True
+            self.report(force=True)
+            return self.stats()
+
+        cursor = None
+        if checkpoint is not None and os.path.exists(self.path):
+            cursor = checkpoint['cursor']
+            self.entities = self.resumed = checkpoint['entities']
+            with open(self.path, 'r+b') as f:
+                f.truncate(checkpoint['size'])
+            mode = 'ab'
+        else:
+            mode = 'wb'
+
+        with open(self.path, mode) as f:
+            f.seek(0, os.SEEK_END)
+            while True:
+                cursor = self.export_page(f, cursor)
+
+                f.flush()
+                os.fsync(f.fileno())
+                self.done = not cursor
+                self.write_checkpoint(cursor, f.tell())
+
+                if self.done:
+                    break
+                self.report()
+
+        self.report(force=True)
+        return self.stats()
+
+    def export_page(self, f, cursor):
+        """Write the entities of a page to the file.
+        Returns the cursor of the next page.
+        """
+
+        res = self.client.stream('/%s' % self.collection, self.iterator.params(cursor))
+        out = gzip.GzipFile(fileobj=f, mode='wb') if self.compress else f
+        try:
+            for entity in res:
+                out.write(codecs.dumps(entity))
+                out.write('\n')
+                self.entities += 1
+                if self.progress is not None:
+                    self.report()
+        finally:
+            res.close()
+            if out is not f:
+                out.close()
+
+        return res.metadata.get('cursor')
+
+
+def export_collections(client, collections, directory,
+                       ql=None,
+                       limit=100,
+                       compress=False,
+                       concurrency=4,
+                       progress=None,
+                       report_interval=5):
+    """Export collections to NDJSON files, concurrently. The file of a collection is named
+    '<collection>.ndjson' (or '<collection>.ndjson.gz') in ``directory``.
+    Returns the list of the :meth:`CollectionExport.stats` of the exports.
+
+    :param client: A :class:`usergrid.clients.ApplicationClient` object.
+    :param collections: The collection names (ie. ['users', 'devices']).
+    :param directory: The directory of the files. It is created if needed.
+    :param ql: (optional) A Usergrid query selecting the exported entities.
+    :param limit: (optional) The number of entities per page. Default to 100.
+    :param compress: (optional) Whether the files are gzip compressed. Default to False.
+    :param concurrency: (optional) The number of collections exported at the same time. Default to 4.
+    :param progress: (optional) A function called with the progress of the exports. See
+        :class:`CollectionExport`.
+    :param report_interval: (optional) The number of seconds between progress reports. Default to 5.
+    """
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    def export(collection):
+        filename = '%s.ndjson%s' % (collection, '.gz' if compress else '')
+        return CollectionExport(client, collection, os.path.join(directory, filename),
+                                ql=ql,
+                                limit=limit,
+                                compress=compress,
+                                progress=progress,
+                                report_interval=report_interval).run()
+
+    return parallel_map(export, collections, concurrency)
+
+
+def print_progress(stats):
+    sys.stderr.write('%-20s %10d entities %10.1f /s%s\n' % (
+        stats['collection'], stats['entities'], stats['rate'], '  done' if stats['done'] else ''))
+
+
+def main(argv=None):
+    """The ``usergrid-export`` command."""
+
+    from .clients import ApplicationClient
+    from .rest import PooledRESTClient
+    from .sessions import UsergridSession
+
+    parser = argparse.ArgumentParser(description='Export Usergrid collections to NDJSON files.')
+    parser.add_argument('collections', nargs='+', help='the collections to export')
+    parser.add_argument('--org', required=True, help='the organization name')
+    parser.add_argument('--app', default=None, help="the application name (default: 'sandbox')")
+    parser.add_argument('--api-url', default=None, help="the usergrid server (default: 'api.usergrid.com')")
+    parser.add_argument('--client-id', default=os.environ.get('USERGRID_CLIENT_ID'),
+                        help='the client id (default: $USERGRID_CLIENT_ID)')
+    parser.add_argument('--client-secret', default=os.environ.get('USERGRID_CLIENT_SECRET'),
+                        help='the client secret (default: $USERGRID_CLIENT_SECRET)')
+    parser.add_argument('--output', '-o', default='.', help='the output directory (default: .)')
+    parser.add_argument('--gzip', action='store_true', help='gzip the files')
+    parser.add_argument('--ql', default=None, help='a query selecting the exported entities')
+    parser.add_argument('--limit', type=int, default=100, help='entities per page (default: 100)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='collections exported at the same time (default: 4)')
+    parser.add_argument('--report-interval', type=float, default=5,
+                        help='seconds between progress reports (default: 5)')
+    args = parser.parse_args(argv)
+
+    session = UsergridSession(args.org,
+                              api_url=args.api_url,
+                              app_name=args.app,
+                              client_id=args.client_id,
+                              client_secret=args.client_secret,
+                              rest_client=PooledRESTClient)
+    client = ApplicationClient(session)
+
+    results = export_collections(client, args.collections, args.output,
+                                 ql=args.ql,
+                                 limit=args.limit,
+                                 compress=args.gzip,
+                                 concurrency=args.concurrency,
+                                 progress=print_progress,
+                                 report_interval=args.report_interval)
+
+    total = sum(result['entities'] for result in results)
+    sys.stderr.write('%d entities exported to %s\n' % (total, args.output))
+
+
+if __name__ == '__main__':
+    main()
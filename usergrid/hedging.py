@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.hedging
+~~~~~~~~~~~~~~~~
+
+This module contains the hedging policy of the REST clients. It is enabled
+with the ``hedge`` argument of :class:`usergrid.rest.RESTClientImpl`.
+"""
+
+import sys
+import threading
+import time
+import Queue
+from collections import deque
+
+
+class LatencyTracker(object):
+    """A class that keeps the latencies of the recent requests.
+    """
+
+    def __init__(self, window=1000):
+        """Construct a LatencyTracker.
+
+        :param window: (optional) The number of recent latencies kept. Default to 1000.
+        """
+
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def record(self, latency):
+        """Record the latency of a request, in seconds."""
+
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, percentile):
+        """Return a percentile (0-100) of the recent latencies, or None without any latency."""
+
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+        if not latencies:
+            return None
+
+        index = int(round(percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[index]
+
+
+class _Workers(object):
+    """A pool of daemon threads, started on demand and reused between the requests. The pool
+    grows to the peak number of concurrent attempts.
+    """
+
+    def __init__(self):
+        self._tasks = Queue.Queue()
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """Call a function in a worker thread."""
+
+        with self._lock:
+            start = not self._idle
+            if not start:
+                self._idle -= 1
+        self._tasks.put((func, args))
+
+        if start:
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        # the tasks are waited for without a timeout: a timed wait would wake the daemon threads
+        # up at exit, after the module globals are cleared
+        while True:
+            func, args = self._tasks.get()
+            try:
+                func(*args)
+            finally:
+                with self._lock:
+                    self._idle += 1
+
+
+class HedgePolicy(object):
+    """A class that sends a duplicate of the slow idempotent requests.
+
+    When a GET has not been answered after a delay (the ``percentile`` of the recent latencies),
+    a second identical request is sent and the first response is used. The other request is
+    abandoned: its response is closed as soon as its headers arrive, without reading its body.
+    The body of the response used is read before it is returned, so its connection goes back to
+    the pool. The number of hedges is capped to ``budget`` times the number of requests.
+
+    The requests are sent by a pool of worker threads reused between the requests.
+
+    """
+
+    def __init__(self, percentile=95,
+                 min_delay=0.005,
+                 max_delay=1.0,
+                 initial_delay=0.1,
+                 min_samples=20,
+                 budget=0.05,
+                 window=1000):
+        """Construct a HedgePolicy.
+
+        :param percentile: (optional) The percentile of the latencies after which a request is
+            hedged. Default to 95.
+        :param min_delay: (optional) The minimum hedging delay, in seconds. Default to 0.005.
+        :param max_delay: (optional) The maximum hedging delay, in seconds. Default to 1.
+        :param initial_delay: (optional) The hedging delay used until ``min_samples`` latencies
+            were recorded, in seconds. Default to 0.1.
+        :param min_samples: (optional) The number of latencies needed to compute the delay. Default to 20.
+        :param budget: (optional) The maximum ratio of hedged requests. Default to 0.05.
+        :param window: (optional) The number of recent latencies kept. Default to 1000.
+        """
+
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.latencies = LatencyTracker(window)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+        self._workers = _Workers()
+
+    def stats(self):
+        """Return the counters of the policy as a dictionary."""
+
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'wins': self.wins,
+            'delay': self.delay(),
+        }
+
+    def delay(self):
+        """Return the number of seconds after which a request is hedged."""
+
+        if len(self.latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            delay = self.latencies.percentile(self.percentile)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def acquire(self):
+        """Take a hedge from the budget. Returns False if the budget is exhausted."""
+
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _attempt(self, results, tag, send, args, kwargs):
+        start = time.time()
+        try:
+            res = send(*args, **kwargs)
+        except Exception:
+            results.put((tag, None, sys.exc_info(), time.time() - start))
+        else:
+            results.put((tag, res, None, time.time() - start))
+
+    def _spawn(self, results, tag, send, args, kwargs):
+        self._workers.submit(self._attempt, results, tag, send, args, kwargs)
+
+    def _discard(self, results, pending):
+        """Close the responses of the abandoned requests once they arrive."""
+
+        def discard():
+            for i in xrange(pending):
+                tag, res, exc_info, latency = results.get()
+                if res is not None:
+                    res.close()
+
+        self._workers.submit(discard)
+
+    def send(self, send, method, url, **kwargs):
+        """Send a request, hedging it if it is slow.
+        Returns a ``requests.Response`` object.
+
+        :param send: The function sending a request (ie. :meth:`usergrid.rest.RESTClientImpl.send`).
+        :param method: The http method of the request.
+        :param url:  The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        with self._lock:
+            self.requests += 1
+
+        # the body of the abandoned request is never read
+        stream = kwargs.get('stream', False)
+        kwargs['stream'] = True
+
+        results = Queue.Queue()
+        args = (method, url)
+        started = time.time()
+        self._spawn(results, 'primary', send, args, kwargs)
+
+        try:
+            first = results.get(timeout=self.delay())
+        except Queue.Empty:
+            first = None
+
+        if first is not None:
+            tag, res, exc_info, latency = first
+            self.latencies.record(latency)
+        elif not self.acquire():
+            tag, res, exc_info, latency = results.get()
+            self.latencies.record(latency)
+        else:
+            self._spawn(results, 'hedge', send, args, kwargs)
+
+            tag, res, exc_info, latency = results.get()
+            primary_latency = None
+            if exc_info is not None:
+                # use the other request if the first one to return failed
+                if tag == 'primary':
+                    primary_latency = latency
+                tag, res, exc_info, latency = results.get()
+            else:
+                self._discard(results, 1)
+
+            if tag == 'hedge':
+                with self._lock:
+                    self.wins += 1
+                # the primary request is still running: its elapsed time is a lower bound of its
+                # latency. Without it only the primaries faster than the hedges are recorded, and
+                # the percentile, and the hedge delay, drift down.
+                if primary_latency is None:
+                    primary_latency = time.time() - started
+                self.latencies.record(primary_latency)
+            else:
+                self.latencies.record(latency)
+
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        if not stream:
+            res.content # release the connection
+        return res
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.iterators
+~~~~~~~~~~~~~~~~~~
+
+This module contains the iterators walking usergrid collections page by page
+with the ``cursor`` returned by the server, and the partitioned scan walking
+ranges of a collection concurrently.
+"""
+
+import Queue
+import sys
+import threading
+
+from .utils import Future, parallel_map
+
+
+class Page(object):
+    """A class that represents a page of a collection.
+    """
+
+    def __init__(self, entities, cursor=None, next_cursor=None):
+        """Construct a Page.
+
+        :param entities: The list of entities of the page.
+        :param cursor: (optional) The cursor used to fetch the page. None for the first page.
+        :param next_cursor: (optional) The cursor of the next page. None for the last page.
+        """
+
+        self.entities = entities
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+
+class CollectionIterator(object):
+    """An iterator yielding the entities of a collection one at a time.
+
+    The pages are fetched with Usergrid's ``cursor``/``limit`` paging. When prefetching is
+    enabled, the next page is fetched in the background while the current page is consumed, so
+    at most two pages are held in memory.
+
+    When streaming is enabled, the entities of a page are decoded while the page is read, so only
+    one entity is held in memory. The cursor of the next page is only known once a page was fully
+    read, so the pages are not prefetched.
+
+    """
+
+    def __init__(self, client, collection,
+                 ql=None,
+                 limit=100,
+                 cursor=None,
+                 prefetch=True,
+                 stream=False):
+        """Construct a CollectionIterator.
+
+        :param client: A :class:`usergrid.clients.BaseClient` object.
+        :param collection: The collection name (ie. 'users').
+        :param ql: (optional) A Usergrid query (ie. "select * where age > 20").
+        :param limit: (optional) The number of entities per page. Default to 100.
+        :param cursor: (optional) The cursor to start from, to resume an iteration.
+        :param prefetch: (optional) Whether the next page is fetched in the background. Default to True.
+        :param stream: (optional) Whether the entities are decoded while the pages are read. Default to False.
+        """
+
+        self.client = client
+        self.collection = collection
+        self.ql = ql
+        self.limit = limit
+        self.cursor = cursor
+        self.prefetch = prefetch
+        self.stream = stream
+
+    def params(self, cursor=None):
+        """Build the parameters of the request of a page.
+
+        :param cursor: (optional) The cursor of the page. None for the first page.
+        """
+
+        params = {'limit': self.limit}
+        if self.ql:
+            params['ql'] = self.ql
+        if cursor:
+            params['cursor'] = cursor
+        return params
+
+    def fetch_page(self, cursor=None):
+        """Fetch a single page of the collection.
+        Returns a :class:`Page`.
+
+        :param cursor: (optional) The cursor of the page. None for the first page.
+        """
+
+        res = self.client.get('/%s' % self.collection, self.params(cursor))
+
+        return Page(res.data.get('entities', []),
+                    cursor=cursor,
+                    next_cursor=res.data.get('cursor'))
+
+    def pages(self):
+        """Iterate over the pages of the collection.
+        Returns a generator of :class:`Page`.
+        """
+
+        page = self.fetch_page(self.cursor)
+
+        while True:
+            next_page = None
+            if page.next_cursor and self.prefetch:
+                next_page = Future(self.fetch_page, page.next_cursor)
+
+            yield page
+
+            if not page.next_cursor:
+                return
+
+            self.cursor = page.next_cursor
+
+            if next_page is not None:
+                page = next_page.result()
+            else:
+                page = self.fetch_page(page.next_cursor)
+
+    def stream_entities(self):
+        """Iterate over the entities, decoding them while the pages are read.
+        Returns a generator of entities.
+        """
+
+        cursor = self.cursor
+
+        while True:
+            res = self.client.stream('/%s' % self.collection, self.params(cursor))
+            for entity in res:
+                yield entity
+
+            cursor = res.metadata.get('cursor')
+            if not cursor:
+                return
+            self.cursor = cursor
+
+    def __iter__(self):
+        if self.stream:
+            for entity in self.stream_entities():
+                yield entity
+            return
+
+        for page in self.pages():
+            for entity in page.entities:
+                yield entity
+
+
+class Partition(object):
+    """A class that represents a disjoint range of a collection: the entities created in
+    [start, end[ (in milliseconds).
+    """
+
+    def __init__(self, index, start, end, where=None):
+        """Construct a Partition.
+
+        :param index: The index of the partition.
+        :param start: The first ``created`` timestamp of the range.
+        :param end: The ``created`` timestamp following the range.
+        :param where: (optional) An additional condition of the query.
+        """
+
+        self.index = index
+        self.start = start
+        self.end = end
+        self.where = where
+
+    @property
+    def ql(self):
+        """The Usergrid query selecting the entities of the partition."""
+
+        ql = 'select * where created >= %d and created < %d' % (self.start, self.end)
+        if self.where:
+            ql += ' and (%s)' % self.where
+        return ql
+
+    def __repr__(self):
+        return '<Partition [%d: %d-%d]>' % (self.index, self.start, self.end)
+
+
+def _scan_partition(args):
+    client_factory, collection, partition, limit, callback = args
+    return callback(partition, CollectionIterator(client_factory(), collection,
+                                                  ql=partition.ql, limit=limit, prefetch=False))
+
+
+class PartitionedScan(object):
+    """A scan of a collection split in ranges of ``created`` timestamps, each walked with its own
+    cursor chain, so the pages of a large collection are fetched concurrently.
+
+    The boundaries of the ranges are sampled from the oldest and the newest entity of the
+    collection. The collection is split in more partitions than workers, so the workers that
+    finish a sparse partition take the next one instead of waiting for a dense one.
+
+        >>> for entity in client.scan('users', concurrency=8):
+        ...     process(entity)
+
+    """
+
+    def __init__(self, client, collection,
+                 partitions=16,
+                 concurrency=4,
+                 where=None,
+                 limit=100,
+                 boundaries=None):
+        """Construct a PartitionedScan.
+
+        :param client: A :class:`usergrid.clients.BaseClient` object.
+        :param collection: The collection name (ie. 'users').
+        :param partitions: (optional) The number of partitions. Default to 16.
+        :param concurrency: (optional) The number of partitions walked at the same time. Default to 4.
+        :param where: (optional) A condition selecting the entities (ie. "age > 20").
+        :param limit: (optional) The number of entities per page. Default to 100.
+        :param boundaries: (optional) The ``created`` timestamps splitting the partitions, instead
+            of the sampled ones.
+        """
+
+        self.client = client
+        self.collection = collection
+        self.partition_count = partitions
+        self.concurrency = concurrency
+        self.where = where
+        self.limit = limit
+        self._boundaries = boundaries
+
+    def sample(self, order):
+        """Return the ``created`` timestamp of the first entity of the collection in an order, or None."""
+
+        ql = 'select * order by created %s' % order
+        if self.where:
+            ql = 'select * where %s order by created %s' % (self.where, order)
+        entities = self.client.get('/%s' % self.collection, {'ql': ql, 'limit': 1}).data.get('entities')
+        return entities[0]['created'] if entities else None
+
+    def boundaries(self):
+        """Return the sorted ``created`` timestamps splitting the partitions, from the first
+        timestamp of the first partition to the timestamp following the last one. The list is
+        empty for an empty collection.
+        """
+
+        if self._boundaries is None:
+            first, last = self.sample('asc'), self.sample('desc')
+            if first is None:
+                self._boundaries = []
+            else:
+                span = last + 1 - first
+                count = max(1, min(self.partition_count, span))
+                self._boundaries = sorted(set(first + span * i // count for i in xrange(count + 1)))
+        return self._boundaries
+
+    def partitions(self):
+        """Return the list of :class:`Partition` of the scan."""
+
+        boundaries = self.boundaries()
+        return [Partition(i, start, end, self.where)
+                for i, (start, end) in enumerate(zip(boundaries, boundaries[1:]))]
+
+    def iterator(self, partition):
+        """Return the :class:`CollectionIterator` of a partition."""
+        return CollectionIterator(self.client, self.collection, ql=partition.ql, limit=self.limit,
+                                  prefetch=False)
+
+    def run(self, callback, processes=False, client_factory=None):
+        """Call a function on every partition, concurrently.
+        Returns the list of the values returned by the function, in the order of the partitions.
+
+        :param callback: A function taking a :class:`Partition` and an iterator of its entities.
+        :param processes: (optional) Whether the partitions are walked in a pool of processes
+            instead of threads. The callback and the client factory must then be picklable
+            (ie. module-level functions). Default to False.
+        :param client_factory: (optional) A function building the client of a worker process.
+            Required with ``processes``.
+        """
+
+        partitions = self.partitions()
+
+        if not processes:
+            return parallel_map(lambda p: callback(p, self.iterator(p)), partitions, self.concurrency)
+
+        if client_factory is None:
+            raise ValueError("A process scan requires a 'client_factory'")
+
+        from multiprocessing import Pool
+
+        pool = Pool(min(self.concurrency, len(partitions)) or 1)
+        try:
+            return pool.map(_scan_partition,
+                            [(client_factory, self.collection, p, self.limit, callback)
+                             for p in partitions])
+        finally:
+            pool.close()
+            pool.join()
+
+    def __iter__(self):
+        """Iterate over the entities of all the partitions, in no particular order. At most
+        ``concurrency * 2`` pages are held in memory.
+        """
+
+        partitions = Queue.Queue()
+        for partition in self.partitions():
+            partitions.put(partition)
+
+        workers = min(self.concurrency, partitions.qsize())
+        pages = Queue.Queue(maxsize=self.concurrency * 2)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    return pages.put(item, timeout=0.1)
+                except Queue.Full:
+                    pass
+
+        def work():
+            try:
+                while not stopped.is_set():
+                    try:
+                        partition = partitions.get_nowait()
+                    except Queue.Empty:
+                        return
+                    for page in self.iterator(partition).pages():
+                        if stopped.is_set():
+                            return
+                        put(page.entities)
+            except Exception:
+                put(sys.exc_info())
+            finally:
+                put(None)
+
+        for i in xrange(workers):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while workers:
+                item = pages.get()
+                if item is None:
+                    workers -= 1
+                elif isinstance(item, tuple):
+                    raise item[0], item[1], item[2]
+                else:
+                    for entity in item:
+                        yield entity
+        finally:
+            stopped.set()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.limiting
+~~~~~~~~~~~~~~~~~
+
+This module contains the concurrency limiters of the REST clients. A limiter
+is enabled with the ``limiter`` argument of :class:`usergrid.rest.RESTClientImpl`
+and is shared by all the clients using that implementation: the requests over
+the limit wait in a queue until a slot frees up.
+"""
+
+import threading
+import time
+
+from .exceptions import LimiterTimeoutError
+
+
+class AdaptiveLimiter(object):
+    """An adaptive (AIMD) concurrency limiter.
+
+    The in-flight limit grows by one request per window of ``limit`` successful requests, as long
+    as the limit is in use and the latency stays within ``latency_tolerance`` times its baseline.
+    It is multiplied by ``backoff_ratio`` on a 429 or 503 response and on a timeout, at most once
+    per window: the rejections of the requests sent before the last decrease are ignored.
+
+    """
+
+    DROP_STATUSES = frozenset([429, 503])
+
+    def __init__(self, initial_limit=10,
+                 min_limit=1,
+                 max_limit=200,
+                 backoff_ratio=0.5,
+                 latency_tolerance=2.0,
+                 smoothing=0.1,
+                 timeout=None):
+        """Construct an AdaptiveLimiter.
+
+        :param initial_limit: (optional) The initial number of requests in flight. Default to 10.
+        :param min_limit: (optional) The minimum limit. Default to 1.
+        :param max_limit: (optional) The maximum limit. Default to 200.
+        :param backoff_ratio: (optional) The ratio the limit is multiplied by on a rejection. Default to 0.5.
+        :param latency_tolerance: (optional) The ratio of the smoothed latency to its baseline above
+            which the limit stops growing. Default to 2.0.
+        :param smoothing: (optional) The weight of a new sample in the smoothed latency. Default to 0.1.
+        :param timeout: (optional) The maximum number of seconds a request waits for a slot, after
+            which a :class:`usergrid.exceptions.LimiterTimeoutError` is raised. Default to None (no timeout).
+        """
+
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.timeout = timeout
+
+        self.in_flight = 0
+        self.queued = 0
+        self.latency = None
+        self.baseline = None
+        self._last_decrease = 0
+        self._condition = threading.Condition(threading.Lock())
+
+    def acquire(self):
+        """Wait for a free slot.
+        Returns the ticket to release once the request is done.
+        """
+
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                self._wait()
+            self.in_flight += 1
+            return time.time()
+
+    def _wait(self):
+        deadline = time.time() + self.timeout if self.timeout is not None else None
+        self.queued += 1
+        try:
+            while self.in_flight >= int(self.limit):
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise LimiterTimeoutError("No request slot after %.2f seconds" % self.timeout)
+                self._condition.wait(remaining)
+        finally:
+            self.queued -= 1
+
+    def release(self, ticket, status=None, timeout=False):
+        """Release the slot of a finished request and adjust the limit.
+
+        :param ticket: The ticket returned by :meth:`acquire`.
+        :param status: (optional) The http status of the response, if any.
+        :param timeout: (optional) Whether the request timed out. Default to False.
+        """
+
+        now = time.time()
+        with self._condition:
+            saturated = self.in_flight >= int(self.limit) or self.queued
+            self.in_flight -= 1
+
+            previous = int(self.limit)
+            if timeout or status in self.DROP_STATUSES:
+                self._decrease(ticket, now)
+            elif status is not None:
+                self._observe(now - ticket, saturated)
+
+            self._condition.notify(max(1, int(self.limit) - previous + 1))
+
+    def _decrease(self, ticket, now):
+        if ticket < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self._last_decrease = now
+
+    def _observe(self, latency, saturated):
+        if self.latency is None:
+            self.latency = self.baseline = latency
+        else:
+            self.latency += (latency - self.latency) * self.smoothing
+            # the baseline follows the lowest latency, and slowly drifts up with a changing workload
+            self.baseline = min(self.latency, self.baseline + (self.latency - self.baseline) * 0.01)
+
+        if saturated and self.latency <= self.baseline * self.latency_tolerance:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def stats(self):
+        """Return the current state of the limiter.
+        Returns a dictionary of the limit, in-flight requests, queued requests and latencies.
+        """
+
+        with self._condition:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'latency': self.latency,
+                'baseline': self.baseline,
+            }
+
+
+class TokenBucket(object):
+    """A fixed rate limiter: at most ``rate`` requests per second, with bursts of ``burst``
+    requests. The waiting requests are served in order.
+
+    """
+
+    def __init__(self, rate, burst=None, timeout=None):
+        """Construct a TokenBucket.
+
+        :param rate: The number of requests per second.
+        :param burst: (optional) The number of requests that can be sent at once. Default to ``rate``.
+        :param timeout: (optional) The maximum number of seconds a request waits for a token, after
+            which a :class:`usergrid.exceptions.LimiterTimeoutError` is raised. Default to None (no timeout).
+        """
+
+        self.rate = float(rate)
+        self.burst = max(1, burst if burst is not None else int(rate))
+        self.timeout = timeout
+
+        self.tokens = float(self.burst)
+        self.in_flight = 0
+        self.queued = 0
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds):
+        """Wait for a token."""
+        time.sleep(seconds)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Wait for a token.
+        Returns the ticket to release once the request is done.
+        """
+
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            if self.timeout is not None and wait > self.timeout:
+                raise LimiterTimeoutError("No request token before %.2f seconds" % self.timeout)
+            # the token is reserved now, so the waiting requests are served in order
+            self.tokens -= 1
+            self.in_flight += 1
+            if wait:
+                self.queued += 1
+
+        if wait:
+            try:
+                self.sleep(wait)
+            finally:
+                with self._lock:
+                    self.queued -= 1
+
+        return now + wait
+
+    def release(self, ticket, status=None, timeout=False):
+        """Release a finished request.
+
+        :param ticket: The ticket returned by :meth:`acquire`.
+        :param status: (optional) The http status of the response, if any.
+        :param timeout: (optional) Whether the request timed out. Default to False.
+        """
+
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """Return the current state of the limiter.
+        Returns a dictionary of the rate, available tokens, in-flight requests and queued requests.
+        """
+
+        with self._lock:
+            self._refill(time.time())
+            return {
+                'rate': self.rate,
+                'tokens': max(self.tokens, 0),
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+            }
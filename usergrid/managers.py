@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.managers
+~~~~~~~~~~~~~~~~~
+
+This module contains the session manager of the multi-tenant processes. It
+keeps a bounded number of sessions and clients, one per tenant, and shares an
+http connection pool per host and a token store between all of them.
+"""
+
+import threading
+import urlparse
+from collections import OrderedDict
+
+from .clients import ApplicationClient
+from .rest import PooledRESTClientImpl, RESTClient
+from .sessions import UsergridSession
+from .tokens import MemoryTokenStore
+
+
+class SessionManager(object):
+    """A class that manages the sessions and clients of many organizations and applications.
+
+    The sessions are keyed by (api_url, org_name, app_name, auth_level, principal). The least
+    recently used sessions are evicted beyond ``max_sessions``; their tokens stay in the token
+    store, so a session created again for the same tenant reuses the token without authenticating.
+
+        >>> manager = SessionManager(client_id='...', client_secret='...')
+        >>> manager.client_for('org_a', 'app').get('/users')
+
+    """
+
+    def __init__(self, api_url=None,
+                 max_sessions=100,
+                 token_store=None,
+                 pool_maxsize=10,
+                 session_class=UsergridSession,
+                 client_class=ApplicationClient,
+                 **session_kwargs):
+        """Construct a SessionManager.
+
+        :param api_url: (optional) The default main url (host) of the usergrid server. Default to
+            'api.usergrid.com'.
+        :param max_sessions: (optional) The maximum number of sessions kept. Default to 100.
+        :param token_store: (optional) The :class:`usergrid.tokens.TokenStore` shared by the sessions.
+            Default to a :class:`usergrid.tokens.MemoryTokenStore`.
+        :param pool_maxsize: (optional) The maximum number of connections kept per host. Default to 10.
+        :param session_class: (optional) The class of the sessions. Default to
+            :class:`usergrid.sessions.UsergridSession`.
+        :param client_class: (optional) The class of the clients. Default to
+            :class:`usergrid.clients.ApplicationClient`.
+        :param \*\*session_kwargs: The default arguments of the sessions (ie. auth_level, client_id,
+            client_secret, token_placement).
+        """
+
+        self.api_url = api_url or session_class.API_URL
+        self.max_sessions = max_sessions
+        self.token_store = token_store if token_store is not None else MemoryTokenStore()
+        self.pool_maxsize = pool_maxsize
+        self.session_class = session_class
+        self.client_class = client_class
+        self.session_kwargs = session_kwargs
+
+        self.evictions = 0
+        self._clients = OrderedDict()
+        self._rest_clients = {}
+        self._lock = threading.Lock()
+
+    def key(self, org_name, app_name=None, **kwargs):
+        """Build the key of the session of a tenant.
+        Returns a tuple of (api_url, org_name, app_name, auth_level, principal).
+        """
+
+        options = dict(self.session_kwargs, **kwargs) if kwargs else self.session_kwargs
+        auth_level = options.get('auth_level', 'client')
+        principal = options.get('username') if auth_level == 'user' else options.get('client_id')
+
+        return (options.get('api_url') or self.api_url,
+                org_name,
+                app_name or self.session_class.APP_NAME,
+                auth_level,
+                principal)
+
+    def client_for(self, org_name, app_name=None, **kwargs):
+        """Return the client of a tenant, creating its session if needed.
+
+        :param org_name: The organization name.
+        :param app_name: (optional) The application name. Default to 'sandbox'.
+        :param \*\*kwargs: Optional arguments of the session, overriding the defaults of the manager
+            (ie. the credentials of the tenant).
+        """
+
+        key = self.key(org_name, app_name, **kwargs)
+
+        with self._lock:
+            client = self._clients.pop(key, None)
+            if client is not None:
+                self._clients[key] = client
+                return client
+
+        client = self.build_client(key, kwargs)
+
+        with self._lock:
+            # another thread may have built the client of the same tenant meanwhile
+            client = self._clients.pop(key, client)
+            self._clients[key] = client
+            while len(self._clients) > self.max_sessions:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+
+        return client
+
+    def session_for(self, org_name, app_name=None, **kwargs):
+        """Return the session of a tenant, creating it if needed.
+        See :meth:`client_for`.
+        """
+
+        return self.client_for(org_name, app_name, **kwargs).session
+
+    def build_client(self, key, kwargs):
+        """Build the session and the client of a tenant.
+        Returns a client.
+
+        :param key: The key of the session.
+        :param kwargs: The session arguments overriding the defaults of the manager.
+        """
+
+        options = dict(self.session_kwargs, **kwargs)
+        rest_client = self.rest_client_for(key[0])
+        options.update(api_url=key[0], app_name=key[2], token_store=self.token_store,
+                       rest_client=rest_client)
+
+        session = self.session_class(key[1], **options)
+        return self.client_class(session, rest_client=rest_client)
+
+    def rest_client_for(self, api_url):
+        """Return the REST client, and connection pool, shared by the sessions of a host.
+        Returns a :class:`usergrid.rest.RESTClient` class.
+
+        :param api_url: The main url (host) of the usergrid server.
+        """
+
+        host = urlparse.urlsplit(api_url if '://' in api_url else '//' + api_url).netloc
+
+        with self._lock:
+            rest_client = self._rest_clients.get(host)
+            if rest_client is None:
+                impl = PooledRESTClientImpl(pool_maxsize=self.pool_maxsize)
+                rest_client = self._rest_clients[host] = RESTClient.using(impl)
+            return rest_client
+
+    def refresh_tokens(self):
+        """Refresh, in the calling thread, the tokens of the sessions in their refresh window. It
+        can be called periodically, with ``background_refresh=False`` sessions, to keep the token
+        refreshes out of the requests.
+        Returns the number of sessions refreshed.
+        """
+
+        with self._lock:
+            sessions = [client.session for client in self._clients.itervalues()]
+
+        refreshed = 0
+        for session in sessions:
+            if session.is_linked() and session.tokens.needs_refresh():
+                session.tokens.refresh()
+                refreshed += 1
+        return refreshed
+
+    def stats(self):
+        """Return the state of the manager.
+        Returns a dictionary of the number of sessions, hosts and evictions.
+        """
+
+        with self._lock:
+            return {
+                'sessions': len(self._clients),
+                'hosts': len(self._rest_clients),
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        """Close the connection pools and forget the sessions."""
+
+        with self._lock:
+            rest_clients = self._rest_clients.values()
+            self._rest_clients = {}
+            self._clients.clear()
+
+        for rest_client in rest_clients:
+            rest_client.IMPL.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
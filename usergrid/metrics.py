@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.metrics
+~~~~~~~~~~~~~~~~
+
+This module contains the instrumentation of the usergrid objects. Listeners
+attached to ``usergrid.metrics.hooks`` receive an :class:`Event` for each
+timed phase: 'auth', 'build_url', 'http', 'decode', 'cache' and 'events'. Nothing is
+measured while no listener is attached.
+
+    >>> collector = MetricsCollector()
+    >>> hooks.add_listener(collector)
+    >>> print collector.prometheus_text()
+"""
+
+import bisect
+import threading
+import time
+
+
+class Event(object):
+    """A class that represents an instrumentation event.
+    """
+
+    __slots__ = ('phase', 'duration', 'method', 'url', 'status', 'bytes_in', 'bytes_out',
+                 'retries', 'cache', 'error')
+
+    def __init__(self, phase, duration=0.0, method=None, url=None, status=None,
+                 bytes_in=0, bytes_out=0, retries=0, cache=None, error=None):
+        """Construct an Event.
+
+        :param phase: The phase: 'auth', 'build_url', 'http', 'decode', 'cache' or 'events'.
+        :param duration: (optional) The duration of the phase, in seconds.
+        :param method: (optional) The http method of the request.
+        :param url: (optional) The url of the request.
+        :param status: (optional) The http status of the response.
+        :param bytes_in: (optional) The number of bytes received (or decoded).
+        :param bytes_out: (optional) The number of bytes sent.
+        :param retries: (optional) The number of retries of the request.
+        :param cache: (optional) The outcome of the cache lookup: 'hit', 'miss' or 'revalidated'.
+        :param error: (optional) The exception raised by the phase, if any.
+        """
+
+        self.phase = phase
+        self.duration = duration
+        self.method = method
+        self.url = url
+        self.status = status
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.retries = retries
+        self.cache = cache
+        self.error = error
+
+    def __repr__(self):
+        return '<Event [%s %.6fs]>' % (self.phase, self.duration)
+
+
+class Instrumentation(object):
+    """A class that dispatches the instrumentation events to the listeners.
+
+    The instrumented code checks ``listeners`` before measuring anything, so the instrumentation
+    costs a single attribute lookup while no listener is attached.
+
+    """
+
+    def __init__(self):
+        self.listeners = ()
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Attach a listener: a callable taking an :class:`Event`."""
+
+        with self._lock:
+            self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """Detach a listener."""
+
+        with self._lock:
+            self.listeners = tuple(l for l in self.listeners if l != listener)
+
+    def emit(self, phase, **kwargs):
+        """Send an event to the listeners.
+
+        :param phase: The phase of the event.
+        :param \*\*kwargs: The fields of the :class:`Event`.
+        """
+
+        event = Event(phase, **kwargs)
+        for listener in self.listeners:
+            listener(event)
+
+
+#: The instrumentation of the usergrid objects.
+hooks = Instrumentation()
+
+
+def body_size(body):
+    """Return the size in bytes of a request body (or 0 if unknown)."""
+
+    if isinstance(body, basestring):
+        return len(body)
+    if isinstance(body, dict):
+        return sum(len(str(k)) + len(str(v)) + 2 for k, v in body.iteritems())
+    return 0
+
+
+class Histogram(object):
+    """A cumulative histogram with fixed buckets, like the Prometheus histograms.
+    """
+
+    DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                       1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None):
+        """Construct a Histogram.
+
+        :param buckets: (optional) The sorted upper bounds of the buckets. Default to ``DEFAULT_BUCKETS``.
+        """
+
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record a value."""
+
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative(self):
+        """Return the list of (upper bound, cumulative count), ending with (inf, count)."""
+
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Estimate a quantile (0-1): the upper bound of the bucket containing it."""
+
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                             for k, v in sorted(labels.items()))
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsCollector(object):
+    """A listener aggregating the events into in-process histograms and counters.
+    """
+
+    def __init__(self, buckets=None, namespace='usergrid'):
+        """Construct a MetricsCollector.
+
+        :param buckets: (optional) The buckets of the duration histograms.
+        :param namespace: (optional) The prefix of the exported metrics. Default to 'usergrid'.
+        """
+
+        self.buckets = buckets
+        self.namespace = namespace
+        self.durations = {}
+        self.requests = {}
+        self.errors = {}
+        self.cache = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def histogram(self, phase):
+        """Return the duration histogram of a phase."""
+
+        histogram = self.durations.get(phase)
+        if histogram is None:
+            with self._lock:
+                histogram = self.durations.setdefault(phase, Histogram(self.buckets))
+        return histogram
+
+    def __call__(self, event):
+        if event.phase == 'cache':
+            with self._lock:
+                self.cache[event.cache] = self.cache.get(event.cache, 0) + 1
+            return
+
+        self.histogram(event.phase).observe(event.duration)
+
+        with self._lock:
+            if event.error is not None:
+                key = (event.phase, type(event.error).__name__)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if event.phase == 'http':
+                key = (event.method, event.status)
+                self.requests[key] = self.requests.get(key, 0) + 1
+                self.bytes_in += event.bytes_in
+                self.bytes_out += event.bytes_out
+                self.retries += event.retries
+
+    def prometheus_text(self):
+        """Export the metrics in the Prometheus text format.
+        Returns a string.
+        """
+
+        ns = self.namespace
+        lines = [
+            '# HELP %s_phase_seconds The duration of the SDK phases.' % ns,
+            '# TYPE %s_phase_seconds histogram' % ns,
+        ]
+        for phase, histogram in sorted(self.durations.items()):
+            for bound, total in histogram.cumulative():
+                lines.append('%s_phase_seconds_bucket%s %d' % (ns, _labels(phase=phase, le=_number(bound)), total))
+            lines.append('%s_phase_seconds_sum%s %s' % (ns, _labels(phase=phase), _number(histogram.sum)))
+            lines.append('%s_phase_seconds_count%s %d' % (ns, _labels(phase=phase), histogram.count))
+
+        lines.append('# TYPE %s_requests_total counter' % ns)
+        for (method, status), count in sorted(self.requests.items()):
+            lines.append('%s_requests_total%s %d' % (ns, _labels(method=method, status=status), count))
+
+        lines.append('# TYPE %s_errors_total counter' % ns)
+        for (phase, error), count in sorted(self.errors.items()):
+            lines.append('%s_errors_total%s %d' % (ns, _labels(phase=phase, error=error), count))
+
+        lines.append('# TYPE %s_cache_total counter' % ns)
+        for result, count in sorted(self.cache.items()):
+            lines.append('%s_cache_total%s %d' % (ns, _labels(result=result), count))
+
+        for name, value in (('bytes_received_total', self.bytes_in),
+                            ('bytes_sent_total', self.bytes_out),
+                            ('retries_total', self.retries)):
+            lines.append('# TYPE %s_%s counter' % (ns, name))
+            lines.append('%s_%s %d' % (ns, name, value))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.replicas
+~~~~~~~~~~~~~~~~~
+
+This module contains the local replicas of the read-mostly collections (ie.
+roles or configuration). A replica keeps a copy of a collection in a sqlite
+database, in memory or on disk, loaded once and then synced with the entities
+modified since the last sync. Its reads are served locally, without any
+request.
+
+    >>> roles = CollectionReplica(client, 'roles', path='roles.db', indexes=['title'])
+    >>> roles.get('admin')
+    >>> roles.find(title='Administrator')
+"""
+
+import logging
+import threading
+import time
+
+from . import codecs
+from .entities import Entity
+from .utils import LazyModule
+
+sqlite3 = LazyModule('sqlite3')
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    uuid TEXT PRIMARY KEY,
+    name TEXT,
+    modified INTEGER,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (name);
+CREATE TABLE IF NOT EXISTS indexes (
+    property TEXT,
+    value,
+    uuid TEXT
+);
+CREATE INDEX IF NOT EXISTS indexes_value ON indexes (property, value);
+CREATE INDEX IF NOT EXISTS indexes_uuid ON indexes (uuid);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+def _index_values(value):
+    """Return the values of a property stored in the index: every item of a list, and the
+    scalar values.
+    """
+
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if isinstance(v, (basestring, int, long, float))]
+
+
+class CollectionReplica(object):
+    """A local replica of a collection, stored in sqlite.
+
+    The first sync loads the whole collection. The next ones query the entities whose ``modified``
+    timestamp is at least the greatest one already seen, so only the changes are transferred (the
+    entities of the last millisecond are fetched again, so none is missed). The deleted entities are
+    not returned by these queries: they are removed by the full syncs, every
+    ``full_sync_interval`` seconds.
+
+    The reads sync the replica first if its last sync is older than ``max_staleness`` seconds. The
+    concurrent reads of a stale replica wait for a single sync. If the sync fails, the stored
+    entities are served with a warning, and the sync is tried again ``max_staleness`` seconds
+    later. With a ``sync_interval``, a background thread syncs the replica periodically, so the
+    reads do not wait for a sync.
+
+    The properties listed in ``indexes`` are indexed in a secondary table, so :meth:`find` on them
+    does not scan the collection. The items of the list properties are indexed one by one.
+
+    """
+
+    def __init__(self, client, collection,
+                 path=None,
+                 indexes=(),
+                 max_staleness=60,
+                 sync_interval=None,
+                 full_sync_interval=None,
+                 limit=100):
+        """Construct a CollectionReplica.
+
+        :param client: A :class:`usergrid.clients.ApplicationClient` object.
+        :param collection: The collection name (ie. 'roles').
+        :param path: (optional) The path of the sqlite database. The replica of a previous run is
+            synced incrementally. Default to an in-memory database.
+        :param indexes: (optional) The names of the indexed properties.
+        :param max_staleness: (optional) The maximum age of the replica served by the reads, in
+            seconds. None to never sync on read. Default to 60.
+        :param sync_interval: (optional) The number of seconds between the syncs of a background
+            thread. Default to None (no background thread).
+        :param full_sync_interval: (optional) The number of seconds between full syncs, which remove
+            the deleted entities. Default to None (only the first sync is full).
+        :param limit: (optional) The number of entities per page. Default to 100.
+        """
+
+        self.client = client
+        self.collection = collection
+        self.path = path or ':memory:'
+        self.indexes = tuple(indexes)
+        self.max_staleness = max_staleness
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.limit = limit
+
+        self.syncs = 0
+        self.full_syncs = 0
+        self.failed_syncs = 0
+        self.synced_at = None
+        self.full_synced_at = None
+        self.failed_at = None
+
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+        indexed = self._state('indexes')
+        if indexed is not None and codecs.loads(indexed) != list(self.indexes):
+            self._reindex()
+
+        self._thread = None
+        if sync_interval:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _state(self, key):
+        row = self._db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def last_seen(self):
+        """The greatest ``modified`` timestamp of the replica, or None before the first sync."""
+
+        with self._lock:
+            return self._state('last_seen')
+
+    def is_loaded(self):
+        """Return whether a full sync of the replica completed, in this process or a previous one."""
+
+        with self._lock:
+            return self._state('loaded') is not None
+
+    def _store(self, entity):
+        entity_uuid = entity['uuid']
+        self._db.execute('INSERT OR REPLACE INTO entities (uuid, name, modified, data) '
+                         'VALUES (?, ?, ?, ?)',
+                         (entity_uuid, entity.get('name'), entity.get('modified'),
+                          codecs.dumps(entity)))
+        self._db.execute('DELETE FROM indexes WHERE uuid = ?', (entity_uuid,))
+        for prop in self.indexes:
+            if prop in entity:
+                self._db.executemany('INSERT INTO indexes (property, value, uuid) VALUES (?, ?, ?)',
+                                     [(prop, value, entity_uuid)
+                                      for value in _index_values(entity[prop])])
+
+    def _reindex(self):
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM indexes')
+                for (data,) in self._db.execute('SELECT data FROM entities').fetchall():
+                    self._store(codecs.loads(data))
+                self._set_state('indexes', codecs.dumps(list(self.indexes)))
+
+    def sync(self, full=None):
+        """Sync the replica with the server.
+        Returns the number of entities added or updated.
+
+        :param full: (optional) Whether to load the whole collection and remove the deleted
+            entities. Default to a full sync if the replica was never synced, or if the last full
+            sync is older than ``full_sync_interval``.
+        """
+
+        with self._sync_lock:
+            return self._sync(full)
+
+    def _sync(self, full):
+        now = time.time()
+        last_seen = self.last_seen
+        if full is None:
+            full = not self.is_loaded() or (
+                self.full_sync_interval is not None and
+                (self.full_synced_at is None or now - self.full_synced_at >= self.full_sync_interval))
+
+        if full:
+            ql = None
+        else:
+            ql = 'select * where modified >= %d order by modified asc' % (last_seen or 0)
+
+        # an incremental sync saves ``last_seen`` after every batch, in ``modified`` order, so an
+        # interrupted one resumes where it stopped. A full sync saves it once complete: the
+        # entities it did not fetch yet may be older than the ones stored.
+        seen = set()
+        count = 0
+        batch = []
+        for entity in self.client.iter_collection(self.collection, ql=ql, limit=self.limit):
+            batch.append(entity)
+            if len(batch) >= self.limit:
+                count += self._apply(batch, seen, not full)
+                batch = []
+        count += self._apply(batch, seen, not full)
+
+        with self._lock:
+            with self._db:
+                if full:
+                    stored = [row[0] for row in self._db.execute('SELECT uuid FROM entities')]
+                    deleted = [(value,) for value in stored if value not in seen]
+                    self._db.executemany('DELETE FROM entities WHERE uuid = ?', deleted)
+                    self._db.executemany('DELETE FROM indexes WHERE uuid = ?', deleted)
+                    last_seen = self._db.execute('SELECT MAX(modified) FROM entities').fetchone()[0]
+                    if last_seen is not None:
+                        self._set_state('last_seen', last_seen)
+                    self._set_state('loaded', int(now))
+                self._set_state('indexes', codecs.dumps(list(self.indexes)))
+
+        self.syncs += 1
+        self.synced_at = now
+        if full:
+            self.full_syncs += 1
+            self.full_synced_at = now
+        return count
+
+    def _apply(self, entities, seen, save_last_seen):
+        count = 0
+        with self._lock:
+            with self._db:
+                last_seen = self._state('last_seen')
+                for entity in entities:
+                    seen.add(entity['uuid'])
+                    modified = entity.get('modified')
+                    row = self._db.execute('SELECT modified FROM entities WHERE uuid = ?',
+                                           (entity['uuid'],)).fetchone()
+                    if row is not None and row[0] == modified:
+                        continue
+                    self._store(entity)
+                    count += 1
+                    if modified is not None and (last_seen is None or modified > last_seen):
+                        last_seen = modified
+                if save_last_seen and last_seen is not None:
+                    self._set_state('last_seen', last_seen)
+        return count
+
+    def age(self):
+        """Return the number of seconds since the last sync, or None if the replica was never
+        synced by this process.
+        """
+
+        if self.synced_at is None:
+            return None
+        return time.time() - self.synced_at
+
+    def _is_stale(self):
+        # a failed sync counts as an attempt, so a down server is not queried on every read
+        attempts = [at for at in (self.synced_at, self.failed_at) if at is not None]
+        if not attempts:
+            return True
+        return self.max_staleness is not None and time.time() - max(attempts) > self.max_staleness
+
+    def ensure_fresh(self):
+        """Sync the replica if its last sync is older than ``max_staleness``. If the sync fails,
+        the stored entities are served, unless no full sync of the replica ever completed.
+        """
+
+        if not self._is_stale():
+            return
+
+        with self._sync_lock:
+            # the replica may have been synced while waiting for the lock
+            if not self._is_stale():
+                return
+            try:
+                self._sync(None)
+            except Exception, e:
+                self.failed_syncs += 1
+                if not self.is_loaded():
+                    raise
+                self.failed_at = time.time()
+                log.warning("Unable to sync the %s replica, serving the stored entities: %s",
+                            self.collection, e)
+
+    def _entity(self, row):
+        return Entity(codecs.loads(row[0])) if row else None
+
+    def get(self, entity_id):
+        """Return an entity by uuid or name, or None.
+
+        :param entity_id: The uuid or the name of the entity.
+        """
+
+        self.ensure_fresh()
+        with self._lock:
+            row = self._db.execute('SELECT data FROM entities WHERE uuid = ? OR name = ? LIMIT 1',
+                                   (entity_id, entity_id)).fetchone()
+        return self._entity(row)
+
+    def find(self, **conditions):
+        """Return the entities whose properties equal the conditions (ie. ``find(role='admin')``).
+        A list property matches if one of its items is equal. The indexed properties are looked
+        up in the index, the others are compared on the candidates.
+        Returns a list of :class:`usergrid.entities.Entity`.
+
+        :param \*\*conditions: The values of the properties.
+        """
+
+        self.ensure_fresh()
+
+        indexed = []
+        others = []
+        for prop, value in sorted(conditions.iteritems()):
+            if prop in self.indexes and _index_values(value) == [value]:
+                indexed.append((prop, value))
+            else:
+                others.append((prop, value))
+
+        sql = 'SELECT data FROM entities'
+        args = []
+        for i, (prop, value) in enumerate(indexed):
+            sql += ' WHERE' if i == 0 else ' AND'
+            sql += ' uuid IN (SELECT uuid FROM indexes WHERE property = ? AND value = ?)'
+            args.extend((prop, value))
+
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+
+        entities = []
+        for row in rows:
+            entity = self._entity(row)
+            if all(self._matches(entity.get(prop), value) for prop, value in others):
+                entities.append(entity)
+        return entities
+
+    def _matches(self, actual, value):
+        if isinstance(actual, list) and not isinstance(value, list):
+            return value in actual
+        return actual == value
+
+    def all(self):
+        """Return all the entities of the replica.
+        Returns a list of :class:`usergrid.entities.Entity`.
+        """
+
+        return self.find()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM entities').fetchone()[0]
+
+    def stats(self):
+        """Return the state of the replica.
+        Returns a dictionary of the number of entities, the last seen ``modified`` timestamp, the
+        age of the replica in seconds and the number of syncs and failed syncs.
+        """
+
+        return {
+            'entities': len(self),
+            'last_seen': self.last_seen,
+            'age': self.age(),
+            'syncs': self.syncs,
+            'full_syncs': self.full_syncs,
+            'failed_syncs': self.failed_syncs,
+        }
+
+    def _run(self):
+        while not self._closed.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception, e:
+                log.warning("Unable to sync the %s replica: %s", self.collection, e)
+
+    def close(self):
+        """Stop the background thread and close the database."""
+
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
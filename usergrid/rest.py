@@ -8,17 +8,27 @@ This module contains the usergrid rest abstraction objects. It is used
 internally by ``usergrid.client`` and ``usergrid.session``.
 """
 
-import requests
-from requests.exceptions import RequestException
+import threading
+import time
+import urlparse
 
+from . import codecs, metrics
+from .cache import cache_key
+from .utils import LazyModule
 from .exceptions import (
     UsergridException,
     RESTError
 )
 
+# requests and its dependencies are imported by the first request, not by ``import usergrid``
+requests = LazyModule('requests')
+
 
 class RESTResponse(object):
     """A class that represents a Usergrid REST json response.
+
+    The body is decoded lazily, the first time ``data`` is accessed, with the codec of
+    ``usergrid.codecs``.
     """
 
     def __init__(self, response):
@@ -29,43 +39,394 @@ class RESTResponse(object):
 
         self.headers = response.headers
         self.status = response.status_code
-        self.data = response.json()
         self.encoding = response.encoding
-        self.data = response.json()
+        #: The ``requests.Response`` object, with its raw body.
+        self.http_response = response
+        self._response = response
+        self._data = None
+
+    @property
+    def data(self):
+        """The decoded JSON body of the response."""
+
+        response = self._response
+        if response is not None:
+            if metrics.hooks.listeners:
+                start = time.time()
+                self._data = codecs.loads(response.content)
+                metrics.hooks.emit('decode', duration=time.time() - start,
+                                   bytes_in=len(response.content))
+            else:
+                self._data = codecs.loads(response.content)
+            self._response = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._response = None
+
+    def iter_entities(self):
+        """Iterate over the entities of the response.
+        Returns an iterator of dictionaries.
+        """
+
+        return iter(self.data.get('entities', []))
+
+    def to_entities(self):
+        """Convert the entities of the response.
+        Returns a list of :class:`usergrid.entities.Entity`.
+        """
+
+        from .entities import Entity
+
+        return [Entity(entity) for entity in self.iter_entities()]
+
+    def to_entity_set(self):
+        """Convert the entities of the response into a columnar set.
+        Returns a :class:`usergrid.entities.EntitySet`.
+        """
+
+        from .entities import EntitySet
+
+        return EntitySet(self.iter_entities())
+
+
+class RESTStreamResponse(RESTResponse):
+    """A class that represents a streamed Usergrid REST json response.
+
+    The entities are decoded incrementally while the body is read: iterating over the response
+    yields them one at a time. The other properties of the response (ie. ``cursor``) are available
+    in ``metadata`` once all the entities were read.
+    """
+
+    #: The size of the chunks read from the connection.
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, response):
+        """Constructs a streamed REST Response.
+
+        :param response: The ``requests.Response`` object, made with ``stream=True``.
+        """
+
+        super(RESTStreamResponse, self).__init__(response)
+        from .streaming import EntityStreamParser
+
+        self._parser = EntityStreamParser(response.iter_content(self.CHUNK_SIZE))
+
+    @property
+    def metadata(self):
+        """The top-level properties of the response, except the entities."""
+        return self._parser.metadata
+
+    def iter_entities(self):
+        """Iterate over the entities of the response while they are read.
+        Returns an iterator of dictionaries.
+        """
+
+        if self._data is not None:
+            return iter(self._data.get('entities', []))
+        return iter(self)
+
+    def __iter__(self):
+        try:
+            for entity in self._parser:
+                yield entity
+        finally:
+            self.close()
+
+    @property
+    def data(self):
+        """The decoded JSON body of the response. Reading it consumes the whole stream."""
+
+        if self._data is None:
+            entities = list(self)
+            self._data = dict(self.metadata, entities=entities)
+        return self._data
+
+    def close(self):
+        """Release the connection of the response."""
+
+        if self._response is not None:
+            self._response.close()
+            self._response = None
 
 
 class RESTClientImpl(object):
     """This is the RESTClient implementation.
 
-    Currently this class is not really useful since we are simply using requests directly without
-    premature optimization. But it will be useful later with the use of ``requests.Session`` and/or
-    ``requests.Request`` for various configuration and optimization (ie connection-pooling).
+    The default implementation simply uses ``requests.request``, which opens a new connection for
+    every request. See :class:`PooledRESTClientImpl` for a connection-pooling implementation.
 
     """
 
-    def __init__(self):
+    def __init__(self, timeout=None,
+                 cache=None,
+                 retry=None,
+                 circuit_breaker=None,
+                 hedge=None,
+                 coalescer=None,
+                 limiter=None):
         """Initialize a RESTClientImpl instance.
+
+        :param timeout: (optional) The default timeout (in seconds) of the requests. Can be
+            overridden per request. Default to None (no timeout).
+        :param cache: (optional) A :class:`usergrid.cache.ResponseCache` caching the GET responses.
+            Default to None (no cache).
+        :param retry: (optional) A :class:`usergrid.retry.RetryPolicy` retrying the transient
+            failures. Default to None (no retry).
+        :param circuit_breaker: (optional) A :class:`usergrid.retry.CircuitBreaker` failing fast
+            when a host is down. Default to None.
+        :param hedge: (optional) A :class:`usergrid.hedging.HedgePolicy` duplicating the slow GET
+            requests. Default to None (no hedging).
+        :param coalescer: (optional) A :class:`usergrid.coalescing.RequestCoalescer` sharing the
+            concurrent identical GET requests. Default to None.
+        :param limiter: (optional) A :class:`usergrid.limiting.AdaptiveLimiter` or
+            :class:`usergrid.limiting.TokenBucket` limiting the requests in flight. Default to None.
         """
-        pass
+        self.timeout = timeout
+        self.cache = cache
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+        self.coalescer = coalescer
+        self.limiter = limiter
 
-    def request(self, method, url, **kwargs):
-        """Make a REST request.
+    def send(self, method, url, **kwargs):
+        """Send the http request over the wire.
+        Returns a ``requests.Response`` object.
 
         :param method: The http method of the request.
         :param url:  The url of the request.
         :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
         """
 
+        return requests.request(method, url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        if self.limiter is None:
+            return self._hedged_send(method, url, **kwargs)
+
+        ticket = self.limiter.acquire()
         try:
-            res = requests.request(method, url, **kwargs)
-        except RequestException, e:
-            raise UsergridException(str(e))
+            res = self._hedged_send(method, url, **kwargs)
+        except requests.exceptions.RequestException, e:
+            self.limiter.release(ticket, timeout=isinstance(e, requests.exceptions.Timeout))
+            raise
+        except Exception:
+            self.limiter.release(ticket)
+            raise
+        self.limiter.release(ticket, status=res.status_code)
+        return res
+
+    def _hedged_send(self, method, url, **kwargs):
+        if self.hedge is not None and method == 'GET':
+            return self.hedge.send(self.send, method, url, **kwargs)
+        return self.send(method, url, **kwargs)
+
+    def perform(self, method, url, **kwargs):
+        """Perform an http request, without checking its response. The transient failures are
+        retried according to the retry policy.
+        Returns a ``requests.Response`` object.
+
+        :param method: The http method of the request.
+        :param url:  The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        if self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+
+        if not metrics.hooks.listeners:
+            return self._perform(method, url, kwargs, [0])
+
+        retries = [0]
+        start = time.time()
+        fields = {
+            'method': method,
+            'url': cache_key(url)[0],
+            'bytes_out': metrics.body_size(kwargs.get('data')),
+        }
+
+        try:
+            res = self._perform(method, url, kwargs, retries)
+        except Exception, e:
+            metrics.hooks.emit('http', duration=time.time() - start, retries=retries[0], error=e,
+                               **fields)
+            raise
+
+        metrics.hooks.emit('http', duration=time.time() - start, retries=retries[0],
+                           status=res.status_code,
+                           bytes_in=int(res.headers.get('content-length') or 0),
+                           **fields)
+        return res
+
+    def _perform(self, method, url, kwargs, retries):
+        if self.retry is None and self.circuit_breaker is None:
+            try:
+                return self._send(method, url, **kwargs)
+            except requests.exceptions.RequestException, e:
+                raise UsergridException(str(e))
+
+        host = urlparse.urlsplit(url).netloc
+
+        while True:
+            attempt = retries[0]
+
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request(host)
+
+            try:
+                res = self._send(method, url, **kwargs)
+            except requests.exceptions.RequestException, e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure(host)
+                if self.retry is None or not self.retry.can_retry(method, attempt):
+                    raise UsergridException(str(e))
+                delay = self.retry.backoff(attempt)
+            except Exception:
+                # a local error (ie. a LimiterTimeoutError) tells nothing about the host
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.release(host)
+                raise
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(host, res)
+                if (self.retry is None or res.status_code not in self.retry.statuses
+                    or not self.retry.can_retry(method, attempt)):
+                    return res
+                delay = self.retry.delay(res, attempt)
+                if delay is None:
+                    return res
+                res.close()
+
+            self.retry.sleep(delay)
+            retries[0] += 1
+
+    def build_response(self, res, stream=False):
+        """Build the REST response of an http response.
+        Returns a :class:`RESTResponse`, or raises a :class:`usergrid.exceptions.RESTError` if the
+        request failed.
+
+        :param res: The ``requests.Response`` object.
+        :param stream: (optional) Whether to build a :class:`RESTStreamResponse`. Default to False.
+        """
 
         if res.status_code != 200:
-            raise RESTError(res.json())
+            try:
+                data = codecs.loads(res.content)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict) or 'error' not in data:
+                data = {'error': 'http_error',
+                        'error_description': '%d %s' % (res.status_code, res.reason)}
+            data.setdefault('error_description', data['error'])
+            raise RESTError(data, status=res.status_code)
+
+        if stream:
+            return RESTStreamResponse(res)
 
         return RESTResponse(res)
 
+    def request(self, method, url, **kwargs):
+        """Make a REST request.
+
+        :param method: The http method of the request.
+        :param url:  The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        if self.coalescer is not None and method == 'GET' and not kwargs.get('stream'):
+            key = self.coalescer.key(url, kwargs.get('headers'), kwargs.get('params'))
+            return self.coalescer.do(key, lambda: self._request(method, url, **kwargs),
+                                     share=lambda response: RESTResponse(response.http_response))
+
+        return self._request(method, url, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        if self.cache is not None:
+            return self.cache.request(self, method, url, **kwargs)
+
+        return self.build_response(self.perform(method, url, **kwargs),
+                                   stream=kwargs.get('stream', False))
+
+
+class PooledRESTClientImpl(RESTClientImpl):
+    """A RESTClient implementation that keeps the connections alive and reuses them.
+
+    All requests go through a shared ``requests.Session``, so the TCP and TLS handshakes are only
+    made once per pooled connection. The session is created lazily and can safely be shared by
+    many threads: the underlying ``urllib3`` pools are thread-safe.
+
+    """
+
+    def __init__(self, pool_connections=10,
+                 pool_maxsize=10,
+                 pool_block=False,
+                 keep_alive=True,
+                 **kwargs):
+        """Initialize a PooledRESTClientImpl instance.
+
+        :param pool_connections: (optional) The number of hosts to keep a pool for. Default to 10.
+        :param pool_maxsize: (optional) The maximum number of connections kept per host. Default to 10.
+        :param pool_block: (optional) Whether to wait for a free connection when the pool of a host
+            is full, instead of opening a throwaway one. Default to False.
+        :param keep_alive: (optional) Whether the connections are kept alive. Default to True.
+        :param \*\*kwargs: Optional arguments that :class:`RESTClientImpl` takes.
+        """
+
+        super(PooledRESTClientImpl, self).__init__(**kwargs)
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The shared ``requests.Session`` of the pool."""
+
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self.build_session()
+        return self._session
+
+    def build_session(self):
+        """Build the ``requests.Session`` used by the pool.
+        Returns a ``requests.Session`` object.
+        """
+
+        session = requests.Session()
+
+        for prefix in ('https://', 'http://'):
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_connections,
+                                                    pool_maxsize=self.pool_maxsize,
+                                                    pool_block=self.pool_block)
+            session.mount(prefix, adapter)
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def send(self, method, url, **kwargs):
+        """Send the http request using the shared session.
+        Returns a ``requests.Response`` object.
+        """
+
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        """Close all the pooled connections."""
+
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
 
 class RESTClient(object):
     """A class with all static methods to perform JSON REST requests. Used internally by the Usergrid
@@ -84,6 +445,17 @@ class RESTClient(object):
 
         return cls.IMPL.request('GET', url, **kwargs)
 
+    @classmethod
+    def stream(cls, url, **kwargs):
+        """Make a GET request and stream its entities.
+        Returns a :class:`RESTStreamResponse`.
+
+        :param url: The url of the request.
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return cls.IMPL.request('GET', url, stream=True, **kwargs)
+
     @classmethod
     def post(cls, url, data=None, **kwargs):
         """Make a POST request.
@@ -93,3 +465,50 @@ class RESTClient(object):
         :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
         """
         return cls.IMPL.request('POST', url, data=data, **kwargs)
+
+    @classmethod
+    def post_json(cls, url, payload, **kwargs):
+        """Make a POST request with a JSON body.
+
+        :param url: The url of the request.
+        :param payload: The object to send as JSON (ie. a list of entities).
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return cls.request_json('POST', url, payload, **kwargs)
+
+    @classmethod
+    def put_json(cls, url, payload, **kwargs):
+        """Make a PUT request with a JSON body.
+
+        :param url: The url of the request.
+        :param payload: The object to send as JSON (ie. the changed properties of an entity).
+        :param \*\*kwargs: Optional arguments that ``requests.request`` takes.
+        """
+
+        return cls.request_json('PUT', url, payload, **kwargs)
+
+    @classmethod
+    def request_json(cls, method, url, payload, **kwargs):
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['Content-Type'] = 'application/json'
+
+        return cls.IMPL.request(method, url, data=codecs.dumps(payload), headers=headers, **kwargs)
+
+    @classmethod
+    def using(cls, impl):
+        """Build a RESTClient class that performs its requests with a specific implementation.
+        Returns a subclass of this class. It can be passed as the ``rest_client`` of a
+        :class:`usergrid.clients.BaseClient`.
+
+        :param impl: A :class:`RESTClientImpl` object.
+        """
+
+        return type(cls.__name__, (cls,), {'IMPL': impl})
+
+
+class PooledRESTClient(RESTClient):
+    """A RESTClient that reuses keep-alive connections through a shared pool.
+    """
+
+    IMPL = PooledRESTClientImpl()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.retry
+~~~~~~~~~~~~~~
+
+This module contains the retry policy and the circuit breaker of the REST
+clients. They are enabled with the ``retry`` and ``circuit_breaker`` arguments
+of :class:`usergrid.rest.RESTClientImpl`.
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+from .exceptions import CircuitOpenError
+
+
+class RetryPolicy(object):
+    """A class that decides which requests are retried and when.
+
+    A request is retried on a connection error or a transient status (429, 502, 503 and 504), with
+    a jittered exponential backoff: the n-th retry waits a random time between 0 and
+    ``min(max_backoff, backoff_factor * 2 ** n)`` seconds. The ``Retry-After`` header of the server
+    takes precedence. Only the idempotent methods are retried, unless ``retry_post`` is set.
+
+    """
+
+    RETRY_STATUSES = frozenset([429, 502, 503, 504])
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+    def __init__(self, max_retries=3,
+                 backoff_factor=0.1,
+                 max_backoff=10,
+                 max_retry_after=60,
+                 retry_post=False,
+                 statuses=None):
+        """Construct a RetryPolicy.
+
+        :param max_retries: (optional) The maximum number of retries of a request. Default to 3.
+        :param backoff_factor: (optional) The base of the backoff, in seconds. Default to 0.1.
+        :param max_backoff: (optional) The maximum backoff, in seconds. Default to 10.
+        :param max_retry_after: (optional) The maximum ``Retry-After`` delay respected, in seconds.
+            Longer delays are not retried. Default to 60.
+        :param retry_post: (optional) Whether the POST requests are retried. Default to False.
+        :param statuses: (optional) The http statuses to retry. Default to ``RETRY_STATUSES``.
+        """
+
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_post = retry_post
+        self.statuses = frozenset(statuses) if statuses is not None else self.RETRY_STATUSES
+
+    def sleep(self, seconds):
+        """Wait before a retry."""
+        time.sleep(seconds)
+
+    def can_retry(self, method, attempt):
+        """Return whether a request can be retried.
+
+        :param method: The http method of the request.
+        :param attempt: The number of retries already made.
+        """
+
+        if attempt >= self.max_retries:
+            return False
+        return method in self.IDEMPOTENT_METHODS or (method == 'POST' and self.retry_post)
+
+    def backoff(self, attempt):
+        """Return the number of seconds to wait before a retry.
+
+        :param attempt: The number of retries already made.
+        """
+
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def retry_after(self, response):
+        """Return the delay requested by the ``Retry-After`` header of a response, in seconds.
+        Returns None if the response has no (valid) header.
+        """
+
+        value = response.headers.get('retry-after')
+        if not value:
+            return None
+
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
+        return max(email.utils.mktime_tz(date) - time.time(), 0)
+
+    def delay(self, response, attempt):
+        """Return the number of seconds to wait before retrying a response with a transient status.
+        Returns None if the request must not be retried.
+        """
+
+        retry_after = self.retry_after(response)
+        if retry_after is None:
+            return self.backoff(attempt)
+        if retry_after > self.max_retry_after:
+            return None
+        return retry_after
+
+
+class CircuitBreaker(object):
+    """A per-host circuit breaker.
+
+    After ``failure_threshold`` consecutive failures (connection errors, timeouts, 502, 503 or 504)
+    on a host, the circuit of the host opens: its requests fail immediately with a
+    :class:`usergrid.exceptions.CircuitOpenError` instead of waiting for a timeout. After
+    ``reset_timeout`` seconds, a single trial request is let through: the circuit closes if it
+    succeeds and opens again if it fails.
+
+    """
+
+    FAILURE_STATUSES = frozenset([502, 503, 504])
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """Construct a CircuitBreaker.
+
+        :param failure_threshold: (optional) The number of consecutive failures opening the circuit. Default to 5.
+        :param reset_timeout: (optional) The number of seconds before a trial request is let through. Default to 30.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def state(self, host):
+        """Return the state of the circuit of a host: 'closed', 'open' or 'half-open'."""
+
+        with self._lock:
+            return self._hosts.get(host, {}).get('state', self.CLOSED)
+
+    def before_request(self, host):
+        """Check that a request can be sent to a host.
+        Raises a :class:`usergrid.exceptions.CircuitOpenError` if the circuit is open.
+        """
+
+        with self._lock:
+            circuit = self._hosts.get(host)
+            if circuit is None or circuit['state'] == self.CLOSED:
+                return
+
+            if circuit['state'] == self.OPEN and time.time() >= circuit['opened_at'] + self.reset_timeout:
+                circuit['state'] = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError("The circuit of %s is open" % host)
+
+    def record_success(self, host):
+        """Record a successful request on a host, closing its circuit."""
+
+        with self._lock:
+            self._hosts.pop(host, None)
+
+    def record_failure(self, host):
+        """Record a failed request on a host, opening its circuit if needed."""
+
+        with self._lock:
+            circuit = self._hosts.setdefault(host, {'state': self.CLOSED, 'failures': 0})
+            circuit['failures'] += 1
+
+            if circuit['state'] == self.HALF_OPEN or circuit['failures'] >= self.failure_threshold:
+                circuit['state'] = self.OPEN
+                circuit['opened_at'] = time.time()
+
+    def release(self, host):
+        """Release the trial request of a host without recording its outcome, when it failed
+        before reaching the host (ie. a local error). The next request is a trial again.
+        """
+
+        with self._lock:
+            circuit = self._hosts.get(host)
+            if circuit is not None and circuit['state'] == self.HALF_OPEN:
+                # opened_at is unchanged, so the reset timeout is already over
+                circuit['state'] = self.OPEN
+
+    def record(self, host, response):
+        """Record the outcome of a request from its ``requests.Response``."""
+
+        if response.status_code in self.FAILURE_STATUSES:
+            self.record_failure(host)
+        else:
+            self.record_success(host)
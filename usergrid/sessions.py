@@ -9,31 +9,44 @@ authentication and communication are done with a usergrid server.
 """
 
 import re
+import time
 import urllib
 
-from .rest import RESTClient as rest
+from . import metrics
+from .rest import RESTClient
+from .tokens import TokenManager
 from .exceptions import (
     UsergridException,
     RESTError
 )
 
+SLASHES = re.compile(r'/+')
+
 class BaseSession(object):
     API_URL = 'api.usergrid.com'
     APP_NAME = 'sandbox'
 
     def __init__(self, org_name,
                  api_url=None,
-                 app_name=None):
+                 app_name=None,
+                 rest_client=None):
         """Initialize a BaseSession.
 
         :param org_name: the organization name of the session.
         :param api_url: (optional) the main url (host) of the usergrid server. Default to  'api.usergrid.com'.
+            The scheme defaults to https, use 'http://host:port' for a plain http server.
         "param app_name: (optional) the application name of the session. Default to 'sandbox'.
+        :param rest_client: (optional) the :class:`usergrid.rest.RESTClient` of the authentication
+            requests, and of the clients of the session unless they have their own. Default to
+            :class:`usergrid.rest.RESTClient`.
         """
+        self.rest_client = rest_client if rest_client is not None else RESTClient
         self.api_url = api_url if api_url else self.API_URL
         self.app_name = app_name if app_name else self.APP_NAME
         self.org_name = org_name
         self.token = None
+        self._url_prefix = None
+        self._url_cache = {}
 
     def is_linked(self):
         """Return whether the UsergridSession has an access token attached."""
@@ -43,6 +56,14 @@ class BaseSession(object):
         """Remove any attached access token from the UsergridSession."""
         self.token = None
 
+    def invalidate_token(self, token):
+        """Discard an access token rejected by the server.
+
+        :param token: the rejected token.
+        """
+        if self.token == token:
+            self.unlink()
+
     def build_path(self, target, params=None):
         """Build the url path components
         Returns the url path and parameters components.
@@ -58,6 +79,24 @@ class BaseSession(object):
         else:
             return "/%s" % target
 
+    @property
+    def url_prefix(self):
+        """The url prefix of the requests (ie. 'https://api.usergrid.com/org/app'). It is built once
+        and rebuilt only if the ``api_url``, ``org_name`` or ``app_name`` change.
+        """
+
+        key = (self.api_url, self.org_name, self.app_name)
+        if self._url_prefix is None or self._url_prefix[0] != key:
+            scheme, api_url = 'https', self.api_url
+            if '://' in api_url:
+                scheme, api_url = api_url.split('://', 1)
+
+            url = SLASHES.sub('/', '%s/%s/%s' % (api_url, self.org_name, self.app_name))
+            self._url_prefix = (key, '%s://%s' % (scheme, url.rstrip('/')))
+            self._url_cache = {}
+
+        return self._url_prefix[1]
+
     def build_url(self, target, params=None):
         """Build an API URL.
         Returns the url for a specific request.
@@ -66,15 +105,36 @@ class BaseSession(object):
         :param params: (optional) a dictionary or parameters.
         """
 
-        url = "%s/%s/%s%s" % (
-            self.api_url,
-            self.org_name,
-            self.app_name,
-            self.build_path(target, params)
-        )
+        if metrics.hooks.listeners:
+            start = time.time()
+            url = self._build_url(target, params)
+            metrics.hooks.emit('build_url', duration=time.time() - start)
+            return url
 
-        url = re.sub(r'/+', '/', url)
-        return 'https://%s' % url
+        return self._build_url(target, params)
+
+    URL_CACHE_SIZE = 256
+
+    def _build_url(self, target, params):
+        prefix = self.url_prefix
+
+        if not params:
+            url = self._url_cache.get(target)
+            if url is not None:
+                return url
+
+        # the encoded parameters never contain a slash, only the target needs normalizing
+        path = target.lstrip('/')
+        if '//' in path:
+            path = SLASHES.sub('/', path)
+        url = prefix + self.build_path(path, params)
+
+        if not params:
+            if len(self._url_cache) >= self.URL_CACHE_SIZE:
+                self._url_cache.clear()
+            self._url_cache[target] = url
+
+        return url
 
 class UsergridSession(BaseSession):
 
@@ -86,6 +146,10 @@ class UsergridSession(BaseSession):
                  username=None,
                  password=None,
                  is_secure=True,
+                 refresh_margin=60,
+                 background_refresh=True,
+                 token_store=None,
+                 token_placement='query',
                  **kwargs):
         """Initialize a Usergrid session.
 
@@ -98,8 +162,17 @@ class UsergridSession(BaseSession):
         :param username: (optional) username is needed for 'user' authentication.
         :param password: (optional) password is needed for 'user' authentication.
         :param is_secure: If your usergrid app is not secure and doesn't need any token, set this to ``False``.
+        :param refresh_margin: (optional) the number of seconds before its expiry at which the token is refreshed. Default to 60.
+        :param background_refresh: (optional) whether the token is refreshed in the background before it expires. Default to True.
+        :param token_store: (optional) a :class:`usergrid.tokens.TokenStore` sharing the token with the other sessions of the same principal.
+        :param token_placement: (optional) where the token is sent: 'query' (the ``token`` parameter) or 'header' (an ``Authorization: Bearer`` header, leaving the urls cacheable). Default to 'query'.
         """
 
+        self.tokens = TokenManager(self,
+                                   refresh_margin=refresh_margin,
+                                   background_refresh=background_refresh,
+                                   store=token_store)
+
         super(UsergridSession, self).__init__(org_name, **kwargs)
 
         if token and not isinstance(token, basestring):
@@ -107,6 +180,8 @@ class UsergridSession(BaseSession):
 
         assert auth_level in ['user', 'client', 'organization', 'admin'], \
             "expected auth_level of 'user', 'client', 'organization' or 'admin'"
+        assert token_placement in ['query', 'header'], \
+            "expected token_placement of 'query' or 'header'"
         self.token = token
         self.auth_level = auth_level
         self.client_id = client_id
@@ -114,12 +189,41 @@ class UsergridSession(BaseSession):
         self.username = username
         self.password = password
         self.is_secure = is_secure
+        self.token_placement = token_placement
+
+    def token_key(self):
+        """Return the key of the session token in a token store.
+        Returns a tuple of (api_url, org_name, app_name, auth_level, principal).
+        """
 
-    def set_token(self, token):
+        principal = self.username if self.auth_level == 'user' else self.client_id
+
+        return (self.api_url, self.org_name, self.app_name, self.auth_level, principal)
+
+    def set_token(self, token, expires_in=None):
         """Attach an access token to the Session.
+
+        :param token: the access token.
+        :param expires_in: (optional) the lifetime of the token in seconds, if known.
         """
 
         self.token = token
+        self.tokens.update(expires_in)
+
+    def unlink(self):
+        """Remove any attached access token from the UsergridSession."""
+
+        super(UsergridSession, self).unlink()
+        self.tokens.update(None)
+
+    def invalidate_token(self, token):
+        """Discard an access token rejected by the server. Nothing is done if another thread
+        already replaced it.
+
+        :param token: the rejected token.
+        """
+
+        self.tokens.invalidate(token)
 
     def read_token(self, response):
         """Read the access token from a ``usergrid.rest.RESTResponse`` and configure the session.
@@ -127,27 +231,47 @@ class UsergridSession(BaseSession):
 
         assert 'access_token' in response.data, "Cannot read the access token"
 
-        self.set_token(response.data['access_token'])
+        self.set_token(response.data['access_token'], response.data.get('expires_in'))
 
     def build_access_headers(self):
         """Build access headers for a future request.
-        Returns a tuple of (headers, params). (Only params are used for now)
+        Returns a tuple of (headers, params).
         """
 
-        if not self.is_linked():
-            self.authenticate()
+        self.tokens.ensure_token()
 
-        params = {'token': self.token}
+        if self.token_placement == 'header':
+            return {'Authorization': 'Bearer %s' % self.token}, {}
 
-        return {}, params
+        return {}, {'token': self.token}
 
-    def authenticate(self):
+    def authenticate(self, force=False):
         """Authenticate the session based on the auth_level defined.
+
+        :param force: (optional) whether to authenticate even if the session already has a valid token.
         """
 
-        if self.is_linked(): # already authenticated
+        if not force and self.tokens.is_valid(): # already authenticated
             return
 
+        self.request_token()
+
+    def request_token(self):
+        """Request a new access token from the server and attach it to the session.
+        """
+
+        if not metrics.hooks.listeners:
+            return self._request_token()
+
+        start = time.time()
+        try:
+            self._request_token()
+        except Exception, e:
+            metrics.hooks.emit('auth', duration=time.time() - start, error=e)
+            raise
+        metrics.hooks.emit('auth', duration=time.time() - start)
+
+    def _request_token(self):
         auth_func = None
 
         if self.auth_level == 'user':
@@ -178,7 +302,7 @@ class UsergridSession(BaseSession):
         }
 
         url = self.build_url('/token')
-        return rest.post(url, data=data)
+        return self.rest_client.post(url, data=data)
 
     def _client_credentials(self):
         """Link the session using client credentials"""
@@ -190,4 +314,4 @@ class UsergridSession(BaseSession):
         }
 
         url = self.build_url('/token')
-        return rest.post(url, data=data)
+        return self.rest_client.post(url, data=data)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.streaming
+~~~~~~~~~~~~~~~~~~
+
+This module contains the incremental decoding of the JSON responses. The
+entities of a response are decoded one at a time while the body is read,
+without buffering the whole body.
+"""
+
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# the characters changing the nesting of a value, outside of its strings
+STRUCTURE = re.compile(r'["{}\[\]]')
+# the end of a string, or an escaped character
+STRING_END = re.compile(r'["\\]')
+# the end of a number, true, false or null
+SCALAR_END = re.compile(r'[,:\]}\[{" \t\n\r]')
+
+
+class _ValueScanner(object):
+    """Find the end of a JSON value in consecutive pieces of text, tracking its nesting and its
+    strings between the pieces.
+    """
+
+    def __init__(self, first):
+        self.scalar = first not in '{["'
+        self.closing = []
+        self.in_string = False
+        self.skip = 0
+
+    def scan(self, text, pos):
+        """Scan a piece of text from ``pos``.
+        Returns the end of the value in the text, or None if the value continues after it.
+        """
+
+        if self.scalar:
+            match = SCALAR_END.search(text, pos)
+            return match.start() if match is not None else None
+
+        pos += self.skip
+        self.skip = 0
+        closing = self.closing
+
+        while True:
+            if self.in_string:
+                match = STRING_END.search(text, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                if match.group() == '\\':
+                    # skip the escaped character, which may be in the next piece
+                    if pos >= len(text):
+                        self.skip = pos + 1 - len(text)
+                        return None
+                    pos += 1
+                    continue
+                self.in_string = False
+                if not closing:
+                    return pos
+            else:
+                match = STRUCTURE.search(text, pos)
+                if match is None:
+                    return None
+                char = match.group()
+                pos = match.end()
+                if char == '"':
+                    self.in_string = True
+                elif char == '{':
+                    closing.append('}')
+                elif char == '[':
+                    closing.append(']')
+                elif not closing or closing.pop() != char:
+                    raise ValueError("Unexpected %r" % char)
+                elif not closing:
+                    return pos
+
+
+class EntityStreamParser(object):
+    """An incremental parser of a Usergrid JSON response.
+
+    Iterating over the parser yields the items of the ``entities`` array as soon as they are read.
+    The other top-level properties of the response (ie. ``cursor``) are available in ``metadata``
+    once the iteration is over. Only the item being decoded is kept in memory.
+
+    The end of each item is found by scanning every new chunk once, tracking the nesting and the
+    strings, and the item is decoded once complete: the parsing is linear in the size of the items
+    and an invalid item is reported as soon as it is read.
+
+    """
+
+    #: The size of the buffer after which the consumed data is dropped.
+    COMPACT_SIZE = 64 * 1024
+
+    #: The default maximum size of a single item.
+    MAX_VALUE_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, chunks, key='entities', max_value_size=None):
+        """Construct an EntityStreamParser.
+
+        :param chunks: An iterable of strings (ie. ``requests.Response.iter_content()``).
+        :param key: (optional) The top-level property to stream. Default to 'entities'.
+        :param max_value_size: (optional) The maximum size of a single item, in bytes. A larger
+            item raises a ValueError instead of being buffered. Default to ``MAX_VALUE_SIZE``.
+        """
+
+        self.chunks = iter(chunks)
+        self.key = key
+        self.max_value_size = max_value_size or self.MAX_VALUE_SIZE
+        self.metadata = {}
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _next_chunk(self):
+        if self._eof:
+            return None
+        for chunk in self.chunks:
+            if chunk:
+                return chunk
+        self._eof = True
+        return None
+
+    def _read(self):
+        """Read the next chunk. Returns False at the end of the stream."""
+
+        chunk = self._next_chunk()
+        if chunk is None:
+            return False
+        self._buf += chunk
+        return True
+
+    def _peek(self):
+        """Skip the whitespaces and return the next character ('' at the end of the stream)."""
+
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError("Expected %r at position %d, got %r" % (chars, self._pos, char))
+        self._pos += 1
+        return char
+
+    def _value_end(self, start):
+        """Find the end of the value starting at ``start``, reading more chunks until it is complete.
+        Each chunk is scanned once, and the chunks of the value are joined to the buffer once.
+        """
+
+        scanner = _ValueScanner(self._buf[start])
+        end = scanner.scan(self._buf, start)
+        if end is not None:
+            return end
+
+        base = len(self._buf)
+        chunks = []
+        read = 0
+        while True:
+            if base - start + read > self.max_value_size:
+                raise ValueError("The value at position %d exceeds %d bytes" % (start, self.max_value_size))
+
+            chunk = self._next_chunk()
+            if chunk is None:
+                self._buf += ''.join(chunks)
+                if scanner.scalar: # a number at the end of the stream
+                    return len(self._buf)
+                raise ValueError("Unterminated value at position %d" % start)
+
+            chunks.append(chunk)
+            end = scanner.scan(chunk, 0)
+            if end is not None:
+                self._buf += ''.join(chunks)
+                return base + read + end
+            read += len(chunk)
+
+    def _value(self):
+        """Decode the next JSON value, reading more chunks until it is complete."""
+
+        if self._pos > self.COMPACT_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        if not self._peek():
+            raise ValueError("Unexpected end of the stream at position %d" % self._pos)
+
+        end = self._value_end(self._pos)
+        value, decoded = self._decoder.raw_decode(self._buf, self._pos)
+        if decoded != end:
+            raise ValueError("Invalid value at position %d" % self._pos)
+
+        self._pos = end
+        return value
+
+    def __iter__(self):
+        self._expect('{')
+
+        if self._peek() == '}':
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+
+            if key == self.key and self._peek() == '[':
+                self._pos += 1
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+            else:
+                self.metadata[key] = self._value()
+
+            if self._expect(',}') == '}':
+                return
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.testing
+~~~~~~~~~~~~~~~~
+
+This module contains a local stand-in of a Usergrid server, for tests and
+benchmarks. It serves ``/token``, the collections CRUD, cursor paging, array
+POSTs, PUTs on the entities selected by a query, a subset of the ``ql`` queries
+and ``/events`` over plain http, with configurable latency and error injection.
+
+    >>> with UsergridStandIn(latency=0.002) as server:
+    ...     sess = UsergridSession('org_test', api_url=server.api_url, ...)
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+import urlparse
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class QueryError(ValueError):
+    """Raised for the ``ql`` queries the stand-in does not support."""
+
+
+QL = re.compile(r'^\s*select\s+\*\s*(?:where\s+(?P<where>.*?))?\s*'
+                r'(?:order\s+by\s+(?P<order>\w+)(?:\s+(?P<direction>asc|desc))?)?\s*$', re.I)
+CONDITION = re.compile(r'^\s*(\w+)\s*(=|>=|<=|>|<)\s*(.+?)\s*$')
+OPERATORS = {
+    '=': lambda a, b: a == b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+}
+
+
+def _literal(value):
+    if value[0] in '\'"' and value[-1] == value[0]:
+        return value[1:-1]
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _split(text, word):
+    """Split a condition on a keyword ('and' or 'or') outside of the parentheses and quotes."""
+
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for match in re.finditer(r'[()\'"]|\s+%s\s+' % word, text, flags=re.I):
+        token = match.group()
+        if quote:
+            if token == quote:
+                quote = None
+        elif token in '\'"':
+            quote = token
+        elif token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 0:
+            parts.append(text[start:match.start()])
+            start = match.end()
+    parts.append(text[start:])
+    return parts
+
+
+def _enclosed(text):
+    """Return whether a condition is wrapped in a single pair of parentheses."""
+
+    if not (text.startswith('(') and text.endswith(')')):
+        return False
+    depth = 0
+    for i, char in enumerate(text):
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if depth == 0 and i < len(text) - 1:
+            return False
+    return True
+
+
+def _condition(text):
+    text = text.strip()
+    while _enclosed(text):
+        text = text[1:-1].strip()
+
+    clauses = _split(text, 'or')
+    if len(clauses) > 1:
+        predicates = [_condition(clause) for clause in clauses]
+        return lambda entity: any(p(entity) for p in predicates)
+
+    conditions = _split(text, 'and')
+    if len(conditions) > 1:
+        predicates = [_condition(condition) for condition in conditions]
+        return lambda entity: all(p(entity) for p in predicates)
+
+    parsed = CONDITION.match(text)
+    if parsed is None:
+        raise QueryError("Unsupported condition: %s" % text)
+    name, op, value = parsed.groups()
+    op, value = OPERATORS[op], _literal(value)
+    return lambda entity: op(entity.get(name), value)
+
+
+def parse_query(ql):
+    """Parse a ``ql`` query: 'select * [where <conditions>] [order by <property> [asc|desc]]'.
+    The conditions compare a property to a literal with =, >, >=, < or <=, combined with 'and'
+    and 'or' ('and' binds tighter) and grouped with parentheses.
+    Returns a tuple of (filter function, order property, descending).
+    """
+
+    match = QL.match(ql or 'select *')
+    if match is None:
+        raise QueryError("Unsupported query: %s" % ql)
+
+    matches = lambda entity: True
+    if match.group('where'):
+        matches = _condition(match.group('where'))
+
+    descending = (match.group('direction') or '').lower() == 'desc'
+    return matches, match.group('order'), descending
+
+
+class UsergridStandIn(object):
+    """A local http server standing in for a Usergrid server.
+
+    All the organizations and applications share the same data. The entities are kept in memory,
+    per collection, in creation order. Any client credentials and user passwords are accepted.
+
+    """
+
+    def __init__(self, host='127.0.0.1',
+                 port=0,
+                 latency=0,
+                 jitter=0,
+                 error_rate=0,
+                 error_status=503,
+                 token_ttl=3600,
+                 require_token=True):
+        """Construct a UsergridStandIn.
+
+        :param host: (optional) The address to listen on. Default to '127.0.0.1'.
+        :param port: (optional) The port to listen on. Default to 0 (any free port).
+        :param latency: (optional) The delay added to every response, in seconds. Default to 0.
+        :param jitter: (optional) A random delay between 0 and ``jitter`` seconds added to every
+            response. Default to 0.
+        :param error_rate: (optional) The ratio of requests failing with ``error_status``. Default to 0.
+        :param error_status: (optional) The status of the injected errors. Default to 503.
+        :param token_ttl: (optional) The lifetime of the tokens, in seconds. Default to 3600.
+        :param require_token: (optional) Whether the requests need a valid token. Default to True.
+        """
+
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_ttl = token_ttl
+        self.require_token = require_token
+        self.collections = {}
+        self.tokens = {}
+        self.counters = {}
+        self.requests = 0
+        self.lock = threading.RLock()
+
+        self.server = _ThreadingHTTPServer((host, port), _Handler)
+        self.server.standin = self
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """The ``api_url`` of the sessions using the stand-in (ie. 'http://127.0.0.1:8080')."""
+
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """Serve the requests in a background thread."""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def issue_token(self):
+        """Issue a new access token.
+        Returns the token data of the response.
+        """
+
+        token = 'standin-%s' % uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_ttl
+        return {'access_token': token, 'expires_in': self.token_ttl}
+
+    def expire_tokens(self):
+        """Expire all the issued tokens."""
+
+        with self.lock:
+            for token in self.tokens:
+                self.tokens[token] = 0
+
+    def create(self, collection, properties):
+        """Create an entity.
+        Returns the created entity.
+        """
+
+        now = int(time.time() * 1000)
+        entity = dict(properties)
+        entity.setdefault('uuid', str(uuid.uuid1()))
+        entity['type'] = collection[:-1] if collection.endswith('s') else collection
+        entity.setdefault('created', now)
+        entity['modified'] = max(now, entity['created'])
+
+        with self.lock:
+            self.collections.setdefault(collection, []).append(entity)
+        return entity
+
+    def update(self, entity, properties):
+        """Update an entity. The properties set to null are removed.
+        Returns the updated entity.
+        """
+
+        with self.lock:
+            for key, value in properties.iteritems():
+                if key in ('uuid', 'type', 'created', 'modified'):
+                    continue
+                if value is None:
+                    entity.pop(key, None)
+                else:
+                    entity[key] = value
+            entity['modified'] = max(int(time.time() * 1000), entity['modified'] + 1)
+        return entity
+
+    def find(self, collection, entity_id):
+        """Return an entity by uuid or name, or None."""
+
+        with self.lock:
+            for entity in self.collections.get(collection, []):
+                if entity['uuid'] == entity_id or entity.get('name') == entity_id:
+                    return entity
+        return None
+
+    def query(self, collection, ql=None, limit=10, cursor=None):
+        """Run a query on a collection.
+        Returns a tuple of (entities, next cursor).
+        """
+
+        matches, order, descending = parse_query(ql)
+
+        with self.lock:
+            entities = [e for e in self.collections.get(collection, []) if matches(e)]
+
+        if order:
+            entities.sort(key=lambda e: e.get(order), reverse=descending)
+
+        start = int(base64.urlsafe_b64decode(str(cursor))) if cursor else 0
+        end = start + limit
+        next_cursor = base64.urlsafe_b64encode(str(end)) if end < len(entities) else None
+        return entities[start:end], next_cursor
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # buffer the status line, headers and body into a single write, the keep-alive connections
+    # would otherwise stall on the delayed acks of the small header packets
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def reply(self, status, data):
+        # the entities of the data are the stored ones: a concurrent update must not change them
+        # while they are serialized
+        with self.standin.lock:
+            body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, error, description):
+        self.reply(status, {'error': error, 'error_description': description})
+
+    def read_body(self):
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+
+        if 'json' in (self.headers.get('content-type') or ''):
+            return json.loads(body) if body else None
+        if body.lstrip().startswith(('{', '[')):
+            return json.loads(body)
+        return dict(urlparse.parse_qsl(body))
+
+    def valid_token(self, query):
+        token = query.get('token')
+        authorization = self.headers.get('authorization') or ''
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+
+        with self.standin.lock:
+            expires_at = self.standin.tokens.get(token)
+        if expires_at is None:
+            return 'unauthorized'
+        if expires_at < time.time():
+            return 'expired_token'
+        return None
+
+    def handle_request(self):
+        standin = self.standin
+        with standin.lock:
+            standin.requests += 1
+
+        delay = standin.latency + random.uniform(0, standin.jitter)
+        if delay:
+            time.sleep(delay)
+
+        parts = urlparse.urlsplit(self.path)
+        query = dict(urlparse.parse_qsl(parts.query))
+        body = self.read_body() if self.command in ('POST', 'PUT') else None
+
+        if standin.error_rate and random.random() < standin.error_rate:
+            return self.error(standin.error_status, 'service_unavailable', 'Injected error')
+
+        path = [p for p in parts.path.split('/') if p]
+        if len(path) < 3:
+            return self.error(404, 'not_found', 'Unknown path: %s' % parts.path)
+        path = path[2:]
+
+        if path == ['token'] and self.command == 'POST':
+            return self.reply(200, standin.issue_token())
+
+        if standin.require_token:
+            error = self.valid_token(query)
+            if error is not None:
+                return self.error(401, error, 'Invalid or expired access token')
+
+        collection = path[0]
+
+        if collection == 'events' and self.command == 'POST':
+            events = body if isinstance(body, list) else [body]
+            with standin.lock:
+                for event in events:
+                    for name, value in (event.get('counters') or {}).iteritems():
+                        standin.counters[name] = standin.counters.get(name, 0) + value
+            return self.reply(200, {'action': 'post', 'entities': events})
+
+        if len(path) == 1:
+            if self.command == 'GET':
+                try:
+                    entities, cursor = standin.query(collection, query.get('ql'),
+                                                     int(query.get('limit', 10)),
+                                                     query.get('cursor'))
+                except QueryError, e:
+                    return self.error(400, 'query_parse', str(e))
+                data = {'action': 'get', 'entities': entities, 'count': len(entities)}
+                if cursor:
+                    data['cursor'] = cursor
+                return self.reply(200, data)
+
+            if self.command == 'POST':
+                items = body if isinstance(body, list) else [body]
+                created = [standin.create(collection, item) for item in items]
+                return self.reply(200, {'action': 'post', 'entities': created})
+
+            if self.command == 'PUT' and query.get('ql'):
+                try:
+                    entities, cursor = standin.query(collection, query['ql'],
+                                                     int(query.get('limit', 10)))
+                except QueryError, e:
+                    return self.error(400, 'query_parse', str(e))
+                updated = [standin.update(entity, body) for entity in entities]
+                return self.reply(200, {'action': 'put', 'entities': updated})
+
+        if len(path) == 2:
+            entity = standin.find(collection, path[1])
+            if entity is None:
+                return self.error(404, 'service_resource_not_found', 'Entity not found: %s' % path[1])
+
+            if self.command == 'GET':
+                return self.reply(200, {'action': 'get', 'entities': [entity]})
+
+            if self.command == 'PUT':
+                return self.reply(200, {'action': 'put', 'entities': [standin.update(entity, body)]})
+
+            if self.command == 'DELETE':
+                with standin.lock:
+                    standin.collections[collection].remove(entity)
+                return self.reply(200, {'action': 'delete', 'entities': [entity]})
+
+        self.error(405, 'method_not_allowed', '%s %s' % (self.command, parts.path))
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
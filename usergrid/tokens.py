@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.tokens
+~~~~~~~~~~~~~~~
+
+This module contains the token manager and the token stores. The manager
+tracks the expiry of the access token of a session and coordinates its refresh
+between threads. The stores share the tokens between sessions and processes.
+"""
+
+import contextlib
+import errno
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover
+    fcntl = None
+
+from .exceptions import UsergridException
+from .utils import Future
+
+log = logging.getLogger(__name__)
+
+
+class TokenManager(object):
+    """A class that tracks the expiry of a session token and refreshes it.
+
+    Only one thread authenticates at a time: the other threads needing a token wait for it and
+    reuse the new token. When the token lifetime is known and the token enters its last
+    ``refresh_margin`` seconds, the next request starts a refresh in the background and keeps using
+    the current token, so the callers do not wait for it. After a failed refresh, the next one
+    starts ``REFRESH_RETRY_DELAY`` seconds later.
+
+    """
+
+    #: The number of seconds before its expiry at which a token is not used anymore.
+    EXPIRY_MARGIN = 5
+
+    #: The number of seconds between the background refreshes after a failure.
+    REFRESH_RETRY_DELAY = 10
+
+    def __init__(self, session, refresh_margin=60, background_refresh=True, store=None):
+        """Construct a TokenManager.
+
+        :param session: The :class:`usergrid.sessions.UsergridSession` owning the token.
+        :param refresh_margin: (optional) The number of seconds before the expiry at which the
+            token is refreshed. Default to 60.
+        :param background_refresh: (optional) Whether the token is refreshed in the background
+            before it expires. If False, it is refreshed once expired. Default to True.
+        :param store: (optional) A :class:`TokenStore` sharing the token with other sessions.
+        """
+
+        self.session = session
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.expires_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # serializes the authentications when no store locks them
+        self._auth_lock = threading.Lock()
+        self._refresh = None
+        self._next_refresh_at = None
+
+    def is_expired(self, now=None):
+        """Return whether the token is expired."""
+
+        if self.expires_at is None:
+            return False
+
+        now = time.time() if now is None else now
+        return now >= self.expires_at - self.EXPIRY_MARGIN
+
+    def needs_refresh(self, now=None):
+        """Return whether the token is in its refresh window."""
+
+        if self.expires_at is None:
+            return False
+
+        now = time.time() if now is None else now
+        return now >= self.expires_at - self.refresh_margin
+
+    def is_valid(self):
+        """Return whether the session has a token that is not expired."""
+        return self.session.is_linked() and not self.is_expired()
+
+    def update(self, expires_in=None):
+        """Record the lifetime of a new token and share it through the store.
+
+        :param expires_in: (optional) The lifetime of the token in seconds. None if unknown.
+        """
+
+        self.expires_at = None if expires_in is None else time.time() + expires_in
+
+        if self.store is not None and self.session.token:
+            self.store.set(self.session.token_key(), self.session.token, self.expires_at)
+
+    def load(self, fresh=False):
+        """Adopt the token of the store, if it is valid.
+        Returns whether a token was adopted.
+
+        :param fresh: (optional) Whether the token must also be out of its refresh window. Default to False.
+        """
+
+        if self.store is None:
+            return False
+
+        entry = self.store.get(self.session.token_key())
+        if entry is None:
+            return False
+
+        token, expires_at = entry
+        if token == self.session.token and expires_at == self.expires_at:
+            return False
+
+        if expires_at is not None:
+            margin = self.refresh_margin if fresh else self.EXPIRY_MARGIN
+            if time.time() >= expires_at - margin:
+                return False
+
+        self.expires_at = expires_at
+        self.session.token = token
+        return True
+
+    def _store_lock(self):
+        if self.store is None:
+            return self._auth_lock
+        return self.store.lock(self.session.token_key())
+
+    def ensure_token(self):
+        """Make sure the session has a valid token, authenticating if needed.
+        """
+
+        if self.is_valid():
+            if self.background_refresh and self.needs_refresh():
+                self.start_refresh()
+            return
+
+        with self._lock:
+            # another thread or process may have authenticated while we were waiting
+            if self.is_valid() or self.load():
+                return
+            with self._store_lock():
+                # a background refresh may have authenticated while we were waiting
+                if not self.is_valid() and not self.load():
+                    self.session.request_token()
+
+    def start_refresh(self):
+        """Start refreshing the token in the background, unless a refresh is already running.
+        It never waits: the callers keep using the current token meanwhile.
+        """
+
+        if self._next_refresh_at is not None and time.time() < self._next_refresh_at:
+            return
+        if not self._refresh_lock.acquire(False):
+            return
+        if not self.needs_refresh():
+            self._refresh_lock.release()
+            return
+        self._refresh = Future(self._background_refresh)
+
+    def _background_refresh(self):
+        try:
+            self._do_refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def refresh(self):
+        """Authenticate again while the current token is still in use.
+        Errors are logged: the token will be requested in the foreground once expired.
+        """
+
+        with self._refresh_lock:
+            self._do_refresh()
+
+    def _do_refresh(self):
+        # the refresh lock is held, but not the lock of the callers: they keep the current token
+        if not self.needs_refresh(): # already refreshed
+            return
+        try:
+            with self._store_lock():
+                if self.needs_refresh() and not self.load(fresh=True):
+                    self.session.request_token()
+        except UsergridException, e:
+            self._next_refresh_at = time.time() + self.REFRESH_RETRY_DELAY
+            log.warning("Unable to refresh the token: %s", e)
+        else:
+            self._next_refresh_at = None
+
+    def invalidate(self, token):
+        """Discard a token rejected by the server.
+        Nothing is done if the token was already replaced by another thread.
+
+        :param token: The rejected token.
+        """
+
+        with self._lock:
+            if self.store is not None:
+                self.store.delete(self.session.token_key(), token)
+            if self.session.token == token:
+                self.session.unlink()
+
+
+class TokenStore(object):
+    """The interface of the token stores. A store keeps one token, and its expiry, per key of
+    (api_url, org_name, app_name, auth_level, principal).
+    """
+
+    def get(self, key):
+        """Read the token of a key.
+        Returns a tuple of (token, expires_at) or None. ``expires_at`` is a unix timestamp or None.
+
+        :param key: The key of the token.
+        """
+        raise NotImplementedError
+
+    def set(self, key, token, expires_at=None):
+        """Write the token of a key.
+
+        :param key: The key of the token.
+        :param token: The access token.
+        :param expires_at: (optional) The unix timestamp of the expiry of the token.
+        """
+        raise NotImplementedError
+
+    def delete(self, key, token=None):
+        """Remove the token of a key.
+
+        :param key: The key of the token.
+        :param token: (optional) Only remove the stored token if it is this one.
+        """
+        raise NotImplementedError
+
+    def lock(self, key):
+        """Lock a key while a token is requested, so a single session authenticates.
+        Returns a context manager.
+
+        :param key: The key of the token.
+        """
+        raise NotImplementedError
+
+
+class MemoryTokenStore(TokenStore):
+    """A token store shared by the sessions of a process.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._tokens.get(key)
+
+    def set(self, key, token, expires_at=None):
+        self._tokens[key] = (token, expires_at)
+
+    def delete(self, key, token=None):
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and (token is None or entry[0] == token):
+                del self._tokens[key]
+
+    def lock(self, key):
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+
+class FileTokenStore(TokenStore):
+    """A token store shared by all the processes of a host (ie. pre-fork server workers).
+
+    Each token is kept in its own file, readable by the owner only, and replaced atomically.
+    Requesting a token is serialized between processes with an exclusive ``flock`` on a lock file.
+    The directory must be private: owned by the current user and inaccessible to the others.
+
+    """
+
+    #: The default directory of the token files.
+    PATH = os.path.join('~', '.usergrid', 'tokens')
+
+    def __init__(self, path=None):
+        """Construct a FileTokenStore.
+
+        :param path: (optional) The directory of the token files. It is created if needed. Default
+            to '~/.usergrid/tokens'.
+        """
+
+        self.path = path or os.path.expanduser(self.PATH)
+
+        try:
+            os.makedirs(self.path, 0700)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.check_directory()
+
+    def check_directory(self):
+        """Refuse a token directory that another user could read or write (ie. created by
+        another user in a shared directory).
+        """
+
+        st = os.lstat(self.path)
+        if not stat.S_ISDIR(st.st_mode):
+            raise UsergridException("The token directory is not a directory: %s" % self.path)
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            raise UsergridException("The token directory is owned by another user: %s" % self.path)
+        if stat.S_IMODE(st.st_mode) & 077:
+            raise UsergridException("The token directory is accessible to other users "
+                                    "(expected mode 0700): %s" % self.path)
+
+    def filename(self, key, suffix='.json'):
+        """Return the path of the file of a key."""
+
+        name = hashlib.sha1(json.dumps(list(key))).hexdigest()
+        return os.path.join(self.path, name + suffix)
+
+    def get(self, key):
+        try:
+            with open(self.filename(key)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        return entry['token'], entry['expires_at']
+
+    def set(self, key, token, expires_at=None):
+        filename = self.filename(key)
+        tmp = '%s.%d.%d' % (filename, os.getpid(), threading.current_thread().ident)
+
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'expires_at': expires_at}, f)
+
+        os.rename(tmp, filename)
+
+    def delete(self, key, token=None):
+        with self.lock(key):
+            entry = self.get(key)
+            if entry is not None and (token is None or entry[0] == token):
+                try:
+                    os.remove(self.filename(key))
+                except OSError:
+                    pass
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        fd = os.open(self.filename(key, '.lock'), os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+usergrid.utils
+~~~~~~~~~~~~~~
+
+This module contains small utilities used internally by the usergrid objects.
+"""
+
+import importlib
+import sys
+import threading
+
+
+class Future(object):
+    """The result of a function called in a background thread.
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        """Call a function in a background (daemon) thread.
+
+        :param func: The function to call.
+        :param \*args: The positional arguments of the function.
+        :param \*\*kwargs: The keyword arguments of the function.
+        """
+
+        self._value = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._value = func(*args, **kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+
+    def done(self):
+        """Return whether the function has returned."""
+        return not self._thread.is_alive()
+
+    def result(self):
+        """Wait for the function to return.
+        Returns the value returned by the function or raises its exception.
+        """
+
+        self._thread.join()
+
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+        return self._value
+
+
+def parallel_map(func, items, concurrency=4):
+    """Call a function on every item with at most ``concurrency`` threads.
+    Returns the list of results, in the same order as ``items``.
+
+    :param func: The function to call with each item.
+    :param items: A list of items.
+    :param concurrency: (optional) The number of threads. Default to 4.
+    """
+
+    items = list(items)
+    concurrency = min(concurrency, len(items))
+
+    if concurrency <= 1:
+        return [func(item) for item in items]
+
+    from multiprocessing.pool import ThreadPool
+
+    pool = ThreadPool(concurrency)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class LazyModule(object):
+    """A module imported on the first access to one of its attributes.
+
+        >>> requests = LazyModule('requests')
+        >>> requests.request('GET', url) # imports requests
+    """
+
+    def __init__(self, name):
+        """Construct a LazyModule.
+
+        :param name: The absolute name of the module (ie. 'requests.adapters').
+        """
+
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, name):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, name)
+
+    def __repr__(self):
+        return '<LazyModule [%s]>' % self.__name